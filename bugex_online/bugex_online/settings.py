@@ -107,6 +107,15 @@ MEDIA_ROOT = '{0}/uploads'.format(ROOT_PATH)
 # Examples: "http://media.lawrence.com/media/", "http://example.com/media/"
 MEDIA_URL = '/uploads/'
 
+# Upload handlers used for incoming files. Code archives are streamed to their
+# final location in MEDIA_ROOT and checked in a single pass, all other files
+# are handled by Django's default handlers.
+FILE_UPLOAD_HANDLERS = (
+    'bugex_webapp.upload_handlers.CodeArchiveUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+)
+
 # Absolute path to the directory static files should be collected to.
 # Don't put anything in this directory yourself; store your static files
 # in apps' "static/" subdirectories and in STATICFILES_DIRS.
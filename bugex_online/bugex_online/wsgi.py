@@ -34,6 +34,12 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "bugex_online.settings")
 from django.core.wsgi import get_wsgi_application
 application = get_wsgi_application()
 
+# recover the requests left unfinished by the previous server process
+from bugex_webapp.core_modules import core_config
+from bugex_webapp.core_modules.bugex_monitor import BugExMonitor
+if core_config.WORKER_MODE == 'EMBEDDED' and core_config.RECOVER_JOBS:
+    BugExMonitor.Instance().recover()
+
 # Apply WSGI middleware here.
 # from helloworld.wsgi import HelloWorldApplication
 # application = HelloWorldApplication(application)
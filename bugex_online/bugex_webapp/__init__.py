@@ -39,6 +39,7 @@ class UserRequestStatus(Enum):
     FAILED:     BugEx failed unexpectedly.
     FINISHED:   BugEx terminated sucessfully.
     DELETED:    The user deleted the results.
+    CANCELLED:  The user cancelled the request before BugEx finished.
 
     """
 
@@ -50,6 +51,22 @@ class UserRequestStatus(Enum):
     FAILED = 6
     FINISHED = 7
     DELETED = 8
+    CANCELLED = 9
+
+
+class BugExJobState(Enum):
+    """ Collection of possible states for BugExJobs
+
+    The possible values are:
+    QUEUED:     The request waits for an ingest worker or a BugEx slot.
+    RUNNING:    BugEx is running for the request.
+    DONE:       The request has reached a final status.
+
+    """
+
+    QUEUED = 1
+    RUNNING = 2
+    DONE = 3
 
 
 class XMLNode(Enum):
@@ -71,7 +88,8 @@ class Notifications(object):
         'PENDING': {
             'subject': 'Input files successfully received',
             'content': 'The input you\'ve submitted to BugEx Online has been ' +
-                       'successfully uploaded and is being processed.'
+                       'successfully uploaded and is being processed.\n' +
+                       'You can cancel the request here: {0}'
         },
         'INVALID': {
             'subject': 'Your request could not be processed',
@@ -91,6 +109,10 @@ class Notifications(object):
             'subject': 'Your BugEx result has been deleted',
             'content': 'You have successfully deleted your BugEx result files.'
         },
+        'CANCELLED': {
+            'subject': 'Your request has been cancelled',
+            'content': 'You have successfully cancelled your request.'
+        },
         'CHANGED_EMAIL_ADDRESS': {
             'subject': 'Your email address has been changed',
             'content': 'You have successfully changed your email address.\n' +
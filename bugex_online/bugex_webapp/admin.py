@@ -14,7 +14,9 @@ Authors: Amir Baradaran
 from django.contrib import admin
 
 from bugex_webapp.models import UserRequest, CodeArchive, TestCase, BugExResult
+from bugex_webapp.models import BugExJob
 from bugex_webapp.models import Fact, Folder, SourceFile, ClassFile, Line
+from bugex_webapp.models import SourceContent
 from bugex_webapp.models import MethodElement, FieldElement, ClassElement
 
 class UserRequestAdmin(admin.ModelAdmin):
@@ -27,7 +29,7 @@ class UserRequestAdmin(admin.ModelAdmin):
             'fields': ('test_case', 'user')
         }),
         ('Optional', {
-            'fields': ('result',)
+            'fields': ('result', 'archive_request')
         })
     )
     list_display = ('status', 'token', 'delete_token',
@@ -39,13 +41,27 @@ class UserRequestAdmin(admin.ModelAdmin):
 
 class CodeArchiveAdmin(admin.ModelAdmin):
     """The admin site configuration for the CodeArchive model."""
-    fields = ('archive_file', 'archive_format', 'user_request')
+    fields = ('archive_file', 'archive_format', 'content_hash', 'user_request',
+              'class_count', 'source_lines', 'content_size')
     list_display = ('archive_file', 'archive_format', 'user_request')
     list_display_links = ('archive_file',)
     list_filter = ('archive_format',)
     search_fields = ('archive_file',)
 
 
+class BugExJobAdmin(admin.ModelAdmin):
+    """The admin site configuration for the BugExJob model."""
+    fields = ('user_request', 'state', 'attempts', 'pid', 'host',
+              'started_at', 'deadline', 'updated_at', 'heartbeat_at',
+              'progress_at', 'run_time', 'cpu_time', 'max_rss',
+              'blocks_read', 'blocks_written')
+    list_display = ('user_request', 'state', 'attempts', 'pid', 'host',
+                    'deadline', 'heartbeat_at', 'run_time', 'cpu_time',
+                    'max_rss')
+    list_filter = ('state', 'host')
+    ordering = ('queued_at',)
+
+
 class TestCaseAdmin(admin.ModelAdmin):
     """The admin site configuration for the TestCase model."""
     fields = ('name',)
@@ -57,7 +73,7 @@ class TestCaseAdmin(admin.ModelAdmin):
 
 class BugExResultAdmin(admin.ModelAdmin):
     """The admin configuration for the BugExResult model."""
-    list_display = ('date',)
+    list_display = ('date', 'bugex_version')
     list_display_links = ('date',)
     ordering = ('date',)
     search_fields = ('date',)
@@ -123,6 +139,16 @@ class SourceFileAdmin(admin.ModelAdmin):
     search_fields = ('name', 'package')
 
 
+class SourceContentAdmin(admin.ModelAdmin):
+    """The admin configuration for the SourceContent model."""
+    fields = ('content_hash', 'references')
+    readonly_fields = ('content_hash', 'references')
+    list_display = ('content_hash', 'references')
+    list_display_links = ('content_hash',)
+    ordering = ('content_hash',)
+    search_fields = ('content_hash',)
+
+
 class ClassFileAdmin(admin.ModelAdmin):
     """The admin configuration for the ClassFile model."""
     fieldsets = (
@@ -226,11 +252,13 @@ class ClassElementAdmin(admin.ModelAdmin):
 
 admin.site.register(UserRequest, UserRequestAdmin)
 admin.site.register(CodeArchive, CodeArchiveAdmin)
+admin.site.register(BugExJob, BugExJobAdmin)
 admin.site.register(TestCase, TestCaseAdmin)
 admin.site.register(BugExResult, BugExResultAdmin)
 admin.site.register(Fact, FactAdmin)
 admin.site.register(Folder, FolderAdmin)
 admin.site.register(SourceFile, SourceFileAdmin)
+admin.site.register(SourceContent, SourceContentAdmin)
 admin.site.register(ClassFile, ClassFileAdmin)
 admin.site.register(Line, LineAdmin)
 admin.site.register(MethodElement, MethodElementAdmin)
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+"""
+Project: BugEx Online
+Authors: Amir Baradaran
+         Tim Krones
+         Frederik Leonhardt
+         Christos Monogios
+         Akmal Qodirov
+         Iliana Simova
+         Peter Stahl
+"""
+# stdlib
+import base64
+import sys
+import zlib
+from array import array
+
+
+class CompressedSource(object):
+    """
+    The content of a source file, stored as one compressed blob together with
+    the start offsets of all of its lines.
+
+    Both blob and offsets are base64 encoded strings, so they can be stored in
+    ordinary text columns. Single lines and line ranges are retrieved by
+    slicing the decompressed content, e.g.:
+
+    blob, offsets = CompressedSource.pack(['package de.mypackage;', ''])
+    source = CompressedSource(blob, offsets)
+    source.line(1)     # 'package de.mypackage;'
+
+    """
+
+    # type code of the offset array (unsigned int, at least 4 bytes)
+    OFFSET_TYPE = 'I'
+
+    def __init__(self, blob, offsets):
+        """
+        Arguments:
+
+        blob    -- the packed content, as returned by pack()
+        offsets -- the packed line offsets, as returned by pack()
+        """
+        self._content = zlib.decompress(base64.b64decode(blob))
+        self._offsets = CompressedSource._unpack_offsets(offsets)
+
+    @staticmethod
+    def pack(lines):
+        """
+        Packs the lines of a source file.
+
+        Returns a tuple of the packed content and the packed line offsets.
+
+        Arguments:
+        lines -- the lines of the file, without line breaks
+        """
+        lines = [line.encode('utf-8') if isinstance(line, unicode) else line
+                 for line in lines]
+
+        offsets = array(CompressedSource.OFFSET_TYPE)
+        position = 0
+        for line in lines:
+            offsets.append(position)
+            position += len(line) + 1
+
+        if sys.byteorder != 'little':
+            offsets.byteswap()
+
+        return (base64.b64encode(zlib.compress('\n'.join(lines))),
+                base64.b64encode(zlib.compress(offsets.tostring())))
+
+    @staticmethod
+    def _unpack_offsets(offsets):
+        """Returns the line offsets as array."""
+        result = array(CompressedSource.OFFSET_TYPE)
+        result.fromstring(zlib.decompress(base64.b64decode(offsets)))
+        if sys.byteorder != 'little':
+            result.byteswap()
+        return result
+
+    def __len__(self):
+        """Returns the number of lines."""
+        return len(self._offsets)
+
+    @property
+    def content(self):
+        """Returns the whole content, lines separated by line breaks."""
+        return self._decode(self._content)
+
+    def line(self, number):
+        """
+        Returns a single line.
+
+        Raises an IndexError, if there is no such line.
+
+        Arguments:
+        number -- the line number, starting at 1
+        """
+        if not 1 <= number <= len(self):
+            raise IndexError('No line {0}'.format(number))
+        return self.lines(number, number)[0]
+
+    def lines(self, first, last):
+        """
+        Returns a list of all lines from first to last (both inclusive).
+
+        Arguments:
+        first -- the number of the first line, starting at 1
+        last  -- the number of the last line
+        """
+        first = max(first, 1)
+        last = min(last, len(self))
+        if first > last:
+            return []
+
+        start = self._offsets[first - 1]
+        if last < len(self):
+            end = self._offsets[last] - 1
+        else:
+            end = len(self._content)
+        return self._decode(self._content[start:end]).split('\n')
+
+    def _decode(self, content):
+        return content.decode('utf-8', 'replace')
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+"""
+Project: BugEx Online
+Authors: Amir Baradaran
+         Tim Krones
+         Frederik Leonhardt
+         Christos Monogios
+         Akmal Qodirov
+         Iliana Simova
+         Peter Stahl
+"""
+# stdlib dependencies
+import re
+import signal
+
+# internal dependencies
+import core_config
+
+
+def signal_name(number):
+    """Returns the name of a signal, e.g. 'SIGKILL'."""
+    names = sorted(name for name, value in vars(signal).items()
+                   if name.startswith('SIG') and not name.startswith('SIG_')
+                   and value == number)
+    if names:
+        return names[0]
+    return 'signal {0}'.format(number)
+
+
+def classify_failure(status, log_tail, result_missing=False):
+    """
+    Classifies a failed BugEx run as transient (it may succeed, if BugEx is
+    run again later) or permanent.
+
+    A run is considered transient, if
+    - the process has been killed by one of core_config.TRANSIENT_SIGNALS,
+      e.g. by the out-of-memory killer,
+    - the end of its log matches one of core_config.TRANSIENT_LOG_PATTERNS,
+      e.g. because the disk was full, or one of
+      core_config.MEMORY_LOG_PATTERNS, because the JVM could not allocate
+      memory (only without core_config.MEMORY_LIMIT),
+    - it exited successfully, but did not write a result file.
+
+    Returns a tuple of a boolean, whether the failure is transient, and
+    the reason of the failure.
+
+    Arguments:
+    status         -- the exit code of the process, negative if it has been
+                      killed by a signal, None if unknown
+    log_tail       -- the end of the log of the process
+    result_missing -- whether the result file is missing
+    """
+    patterns = list(core_config.TRANSIENT_LOG_PATTERNS)
+    if core_config.MEMORY_LIMIT is None:
+        patterns += core_config.MEMORY_LOG_PATTERNS
+    for pattern in patterns:
+        match = re.search(pattern, log_tail)
+        if match:
+            return (True, 'BugEx failed with \'{0}\''.format(match.group(0)))
+
+    if status is not None and status < 0:
+        transient = [getattr(signal, name)
+                     for name in core_config.TRANSIENT_SIGNALS]
+        return (-status in transient,
+                'BugEx has been killed by {0}'.format(signal_name(-status)))
+
+    if status:
+        return (False,
+                'BugEx terminated unsuccessfully (status code {0})'.format(
+                status))
+
+    if result_missing:
+        return (True, 'Result file should exist, but does not')
+
+    return (False, 'BugEx failed for an unknown reason')
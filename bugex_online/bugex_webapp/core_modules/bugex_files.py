@@ -3,7 +3,14 @@ Created on 21.06.2012
 
 @author: Frederik Leonhardt <frederik.leonhardt@googlemail.com>
 '''
+import gzip
 import logging
+import os
+import shutil
+import struct
+import time
+from collections import deque
+from xml.etree.ElementTree import ParseError, XMLParser
 
 class BugExFile(object):
     """
@@ -18,14 +25,15 @@ class BugExFile(object):
         self.type = file_type
     
     def exists(self):
-        try:
-            with open(self.path, 'r') as f:
-                f.close()
+        if os.path.isfile(self.path):
             return True
-        except IOError as e:
-            logging.info("File does not exist: %s", self.path)
-            return False
+        logging.info("File does not exist: %s", self.path)
+        return False
     
+    def delete(self):
+        if os.path.isfile(self.path):
+            os.remove(self.path)
+
     def read(self):
         if not self.exists():
             raise Exception('File does not exist: %s', self.path)
@@ -52,4 +60,251 @@ class BugExResultFile(BugExFile):
         BugExFile.__init__(self, file_path, file_type="XML")
 
     def convert(self):
-        pass
\ No newline at end of file
+        pass
+
+class BugExLogFile(BugExFile):
+    """
+    This represents the log of a BugEx run, which may still be growing.
+
+    Parts of it are read from a byte offset, so the log is never read
+    completely, no matter how large it is. Logs that have been compressed
+    after the run (see BoundedLogWriter) are read transparently.
+
+    log = BugExLogFile(path)
+    data, size = log.read_from(offset, 64 * 1024, wait=30.0)
+
+    """
+
+    def __init__(self, file_path):
+        BugExFile.__init__(self, file_path, file_type="LOG")
+        self.compressed_path = file_path + '.gz'
+
+    def exists(self):
+        return (os.path.isfile(self.path) or
+                os.path.isfile(self.compressed_path))
+
+    def delete(self):
+        BugExFile.delete(self)
+        if os.path.isfile(self.compressed_path):
+            os.remove(self.compressed_path)
+
+    def size(self):
+        """
+        Returns the current (uncompressed) size of the log in bytes, 0 if it
+        is missing.
+        """
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            pass
+
+        # the uncompressed size is stored at the end of a gzip file
+        try:
+            with open(self.compressed_path, 'rb') as f:
+                f.seek(-4, os.SEEK_END)
+                return struct.unpack('<I', f.read(4))[0]
+        except (IOError, struct.error):
+            return 0
+
+    def read_from(self, offset, max_size, wait=0, interval=1.0):
+        """
+        Returns a tuple of at most `max_size` bytes of the log, starting at
+        `offset`, and the size of the log.
+
+        If there are no bytes after the offset yet, waits up to `wait`
+        seconds for the log to grow, checking every `interval` seconds.
+
+        Arguments:
+        offset   -- the byte offset to start at, reading starts at the
+                    beginning, if the log is shorter (e.g. it has been
+                    replaced)
+        max_size -- the maximum number of bytes returned
+        wait     -- the maximum number of seconds to wait for new bytes
+        interval -- the number of seconds between two checks
+        """
+        deadline = time.time() + wait
+        size = self.size()
+        while size == offset and time.time() < deadline:
+            time.sleep(min(interval, max(deadline - time.time(), 0)))
+            size = self.size()
+
+        if size < offset:
+            offset = 0
+        if size == offset:
+            return '', size
+
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                return f.read(max_size), size
+        except IOError:
+            pass
+
+        try:
+            log_file = gzip.open(self.compressed_path, 'rb')
+            try:
+                log_file.seek(offset)
+                return log_file.read(max_size), size
+            finally:
+                log_file.close()
+        except IOError:
+            return '', 0
+
+
+class BoundedLogWriter(object):
+    """
+    Writes the output of a BugEx run to its log, keeping the log size
+    bounded no matter how verbose BugEx is.
+
+    The first `max_size - tail_size` bytes are written to the log right
+    away, so the log can be followed while BugEx is running. Afterwards,
+    only the last `tail_size` bytes are kept in memory (a ring buffer of
+    chunks) and appended when the writer is closed, together with the number
+    of bytes omitted in between. If `compress` is True, the log is gzipped
+    when the writer is closed (see BugExLogFile).
+
+    with BoundedLogWriter(path, 10 * 1024 * 1024, 1024 * 1024) as log:
+        log.write(output)
+
+    """
+
+    def __init__(self, file_path, max_size, tail_size, compress=False):
+        self.path = file_path
+        self.compress = compress
+        self.omitted = 0        # number of bytes dropped from the middle
+        self._head_left = max(max_size - tail_size, 0)
+        self._tail_size = tail_size
+        self._tail = deque()    # chunks of the output after the head
+        self._tail_bytes = 0
+        self._file = open(file_path, 'wb')
+
+    def write(self, data):
+        """Writes a part of the output."""
+        if self._head_left > 0:
+            head = data[:self._head_left]
+            self._file.write(head)
+            self._file.flush()
+            self._head_left -= len(head)
+            data = data[len(head):]
+        if not data:
+            return
+
+        self._tail.append(data)
+        self._tail_bytes += len(data)
+        # drop chunks that are not needed for the tail anymore
+        while self._tail_bytes - len(self._tail[0]) >= self._tail_size:
+            dropped = self._tail.popleft()
+            self._tail_bytes -= len(dropped)
+            self.omitted += len(dropped)
+
+    def close(self):
+        """Writes the kept tail, closes and optionally compresses the log."""
+        if self._file.closed:
+            return
+        try:
+            tail = ''.join(self._tail)
+            if len(tail) > self._tail_size:
+                self.omitted += len(tail) - self._tail_size
+                tail = tail[-self._tail_size:] if self._tail_size else ''
+            if self.omitted:
+                self._file.write('\n[... {0} bytes omitted ...]\n'.format(
+                    self.omitted))
+            self._file.write(tail)
+            self._tail = deque()
+        finally:
+            self._file.close()
+
+        if self.compress:
+            with open(self.path, 'rb') as f:
+                compressed = gzip.open(self.path + '.gz', 'wb')
+                try:
+                    shutil.copyfileobj(f, compressed)
+                finally:
+                    compressed.close()
+            os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class _FactTarget(object):
+    """
+    Parser target (see xml.etree.ElementTree.XMLParser), which collects the
+    child texts of all completed <fact> elements as dicts.
+    """
+
+    def __init__(self):
+        self.facts = list()     # completed facts, collected by the follower
+        self._fact = None       # the fields of the current fact
+        self._text = list()
+
+    def start(self, tag, attributes):
+        if tag == 'fact':
+            self._fact = dict()
+        self._text = list()
+
+    def data(self, data):
+        self._text.append(data)
+
+    def end(self, tag):
+        if tag == 'fact':
+            self.facts.append(self._fact)
+            self._fact = None
+        elif self._fact is not None:
+            self._fact[tag] = ''.join(self._text)
+        self._text = list()
+
+    def close(self):
+        pass
+
+
+class ResultFileFollower(object):
+    """
+    Follows a BugEx result file while BugEx is still writing it.
+
+    Every call of poll() reads the bytes appended since the last call and
+    feeds them to an incremental XML parser, so every part of the file is
+    read and parsed only once. It returns the facts completed meanwhile.
+
+    follower = ResultFileFollower(result_file)
+    facts = follower.poll()     # e.g. [{'className': 'MyClass', ...}]
+
+    """
+
+    # number of bytes read at once
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, result_file):
+        self._result_file = result_file
+        self._offset = 0
+        self._target = _FactTarget()
+        self._parser = XMLParser(target=self._target)
+        self.broken = False     # whether the file could not be parsed
+
+    def poll(self):
+        """
+        Returns the facts that have been completed since the last call, as
+        dicts mapping the tags of the child elements to their texts.
+        """
+        if self.broken or not os.path.isfile(self._result_file.path):
+            return []
+
+        try:
+            with open(self._result_file.path, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell() < self._offset:
+                    raise IOError('The file has been truncated.')
+                f.seek(self._offset)
+                for chunk in iter(lambda: f.read(self.CHUNK_SIZE), ''):
+                    self._offset += len(chunk)
+                    self._parser.feed(chunk)
+        except (IOError, ParseError) as e:
+            logging.info("Can not follow '%s': %s", self._result_file.path, e)
+            self.broken = True
+
+        facts = self._target.facts
+        self._target.facts = list()
+        return facts
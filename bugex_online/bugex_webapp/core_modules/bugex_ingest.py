@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+
+"""
+Project: BugEx Online
+Authors: Amir Baradaran
+         Tim Krones
+         Frederik Leonhardt
+         Christos Monogios
+         Akmal Qodirov
+         Iliana Simova
+         Peter Stahl
+"""
+# stdlib
+import logging
+import os
+import posixpath
+import time
+from collections import defaultdict
+
+# django dependencies
+from django.db import transaction
+
+from bugex_webapp.models import Folder, SourceFile, ClassFile, Line
+from bugex_webapp.models import CodeArchive, SourceContent
+
+# internal dependencies
+import core_config
+
+
+class ArchiveIngest(object):
+    """
+    The ArchiveIngest stores the contents of a code archive to the database.
+
+    Folders, source files, class files and lines are collected in memory and
+    written with bulk_create() as soon as a batch is full. With the 'BLOB'
+    source storage (see core_config.SOURCE_STORAGE), source files reference
+    a shared SourceContent, with the 'LINES' storage their lines are stored
+    as separate rows. The whole archive
+    is stored in a single transaction, so either all records of an archive
+    end up in the database or none.
+
+    With incremental ingest (see core_config.INCREMENTAL_INGEST), the zip
+    entries are compared with the source files of the previous version of the
+    archive (see CodeArchive.previous_version()) by CRC-32 and size. Unchanged
+    source files reference the content stored for the previous version and
+    are not parsed again.
+
+    The number of class files, the number of source lines and the
+    uncompressed size of the archive are recorded with the code archive
+    (see RuntimePredictor).
+
+    ingest = ArchiveIngest(code_archive)
+    ingest.run(ZipFile(code_archive.path))
+
+    """
+
+    def __init__(self, code_archive, batch_size=None):
+        """
+        Arguments:
+
+        code_archive -- the CodeArchive to store the records for
+        batch_size   -- the number of rows written at once (defaults to
+                        core_config.INGEST_BATCH_SIZE)
+        """
+        self._code_archive = code_archive
+        self._batch_size = batch_size or core_config.INGEST_BATCH_SIZE
+        self._storage = core_config.SOURCE_STORAGE
+        self._incremental = (core_config.INCREMENTAL_INGEST and
+                             self._storage == 'BLOB')
+
+        self._folders = dict()          # folder path -> folder id
+        self._last_folder_id = 0        # highest folder id seen so far
+        self._last_source_file_id = 0   # highest source file id seen so far
+        self._source_files = list()     # pending (SourceFile, lines) tuples
+        self._pending_lines = 0
+        self._class_files = list()      # pending ClassFiles
+        self._previous = dict()         # path -> (crc, size, package,
+                                        #          source content id, lines)
+        self._reused = 0
+        self._rows = 0
+        self._class_count = 0
+        self._source_lines = 0
+
+        # logging
+        self._log = logging.getLogger(
+            'ingest-' + code_archive.user_request.token)
+
+    def run(self, archive):
+        """
+        Stores all folders, source files, class files and lines of the
+        given archive.
+
+        Returns the number of rows written.
+
+        Arguments:
+
+        archive -- the opened ZipFile of the code archive
+        """
+        start = time.time()
+        entries = archive.infolist()
+
+        with transaction.commit_on_success():
+            self._create_folders(entries)
+            if self._incremental:
+                self._load_previous_version()
+
+            seen = set()
+            content_size = 0
+            for info in entries:
+                if info.filename.endswith('/'):
+                    continue
+
+                path = self._entry_path(info)
+                if path in seen:
+                    # duplicate entry, the first one wins
+                    continue
+                seen.add(path)
+                content_size += info.file_size
+
+                folder_id = self._folders[posixpath.dirname(path)]
+                name = posixpath.basename(path)
+                ext = os.path.splitext(name)[1][1:].strip()
+                if ext == 'java':
+                    self._add_source_file(archive, info, path, name,
+                                          folder_id)
+                elif ext == 'class':
+                    self._add_class_file(info, name, folder_id)
+
+            self._flush_source_files()
+            self._flush_class_files()
+
+            self._code_archive.class_count = self._class_count
+            self._code_archive.source_lines = self._source_lines
+            self._code_archive.content_size = content_size
+            CodeArchive.objects.filter(
+                pk=self._code_archive.pk).update(
+                class_count=self._class_count,
+                source_lines=self._source_lines,
+                content_size=content_size)
+
+        if self._incremental:
+            self._log.info('Reused %s unchanged source files.', self._reused)
+        elapsed = max(time.time() - start, 0.001)
+        self._log.info('Stored %s rows in %.2f seconds (%.0f rows/sec).',
+                       self._rows, elapsed, self._rows / elapsed)
+        return self._rows
+
+    def _entry_path(self, info):
+        """
+        Returns the path of a zip entry as unicode string, without leading or
+        trailing slashes.
+        """
+        path = info.filename
+        if not isinstance(path, unicode):
+            path = path.decode('utf-8', 'replace')
+        return path.strip('/')
+
+    def _create_folders(self, entries):
+        """
+        Creates the root folder and all folders contained in the archive.
+
+        The folders are created level by level, because the ids of the parent
+        folders are needed for their children.
+        """
+        # collect all folder paths, including implicit ones
+        paths = set()
+        for info in entries:
+            path = self._entry_path(info)
+            if not info.filename.endswith('/'):
+                path = posixpath.dirname(path)
+            while path and path not in paths:
+                paths.add(path)
+                path = posixpath.dirname(path)
+
+        # ok, lets create the root folder
+        root_folder = Folder.objects.create(
+                # the name of the root folder does not really matter..
+                name = self._code_archive.archive_basename,
+                parent_folder = None,
+                code_archive = self._code_archive)
+        self._folders[''] = root_folder.id
+        self._last_folder_id = root_folder.id
+        self._rows += 1
+
+        levels = defaultdict(list)
+        for path in paths:
+            levels[path.count('/')].append(path)
+
+        for depth in sorted(levels):
+            pending = dict()
+            for path in levels[depth]:
+                parent_id = self._folders[posixpath.dirname(path)]
+                pending[(parent_id, posixpath.basename(path))] = path
+
+            self._bulk_create(Folder, [
+                Folder(name=name, parent_folder_id=parent_id,
+                       code_archive=self._code_archive)
+                for parent_id, name in pending])
+
+            # bulk_create() does not set ids, so look them up
+            created = Folder.objects.filter(
+                code_archive=self._code_archive, pk__gt=self._last_folder_id
+                ).values_list('id', 'parent_folder', 'name')
+            for folder_id, parent_id, name in created:
+                self._folders[pending[(parent_id, name)]] = folder_id
+                self._last_folder_id = max(self._last_folder_id, folder_id)
+
+    def _load_previous_version(self):
+        """
+        Collects the source files of the previous version of the archive
+        whose contents are still stored, keyed by their path.
+        """
+        previous = self._code_archive.previous_version()
+        if previous is None:
+            return
+
+        paths = dict()
+        folders = previous.folder_set.values_list('id', 'parent_folder', 'name')
+        children = defaultdict(list)
+        for folder_id, parent_id, name in folders:
+            children[parent_id].append((folder_id, name))
+        # the root folder has no parent and an empty path
+        pending = [(folder_id, u'') for folder_id, _ in children[None]]
+        while pending:
+            folder_id, path = pending.pop()
+            paths[folder_id] = path
+            pending.extend((child_id, posixpath.join(path, name))
+                           for child_id, name in children[folder_id])
+
+        source_files = previous.sourcefile_set.exclude(
+            source_content=None).exclude(crc=None).values_list(
+            'folder', 'name', 'crc', 'size', 'package', 'source_content',
+            'line_count')
+        source_files = list(source_files)
+        stored = SourceContent.lock(
+            [source_file[5] for source_file in source_files])
+        for (folder_id, name, crc, size, package, content_id,
+             lines) in source_files:
+            if folder_id in paths and content_id in stored:
+                path = posixpath.join(paths[folder_id], name)
+                self._previous[path] = (crc, size, package, content_id, lines)
+
+        self._log.info('Comparing with %s source files of %s.',
+                       len(self._previous), previous)
+
+    def _add_source_file(self, archive, info, path, name, folder_id):
+        """
+        Parses a source file entry and adds it to the current batch, unless
+        it is unchanged since the previous version of the archive.
+        """
+        previous = self._previous.get(path)
+        if previous is not None and previous[:2] == (info.CRC,
+                                                     info.file_size):
+            source_file = SourceFile(
+                code_archive=self._code_archive, name=name,
+                folder_id=folder_id, crc=info.CRC, size=info.file_size,
+                package=previous[2], source_content_id=previous[3],
+                line_count=previous[4])
+            # None marks a source file without lines to store
+            self._source_files.append((source_file, None))
+            self._reused += 1
+            self._source_lines += previous[4] or 0
+            if len(self._source_files) >= self._batch_size:
+                self._flush_source_files()
+            return
+
+        try:
+            source = archive.open(info)
+            try:
+                package, lines = SourceFile.parse(source)
+            finally:
+                source.close()
+        except Exception as e:
+            self._log.info('Could not parse %s: %s', info.filename, e)
+            return
+
+        source_file = SourceFile(code_archive=self._code_archive, name=name,
+                                 folder_id=folder_id, crc=info.CRC,
+                                 size=info.file_size, package=package,
+                                 line_count=len(lines))
+        self._source_files.append((source_file, lines))
+        self._pending_lines += len(lines)
+        self._source_lines += len(lines)
+
+        if (len(self._source_files) >= self._batch_size or
+                self._pending_lines >= self._batch_size):
+            self._flush_source_files()
+
+    def _add_class_file(self, info, name, folder_id):
+        """Adds a class file entry to the current batch."""
+        self._class_files.append(
+            ClassFile(code_archive=self._code_archive, name=name,
+                      folder_id=folder_id, crc=info.CRC,
+                      size=info.file_size))
+        self._class_count += 1
+
+        if len(self._class_files) >= self._batch_size:
+            self._flush_class_files()
+
+    def _flush_source_files(self):
+        """Writes the pending source files and afterwards their lines."""
+        if not self._source_files:
+            return
+
+        if self._storage == 'BLOB':
+            # the contents are shared, no Line rows to create
+            parsed = [(source_file, lines)
+                      for source_file, lines in self._source_files
+                      if lines is not None]
+            content_ids = SourceContent.acquire(
+                [lines for _, lines in parsed])
+            for (source_file, _), content_id in zip(parsed, content_ids):
+                source_file.source_content_id = content_id
+            SourceContent.reference(
+                [source_file.source_content_id
+                 for source_file, lines in self._source_files
+                 if lines is None])
+            self._bulk_create(SourceFile, [sf for sf, _ in self._source_files])
+            self._source_files = list()
+            self._pending_lines = 0
+            return
+
+        self._bulk_create(SourceFile, [sf for sf, _ in self._source_files])
+
+        # bulk_create() does not set ids, so look them up
+        created = SourceFile.objects.filter(
+            code_archive=self._code_archive, pk__gt=self._last_source_file_id
+            ).values_list('id', 'folder', 'name')
+        ids = dict()
+        for source_file_id, folder_id, name in created:
+            ids[(folder_id, name)] = source_file_id
+            self._last_source_file_id = max(
+                self._last_source_file_id, source_file_id)
+
+        lines = list()
+        for source_file, content in self._source_files:
+            source_file_id = ids[(source_file.folder_id, source_file.name)]
+            for number, line in enumerate(content, 1):
+                lines.append(Line(source_file_id=source_file_id,
+                                  number=number, content=line))
+        self._bulk_create(Line, lines)
+
+        self._source_files = list()
+        self._pending_lines = 0
+
+    def _flush_class_files(self):
+        """Writes the pending class files."""
+        self._bulk_create(ClassFile, self._class_files)
+        self._class_files = list()
+
+    def _bulk_create(self, model, objects):
+        """Writes a list of model objects with bulk_create(), batch by batch."""
+        for i in range(0, len(objects), self._batch_size):
+            model.objects.bulk_create(objects[i:i + self._batch_size])
+        self._rows += len(objects)
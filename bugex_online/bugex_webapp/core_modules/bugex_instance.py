@@ -4,18 +4,130 @@ Created on 21.06.2012
 @author: Frederik Leonhardt <frederik.leonhardt@googlemail.com>
 '''
 # stdlib
+import errno
+import hashlib
 import logging
+import signal
 import subprocess
 import os
 import shlex
+import threading
+import time
 from datetime import datetime
-
-# external dependencies
-#from py4j.java_gateway import JavaGateway
+from distutils.spawn import find_executable
 
 # internal dependencies
 import core_config
-from bugex_files import BugExFile, BugExResultFile
+from bugex_files import BoundedLogWriter, BugExFile, BugExLogFile
+from bugex_files import BugExResultFile
+from bugex_jvm import BugExServerPool
+from bugex_limits import process_setup
+from bugex_timer import TimerScheduler
+
+
+# cache of executable versions: path -> (size, modification time, version)
+_executable_versions = dict()
+
+
+def executable_version(executable):
+    """
+    Returns the version of a BugEx executable, i.e. the SHA-1 hash of its
+    content. Returns None, if the executable does not exist.
+
+    The hash is only computed again, if size or modification time of the
+    executable changed.
+
+    """
+    try:
+        stat = os.stat(executable)
+    except OSError:
+        return None
+
+    cached = _executable_versions.get(executable)
+    if cached is not None and cached[:2] == (stat.st_size, stat.st_mtime):
+        return cached[2]
+
+    version = hashlib.sha1()
+    with open(executable, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), ''):
+            version.update(chunk)
+    version = version.hexdigest()
+
+    _executable_versions[executable] = (stat.st_size, stat.st_mtime, version)
+    return version
+
+
+def process_alive(pid, token=None):
+    """
+    Checks whether a process with the given id is running.
+
+    If a token is given and the command line of the process is available
+    (/proc), it also checks that the process is the BugEx process of the
+    request with this token, since process ids are reused.
+
+    """
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        # the process exists, if we are only not allowed to signal it
+        return e.errno == errno.EPERM
+
+    cmdline = '/proc/{0}/cmdline'.format(pid)
+    if token is not None and os.path.exists(cmdline):
+        try:
+            with open(cmdline, 'r') as f:
+                return token in f.read()
+        except IOError:
+            return False
+    return True
+
+
+def process_cpu_time(pid):
+    """
+    Returns the CPU seconds (user and system) used so far by a process and
+    its reaped children, or None if unknown (no /proc or no such process).
+
+    """
+    try:
+        with open('/proc/{0}/stat'.format(pid), 'r') as f:
+            # the fields after the command name, which may contain spaces
+            fields = f.read().rsplit(')', 1)[1].split()
+    except (IOError, IndexError):
+        return None
+    # utime, stime, cutime and cstime, in clock ticks
+    ticks = sum(int(field) for field in fields[11:15])
+    return ticks / float(os.sysconf('SC_CLK_TCK'))
+
+
+def signal_process_group(pid, sig):
+    """
+    Sends a signal to the process group led by the given process, or only
+    to the process, if it does not lead a group (e.g. an adopted process
+    started before process groups were used).
+
+    Returns the id of the signaled group, or None.
+
+    """
+    try:
+        if os.getpgid(pid) == pid:
+            os.killpg(pid, sig)
+            return pid
+        os.kill(pid, sig)
+    except OSError:
+        # exited in the meantime
+        pass
+    return None
+
+
+def kill_process_group(group):
+    """
+    Kills what is left of a process group, ignoring groups that are gone.
+
+    """
+    try:
+        os.killpg(group, signal.SIGKILL)
+    except OSError:
+        pass
 
 
 class BugExInstance(object):
@@ -25,7 +137,7 @@ class BugExInstance(object):
     Stores information about a running BugEx process.
     Available implementations:
     - BugExProcessInstance (utilizes subprocess module)
-    - BugExJavaInstance (utilizes Py4J java gateway)
+    - BugExJavaInstance (utilizes a warm BugEx server JVM)
 
     '''
 
@@ -49,6 +161,7 @@ class BugExInstance(object):
                                 self._build_path(result_file_name))
         self.debug = False      # in debug mode, consider delay
         self._start_date = None # start with start() method
+        self.resource_usage = None  # set by wait(), if available
 
         # throw exception, if the user archive does not exist
         if not self._user_archive.exists():
@@ -61,10 +174,50 @@ class BugExInstance(object):
     def kill(self):
         raise Exception('This is an abstract class!')
 
+    def wait(self):
+        raise Exception('This is an abstract class!')
+
+    def adopt(self, pid):
+        raise Exception('This is an abstract class!')
+
+    @property
+    def pid(self):
+        raise Exception('This is an abstract class!')
+
     @property
     def status(self):
         raise Exception('This is an abstract class!')
 
+    @property
+    def cpu_time(self):
+        """
+        Returns the CPU seconds used by the BugEx process so far, or None if
+        unknown (see process_cpu_time).
+
+        """
+        return None
+
+    def log_tail(self, size):
+        """
+        Returns the last `size` bytes of the log of the BugEx process (an
+        empty string, if there is no log).
+
+        """
+        log_file = BugExLogFile(self._build_path('bugex.log'))
+        return log_file.read_from(max(log_file.size() - size, 0), size)[0]
+
+    def _open_log(self):
+        """
+        Creates the log of the BugEx process, bounded in size as configured
+        in core_config (see BoundedLogWriter).
+
+        """
+        log_file = BoundedLogWriter(
+            self._build_path('bugex.log'), core_config.LOG_MAX_SIZE,
+            core_config.LOG_END_SIZE, core_config.LOG_COMPRESS)
+        log_file.write("BugEx Process Log - "+self.name+"\n\n")
+        return log_file
+
     def _build_path(self, file_name):
         """
         Returns absolute path for a file in the working folder.
@@ -75,21 +228,141 @@ class BugExInstance(object):
 
 
 class BugExJavaInstance(BugExInstance):
-    '''
-    Representation of a BugEx instance via Py4J gateway.
+    """
+    Representation of a BugEx instance running in a warm JVM.
 
-    TODO: Not implemented yet.
-    '''
+    Instead of starting a JVM for every request, the request is submitted to
+    an idle BugEx server of the BugExServerPool (see bugex_jvm), which saves
+    the JVM startup and class loading. The constructor takes the same
+    arguments as the one of BugExProcessInstance.
 
-    def __init__(self):
-        '''
-        TODO: Not implemented yet.
-        '''
+    Since the JVM is shared by many requests, the instance has no process of
+    its own: it can neither be adopted after a restart nor does it have a
+    process id.
+
+    """
+
+    def __init__(self, bug_ex_executable, user_archive_path,
+                  failing_test_case_name, working_folder_path, token,
+                  artificial_delay = 0):
+
+        BugExInstance.__init__(
+            self, user_archive_path, failing_test_case_name,
+            working_folder_path, token, artificial_delay)
+
+        self.name = 'bugex-instance-'+self._token+'-jvm'
+
+        self._bug_ex_executable = bug_ex_executable
+        # the BugEx server running the request
+        self.__server = None
+        self.__status = None
+
+        # logging
+        self._log = logging.getLogger(self.name)
+
+        # done!
+        self._log.info('Created BugExJavaInstance \'%s\'', self.name)
+
+    def start(self):
+        """
+        Submits the request to a BugEx server.
+        """
+
+        self._start_date = datetime.now()
 
-        self.gateway = 'gateway-placeholder'
+        delay = self._artificial_delay if self.debug else 0
+        server = BugExServerPool.Instance().acquire(self._bug_ex_executable)
+        try:
+            server.submit(self._user_archive.path, self._failing_test_case,
+                          self._working_folder, delay)
+        except Exception:
+            BugExServerPool.Instance().release(server)
+            raise
+        self.__server = server
 
-        raise Exception('Not implemented yet.')
+    @property
+    def version(self):
+        """
+        Returns the version of the BugEx executable (see executable_version).
 
+        """
+        return executable_version(self._bug_ex_executable)
+
+    def kill(self):
+        """
+        Kills the BugEx server, unless the request is done already (or has
+        not been submitted). The server is replaced by the pool.
+
+        """
+
+        if self.__server is None:
+            # not submitted, e.g. because start() failed
+            return
+        if self.__status is None:
+            self.__server.stop(kill=True)
+
+    def wait(self):
+        """
+        Blocks until BugEx is done and returns its exit code. The server is
+        returned to the pool afterwards.
+
+        """
+
+        self.__run_check()
+        if self.__status is None:
+            with self._open_log() as log_file:
+                try:
+                    self.__status = self.__server.result(log_file)
+                finally:
+                    BugExServerPool.Instance().release(self.__server)
+
+        self._log.info("Exited after %s seconds: %s"
+                       , datetime.now() - self._start_date, self.__status)
+        return self.__status
+
+    @property
+    def status(self):
+        """
+        Returns -1, if BugEx has not finished yet, and its exit code otherwise.
+
+        """
+
+        self.__run_check()
+        if self.__status is None:
+            return -1
+        return self.__status
+
+    def adopt(self, pid):
+        raise Exception('Requests of a BugEx server can not be adopted.')
+
+    @property
+    def cpu_time(self):
+        """
+        Returns the CPU seconds used by the server JVM so far, which only
+        grow while it runs this request.
+
+        """
+        if self.__server is None:
+            return None
+        return process_cpu_time(self.__server.pid)
+
+    @property
+    def pid(self):
+        """
+        Returns None, the request has no process of its own.
+
+        """
+        return None
+
+    def __run_check(self):
+        """
+        Checks if the request has been submitted, raises Exception if not.
+
+        """
+
+        if self.__server is None:
+            raise Exception(
+                'You have to start the instance \'{}\' first!'.format(self.name))
 
 
 class BugExProcessInstance(BugExInstance):
@@ -121,6 +394,10 @@ class BugExProcessInstance(BugExInstance):
         self._bug_ex_executable = bug_ex_executable
         # process variable
         self.__process = None
+        # thread copying the output of the process to the log
+        self.__output_thread = None
+        # id of an adopted process, which is not a child of this process
+        self.__adopted_pid = None
 
         # logging
         self._log = logging.getLogger(self.name)
@@ -143,24 +420,139 @@ class BugExProcessInstance(BugExInstance):
         args = self.__build_args()
 
         # create log file
-        log_file = open(super(BugExProcessInstance,self)._build_path('bugex.log')
-                        , 'w')
-        log_file.write("BugEx Process Log - "+self.name+"\n\n")
+        log_file = self._open_log()
 
         #print self._user_archive.path
 
-        # run bugex
-        self.__process = subprocess.Popen(args, stdout=log_file, stderr=log_file)
+        # run bugex, its output is read through a pipe, so the size of the
+        # log can be bounded
+        try:
+            self.__process = subprocess.Popen(
+                args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                close_fds=True, preexec_fn=process_setup())
+        except Exception:
+            log_file.close()
+            raise
+
+        self.__output_thread = threading.Thread(
+            name=self.name+'-output', target=self.__copy_output,
+            args=(log_file,))
+        self.__output_thread.daemon = True
+        self.__output_thread.start()
+
+    def __copy_output(self, log_file):
+        """
+        Copies the output of the process to the log until the process (and
+        all of its children) closed it, then closes both.
+
+        """
+
+        output = self.__process.stdout
+        try:
+            while True:
+                try:
+                    data = os.read(output.fileno(), 64 * 1024)
+                except OSError as e:
+                    if e.errno == errno.EINTR:
+                        continue
+                    raise
+                if not data:
+                    break
+                log_file.write(data)
+        except Exception as e:
+            self._log.info('Could not copy the output: %s', e)
+        finally:
+            output.close()
+            log_file.close()
 
 
+    @property
+    def version(self):
+        """
+        Returns the version of the BugEx executable (see executable_version).
+
+        """
+        return executable_version(self._bug_ex_executable)
+
     def kill(self):
         """
-        Kills the current process.
+        Kills the current process together with all of its children, unless
+        it has exited already (or has not been started).
+
+        The process group is asked to terminate (SIGTERM) and killed
+        (SIGKILL) after core_config.KILL_GRACE_PERIOD seconds. The process
+        is reaped by wait().
+
+        """
+
+        if self.__adopted_pid is not None:
+            if not process_alive(self.__adopted_pid, self._token):
+                return
+            pid = self.__adopted_pid
+        elif self.__process is None:
+            # not started, e.g. because start() failed
+            return
+        elif self.__process.returncode is None:
+            pid = self.__process.pid
+        else:
+            return
+
+        group = signal_process_group(pid, signal.SIGTERM)
+        if group is not None:
+            TimerScheduler.Instance().schedule(
+                core_config.KILL_GRACE_PERIOD, kill_process_group, group)
+        elif self.__adopted_pid is not None:
+            # not a group leader, make sure it is still the same process
+            TimerScheduler.Instance().schedule(
+                core_config.KILL_GRACE_PERIOD, self.__kill_adopted)
+        self._log.info('Killing process %s.', pid)
+
+    def __kill_adopted(self):
+        """
+        Kills an adopted process that is not a group leader, if it is still
+        running.
+
+        """
+
+        if process_alive(self.__adopted_pid, self._token):
+            try:
+                os.kill(self.__adopted_pid, signal.SIGKILL)
+            except OSError:
+                # exited in the meantime
+                pass
+
+    def wait(self):
+        """
+        Blocks until the process exits and returns its exit code. The
+        resources used by the process are stored in resource_usage.
+
+        The exit code and resource usage of an adopted process are unknown,
+        None is returned instead.
 
         """
 
         self.__run_check()
-        self.__process.kill()
+        if self.__adopted_pid is not None:
+            # not our child, we can only check periodically
+            while process_alive(self.__adopted_pid, self._token):
+                time.sleep(core_config.ADOPT_CHECK_INTERVAL)
+            status = None
+        elif self.__process.returncode is not None:
+            # reaped already
+            status = self.__process.returncode
+        else:
+            status = self.__wait4()
+
+        if self.__output_thread is not None:
+            # the rest of the output, children may keep the pipe open until
+            # they are killed
+            self.__output_thread.join(core_config.KILL_GRACE_PERIOD)
+            if self.__output_thread.is_alive():
+                self._log.info('The output is still open.')
+
+        self._log.info("Exited after %s seconds: %s"
+                       , datetime.now() - self._start_date, status)
+        return status
 
 
     @property
@@ -168,12 +560,18 @@ class BugExProcessInstance(BugExInstance):
         """
         Retrieves exit code from the process.
 
-        Returns -1, if process has not finished yet.
+        Returns -1, if process has not finished yet, and None for adopted
+        processes that have finished (their exit code is unknown).
 
         """
 
         self.__run_check()
 
+        if self.__adopted_pid is not None:
+            if process_alive(self.__adopted_pid, self._token):
+                return -1
+            return None
+
         # get status from subprocess
         status = self.__process.poll()
 
@@ -186,13 +584,73 @@ class BugExProcessInstance(BugExInstance):
             return status
 
 
+    def adopt(self, pid):
+        """
+        Adopts a BugEx process that has been started by an earlier server
+        process, instead of starting a new one.
+
+        """
+
+        self._start_date = datetime.now()
+        self.__adopted_pid = pid
+        self._log.info('Adopted process %s.', pid)
+
+    @property
+    def pid(self):
+        """
+        Returns the process id of the BugEx process.
+
+        """
+
+        self.__run_check()
+        if self.__adopted_pid is not None:
+            return self.__adopted_pid
+        return self.__process.pid
+
+    @property
+    def cpu_time(self):
+        """
+        Returns the CPU seconds used by the BugEx process so far, or None if
+        unknown (see process_cpu_time).
+
+        """
+        return process_cpu_time(self.pid)
+
+    def __wait4(self):
+        """
+        Reaps the process with os.wait4(), which also returns its resource
+        usage, and returns the exit code like Popen.wait() does.
+
+        """
+
+        while True:
+            try:
+                _, exit_status, usage = os.wait4(self.__process.pid, 0)
+                break
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                if e.errno != errno.ECHILD:
+                    raise
+                # reaped by someone else
+                return self.__process.wait()
+
+        if os.WIFSIGNALED(exit_status):
+            status = -os.WTERMSIG(exit_status)
+        else:
+            status = os.WEXITSTATUS(exit_status)
+        # let the Popen object know, it must not wait for the process again
+        self.__process.returncode = status
+        self.resource_usage = usage
+        return status
+
     def __run_check(self):
         """
         Checks if current process is running, raises Exception if not.
 
         """
 
-        if self.__process is None:
+        if self.__process is None and self.__adopted_pid is None:
             raise Exception(
                 'You have to start the instance \'{}\' first!'.format(self.name))
 
@@ -207,6 +665,8 @@ class BugExProcessInstance(BugExInstance):
         java -jar <bug_ex_executable> <input_archive_path> <failing_test_case>
             <working_folder> (<artificial_delay>)
 
+        prefixed with `ionice -c <io_class>`, if configured and available.
+
         """
 
         args = 'java -jar "{0}" "{1}" "{2}" "{3}"'
@@ -222,4 +682,8 @@ class BugExProcessInstance(BugExInstance):
             args = args.format(
                 self._bug_ex_executable, self._user_archive.path,
                 self._failing_test_case, self._working_folder)
-        return shlex.split(args)
+        args = shlex.split(args)
+
+        if core_config.IO_CLASS is not None and find_executable('ionice'):
+            args = ['ionice', '-c', str(core_config.IO_CLASS)] + args
+        return args
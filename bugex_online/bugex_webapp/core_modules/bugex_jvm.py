@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+
+"""
+Project: BugEx Online
+Authors: Amir Baradaran
+         Tim Krones
+         Frederik Leonhardt
+         Christos Monogios
+         Akmal Qodirov
+         Iliana Simova
+         Peter Stahl
+"""
+# stdlib dependencies
+import logging
+import os
+import select
+import signal
+import subprocess
+import threading
+import time
+
+# internal dependencies
+import core_config
+from bugex_decorators import Singleton
+from bugex_limits import process_setup
+
+
+class BugExServerError(Exception):
+    """Raised if a BugEx server does not behave as expected."""
+    pass
+
+
+class BugExServer(object):
+    """
+    A long-lived BugEx JVM, which runs one request after the other.
+
+    The server is driven by a line protocol over its stdin and stdout (see
+    BugExServer.java): commands are written to stdin, their fields separated
+    by tabs, answers are read from stdout, where they are prefixed with
+    RESPONSE_PREFIX. All other output belongs to the current request.
+
+    server = BugExServer(executable)
+    server.submit(archive_path, test_case, working_folder, 0)
+    status = server.result(log_file)    # blocks until BugEx is done
+
+    """
+
+    RESPONSE_PREFIX = 'BUGEX-SERVER '
+
+    def __init__(self, executable):
+        """
+        Starts the JVM and waits until it is ready.
+
+        Arguments:
+
+        executable -- the BugEx executable (jar)
+        """
+        self.executable = executable
+        self.jobs = 0           # number of requests run so far
+        self.broken = False     # whether the server can not be used anymore
+        self._buffer = ''
+
+        self._process = subprocess.Popen(
+            ['java', '-cp', executable, core_config.JAVA_SERVER_CLASS],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT, close_fds=True,
+            preexec_fn=process_setup(cpu_time_limit=False))
+
+        # logging
+        self._log = logging.getLogger(
+            'bugex-server-{0}'.format(self._process.pid))
+
+        try:
+            if self._response(core_config.JAVA_SERVER_TIMEOUT) != 'READY':
+                raise BugExServerError('BugEx server did not start.')
+        except BugExServerError:
+            # do not leave a hanging JVM behind
+            self.stop(kill=True)
+            self._process.wait()
+            raise
+        self._log.info('Started BugEx server.')
+
+    @property
+    def pid(self):
+        """Returns the process id of the JVM."""
+        return self._process.pid
+
+    def ping(self, timeout):
+        """
+        Checks whether the server answers within the given number of seconds.
+        """
+        try:
+            self._send('PING')
+            return self._response(timeout) == 'PONG'
+        except (BugExServerError, IOError, OSError) as e:
+            self._log.info('Health check failed: %s', e)
+            self.broken = True
+            return False
+
+    def submit(self, archive_path, test_case, working_folder, delay):
+        """
+        Starts BugEx for a request. Does not wait for the result.
+        """
+        fields = [archive_path, test_case, working_folder, str(delay)]
+        for field in fields:
+            if '\t' in field or '\n' in field:
+                raise BugExServerError(
+                    'Can not submit {0!r} to a BugEx server.'.format(field))
+        self.jobs += 1
+        self._send('\t'.join(['RUN'] + fields))
+
+    def result(self, log_file):
+        """
+        Waits until BugEx is done with the submitted request and returns its
+        exit code. The output of BugEx is written to the given log file.
+
+        If the JVM dies meanwhile, e.g. because it has been killed, its exit
+        code is returned instead and the server is broken.
+        """
+        while True:
+            try:
+                line = self._read_line(None)
+            except BugExServerError:
+                self.broken = True
+                return self._process.wait()
+
+            if not line.startswith(self.RESPONSE_PREFIX):
+                log_file.write(line + '\n')
+                continue
+
+            response = line[len(self.RESPONSE_PREFIX):]
+            if response.startswith('DONE '):
+                return int(response[len('DONE '):])
+            self._log.info('Unexpected response: %s', response)
+
+    def stop(self, kill=False):
+        """
+        Stops the JVM, gracefully unless kill is True. A killed JVM takes
+        the processes it started along, as they are in its process group.
+        """
+        self.broken = True
+        if self._process.poll() is not None:
+            return
+        try:
+            if kill:
+                os.killpg(self._process.pid, signal.SIGKILL)
+            else:
+                self._send('QUIT')
+                self._process.stdin.close()
+        except (IOError, OSError):
+            # exited in the meantime
+            pass
+        self._log.info('Stopped BugEx server.')
+
+    def _send(self, command):
+        """Writes a command to the server."""
+        self._process.stdin.write(command + '\n')
+        self._process.stdin.flush()
+
+    def _response(self, timeout):
+        """
+        Returns the next answer of the server, skipping all other output.
+        """
+        deadline = time.time() + timeout
+        while True:
+            line = self._read_line(max(deadline - time.time(), 0))
+            if line.startswith(self.RESPONSE_PREFIX):
+                return line[len(self.RESPONSE_PREFIX):]
+
+    def _read_line(self, timeout):
+        """
+        Reads the next line of output, waiting at most `timeout` seconds
+        (forever if timeout is None).
+
+        Raises a BugExServerError on timeout or if the JVM has exited.
+        """
+        fd = self._process.stdout.fileno()
+        while '\n' not in self._buffer:
+            readable, _, _ = select.select([fd], [], [], timeout)
+            if not readable:
+                raise BugExServerError('BugEx server did not answer in time.')
+            data = os.read(fd, 4096)
+            if not data:
+                raise BugExServerError('BugEx server has exited.')
+            self._buffer += data
+        line, self._buffer = self._buffer.split('\n', 1)
+        return line.rstrip('\r')
+
+
+@Singleton
+class BugExServerPool(object):
+    """
+    The BugExServerPool keeps idle BugEx servers for reuse, so BugEx does not
+    need to start a JVM for every request.
+
+    Servers are health checked before they are handed out and replaced after
+    core_config.JAVA_SERVER_MAX_JOBS requests. There are never more servers
+    than requests running at the same time (see core_config.BUGEX_SLOTS).
+    It is a Singleton, retrieve an instance with:
+
+    pool = BugExServerPool.Instance()
+    server = pool.acquire(executable)
+    ...
+    pool.release(server)
+
+    """
+
+    def __init__(self):
+        """
+        Only to be called by Instance()
+
+        """
+        self.__idle = list()
+        self.__lock = threading.Lock()
+
+        # logging
+        self.__log = logging.getLogger('BugExServerPool')
+
+    def acquire(self, executable):
+        """
+        Returns a healthy idle server for the given executable, or starts a
+        new one.
+        """
+        while True:
+            server = None
+            with self.__lock:
+                for idle_server in self.__idle:
+                    if idle_server.executable == executable:
+                        server = idle_server
+                        self.__idle.remove(server)
+                        break
+
+            if server is None:
+                return BugExServer(executable)
+            if server.ping(core_config.JAVA_SERVER_TIMEOUT):
+                return server
+            self.__log.info('Replacing unhealthy server %s.', server.pid)
+            server.stop(kill=True)
+
+    def release(self, server):
+        """
+        Returns a server to the pool after a request, or stops it if it is
+        broken or has run enough requests.
+        """
+        if server.broken or server.jobs >= core_config.JAVA_SERVER_MAX_JOBS:
+            server.stop(kill=server.broken)
+            return
+        with self.__lock:
+            self.__idle.append(server)
+
+    def shutdown(self):
+        """Stops all idle servers."""
+        with self.__lock:
+            idle = self.__idle
+            self.__idle = list()
+        for server in idle:
+            server.stop()
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+"""
+Project: BugEx Online
+Authors: Amir Baradaran
+         Tim Krones
+         Frederik Leonhardt
+         Christos Monogios
+         Akmal Qodirov
+         Iliana Simova
+         Peter Stahl
+"""
+# stdlib dependencies
+import functools
+import os
+import resource
+
+# internal dependencies
+import core_config
+
+
+def process_setup(cpu_time_limit=True):
+    """
+    Returns the preexec_fn for starting BugEx processes and BugEx servers
+    with subprocess.Popen: it starts a new process group, so the process can
+    be killed together with all of its children, and applies the resource
+    limits and the niceness configured in core_config.
+
+    The CPU time limit is skipped if cpu_time_limit is False: it counts the
+    whole life of a process, so it would kill a server that has run many
+    requests.
+
+    """
+    limits = [(resource.RLIMIT_AS, core_config.MEMORY_LIMIT),
+              (resource.RLIMIT_FSIZE, core_config.FILE_SIZE_LIMIT)]
+    if cpu_time_limit:
+        limits.append((resource.RLIMIT_CPU, core_config.CPU_TIME_LIMIT))
+    limits = [(limit, (value, value)) for limit, value in limits
+              if value is not None]
+    return functools.partial(prepare_process, limits, core_config.NICENESS)
+
+
+def prepare_process(limits, niceness):
+    """
+    Executed in the child between fork() and exec(), see process_setup().
+
+    """
+    # The monitor forks while other threads run. The child only gets the
+    # forking thread, so a lock held by another thread at that moment (the
+    # logging locks, the import lock, ...) stays locked forever. Everything
+    # is therefore computed by the parent, and only plain system calls are
+    # made here: no logging, no locks, no imports, no configuration.
+    os.setsid()
+    for limit, values in limits:
+        resource.setrlimit(limit, values)
+    if niceness:
+        os.nice(niceness)
@@ -5,24 +5,56 @@ Created on 19.06.2012
 '''
 # stdlib dependencies
 import logging
+from fnmatch import fnmatchcase
+import signal
+import socket
 import sys, traceback
-from datetime import datetime
+import threading
+import time
+from datetime import datetime, timedelta
 
 # django dependencies
-from bugex_webapp import UserRequestStatus
+from bugex_webapp import BugExJobState, UserRequestStatus
 
 # internal dependencies
 import core_config
 from bugex_decorators import Singleton
-from bugex_timer import PeriodicTask
-from bugex_instance import BugExProcessInstance
+from bugex_failure import classify_failure
+from bugex_files import ResultFileFollower
+from bugex_instance import BugExJavaInstance, BugExProcessInstance
+from bugex_instance import process_alive, signal_process_group
+from bugex_jvm import BugExServerPool
+from bugex_pool import PriorityWorkerPool, WorkerPool
+from bugex_predictor import RuntimePredictor
+from bugex_timer import TimerScheduler
+
+
+def max_life_time(test_case_name):
+    """
+    Returns the maximum life time in seconds of a BugEx process for the
+    given test case (see core_config.TEST_CASE_LIFE_TIMES).
+
+    """
+    for pattern, life_time in core_config.TEST_CASE_LIFE_TIMES:
+        if fnmatchcase(test_case_name, pattern):
+            return life_time
+    return core_config.MAX_LIFE_TIME
+
 
 @Singleton
 class BugExMonitor(object):
     """
     The BugExMonitor needs to be notified upon a new user request.
 
-    It will start the BugEx process and monitor the result file.
+    Uploaded archives are queued for a bounded pool of ingest workers, BugEx
+    jobs for a separate bounded pool of BugEx slots (see core_config), so
+    there are never more BugEx processes running than there are slots.
+    Queued BugEx jobs get a free slot in the order of the scheduling policy,
+    e.g. shortest estimated run time first.
+
+    It will start the BugEx process and monitor the result file. Requests for
+    the same archive content and test case as a job that is still running are
+    attached to that job instead of starting BugEx a second time.
     It is a Singleton, retrieve an instance with:
 
     bug_mon = BugExMonitor.Instance()
@@ -38,44 +70,142 @@ class BugExMonitor(object):
         """
         # init file job list
         self.__monitor_jobs = list()
+        # running jobs by (archive content hash, test case name)
+        self.__jobs_by_key = dict()
+        self.__lock = threading.Lock()
+
+        # worker pools
+        self.__ingest_workers = WorkerPool(
+            'ingest', core_config.INGEST_WORKERS)
+        self.__bugex_slots = PriorityWorkerPool(
+            'bugex', core_config.BUGEX_SLOTS)
+        self.__partial_workers = WorkerPool(
+            'partial', core_config.PARTIAL_WORKERS)
+        self.__housekeeping = WorkerPool(
+            'housekeeping', core_config.HOUSEKEEPING_WORKERS)
+        self.__queued = set()   # housekeeping functions waiting in the queue
+
+        # requests may be cancelled by other processes (see cancel_request())
+        TimerScheduler.Instance().schedule_periodic(
+            core_config.CANCEL_CHECK_INTERVAL, self.__queue_housekeeping,
+            self.__check_cancelled)
+        # jobs may stall without exiting (see reap_stalled())
+        TimerScheduler.Instance().schedule_periodic(
+            core_config.REAPER_INTERVAL, self.__queue_housekeeping,
+            self.reap_stalled)
 
         # logging
         self.__log = logging.getLogger("BugExMonitor")
         self.__log.info('BugExMonitor created.')
 
-    def __create_job(self, user_request):
+    def __create_job(self, user_request, pid=None):
         """
         For internal use only. This method takes care of initializing a task
-        with all necessary data.
+        with all necessary data. The job is not queued yet (see
+        __queue_job()), since creating it reads the database, which must not
+        happen while the lock of the monitor is held.
+
+        Adopted processes (see resume()) are always plain processes.
 
         """
         # get output path
         request_path = user_request.folder
 
         # gather necessary data
-        user_archive_path = user_request.codearchive.path
+        user_archive_path = user_request.code_archive.path
         failing_test_case = user_request.test_case
         token = user_request.token
 
         # get config options
         bugex_executable = core_config.EXECUTABLE
         bugex_debug = core_config.DEBUG
-        bugex_interval = core_config.CHECK_INTERVAL
         bugex_delay = core_config.ARTIFICIAL_DELAY
 
-        # create instance
-        bugex_instance = BugExProcessInstance(
+        # create instance, adopted processes are always plain processes
+        if core_config.INSTANCE_TYPE == 'JAVA' and pid is None:
+            instance_class = BugExJavaInstance
+        else:
+            instance_class = BugExProcessInstance
+        bugex_instance = instance_class(
             bugex_executable, user_archive_path, failing_test_case,
             request_path, token, bugex_delay)
 
         bugex_instance.debug = bugex_debug
 
         # create job
-        job = BugExMonitorJob(bugex_instance, user_request)
-        job.schedule(bugex_interval)
+        return BugExMonitorJob(bugex_instance, user_request)
 
+    def __queue_job(self, job, priority, pid=None, life_time=None):
+        """
+        For internal use only. Queues a job created by __create_job() for a
+        BugEx slot with the given priority (see __priority()). The lock of
+        the monitor needs to be acquired.
+
+        If a process id is given, the job adopts the running BugEx process
+        instead of starting a new one.
+
+        """
         # store reference to job
-        #self.__monitor_jobs.append(job)
+        self.__monitor_jobs.append(job)
+
+        # wait for a free BugEx slot
+        self.__bugex_slots.submit(priority, job.run, pid, life_time)
+
+    def __priority(self, user_request, pid=None):
+        """
+        Returns the priority of a job in the queue of the BugEx slots, lower
+        values run first (see core_config.SCHEDULING_POLICY). The estimate
+        may fit the RuntimePredictor to the database, so the lock of the
+        monitor must not be held.
+
+        With the 'SJF' policy, this is the estimated run time, reduced by
+        core_config.SJF_AGEING seconds for every second the job waits. Since
+        all queued jobs age at the same rate, their order only depends on
+        the estimate and the time they have been queued.
+
+        """
+        if pid is not None:
+            # adopted processes are running already
+            return float('-inf')
+        now = time.time()
+        if core_config.SCHEDULING_POLICY != 'SJF':
+            return now
+
+        estimate = RuntimePredictor.Instance().predict(
+            user_request.code_archive)
+        self.__log.info('Estimated run time of request %s: %.1f seconds.',
+                        user_request.token, estimate)
+        return estimate + core_config.SJF_AGEING * now
+
+    def __queue_housekeeping(self, function):
+        """
+        Queues a housekeeping function for the housekeeping workers, unless
+        it is still waiting in the queue. Called by the TimerScheduler, whose
+        timers must return quickly.
+
+        """
+        with self.__lock:
+            if function in self.__queued:
+                return
+            self.__queued.add(function)
+        self.__housekeeping.submit(self.__housekeep, function)
+
+    def __housekeep(self, function):
+        """Executes a function queued by __queue_housekeeping()."""
+        with self.__lock:
+            self.__queued.discard(function)
+        function()
+
+    def __job_key(self, user_request):
+        """
+        Returns the key identifying identical requests, or None if the
+        request can not be matched with others.
+
+        """
+        content_hash = user_request.code_archive.content_hash
+        if not content_hash:
+            return None
+        return (content_hash, user_request.test_case.name)
 
 
     def shutdown(self):
@@ -85,35 +215,341 @@ class BugExMonitor(object):
 
         """
         # cancel all jobs
-        for job in self.__monitor_jobs:
-            job.cancel()
+        for job in list(self.__monitor_jobs):
+            job.cancel(UserRequestStatus.FAILED, 'BugExMonitor shut down.')
+
+        # stop all workers
+        self.__ingest_workers.shutdown()
+        self.__bugex_slots.shutdown()
+        self.__partial_workers.shutdown()
+        self.__housekeeping.shutdown()
+        BugExServerPool.Instance().shutdown()
 
         self.__log.info('Shutting down BugExMonitor.')
 
+    def recover(self):
+        """
+        This method should be called on system startup. It recovers the
+        requests left unfinished by an earlier server process (see resume()).
+
+        Requests of server processes that are still alive, e.g. of other
+        processes of the same web server, are left alone (see
+        BugExJob.owner_gone()).
+
+        """
+        # defered import to avoid circular dependency problems
+        from bugex_webapp.models import BugExJob, UserRequest
+
+        jobs = BugExJob.objects.exclude(state=BugExJobState.DONE).exclude(
+            user_request__status__in=UserRequest.FINAL_STATUSES
+            ).select_related('user_request').order_by('queued_at')
+
+        recovered = 0
+        for job in jobs:
+            if not job.owner_gone():
+                # still processed by another server process
+                continue
+            if not job.claim():
+                # recovered by another server process
+                continue
+            self.resume(job)
+            recovered += 1
+
+        self.__log.info('Recovered %s unfinished requests.', recovered)
+
+    def resume(self, job):
+        """
+        Continues processing the request of a BugExJob that has been claimed
+        by this process, e.g. after a restart or by a standalone worker
+        (see the bugex_worker command), according to its state:
+
+        - requests whose archive has not been parsed completely are queued
+          for parsing again,
+        - BugEx processes that are still running on this host are adopted,
+        - all other requests are queued for BugEx again, unless BugEx has
+          been started core_config.MAX_ATTEMPTS times for them already.
+
+        """
+        request = job.user_request
+        host = socket.gethostname()
+
+        if request.status in (UserRequestStatus.PENDING,
+                              UserRequestStatus.VALIDATING):
+            # requests for additional test cases are processed together
+            # with their archive request
+            if request.archive_request_id is None:
+                self.new_upload(request)
+        elif (job.state == BugExJobState.RUNNING and job.host == host and
+                job.pid and process_alive(job.pid, request.token)):
+            self.__log.info('Adopting process %s of request %s.',
+                            job.pid, request.token)
+            key = self.__job_key(request)
+            monitor_job = self.__create_job(request, job.pid)
+            priority = self.__priority(request, job.pid)
+            with self.__lock:
+                self.__queue_job(monitor_job, priority, job.pid,
+                                 job.remaining_life_time)
+                if key is not None:
+                    self.__jobs_by_key[key] = monitor_job
+        elif job.attempts >= core_config.MAX_ATTEMPTS:
+            self.__log.info('Giving up request %s after %s attempts.',
+                            request.token, job.attempts)
+            request.update_status(UserRequestStatus.FAILED)
+        else:
+            request.update_status(UserRequestStatus.PROCESSING)
+            self.new_request(request)
+
+    def new_upload(self, request):
+        """
+        This needs to be called upon creation of a new UserRequest. The
+        archive of the request is parsed as soon as an ingest worker is free,
+        afterwards BugEx is run (see UserRequest._async_processing).
+
+        """
+        self.__ingest_workers.submit(request._async_processing)
+        self.__log.info('Queued upload of request %s.', request.token)
+
     def new_request(self, request):
         """
-        This is the notification interface. It needs to be called upon creation
-        of a new UserRequest and will take care of executing BugEx and
-        monitoring the process.
+        This is the notification interface. It needs to be called as soon as
+        the archive of a UserRequest has been parsed and will take care of
+        executing BugEx (as soon as a BugEx slot is free) and monitoring the
+        process.
 
         It also updates the request's status according to the progress and
         persists the results to the database.
 
+        If an identical request is being processed already, the new request
+        subscribes to its job and receives a copy of its result.
+
         """
+        key = self.__job_key(request)
+
         # create file job
-        self.__create_job(request)
+        job = self.__create_job(request)
+        priority = self.__priority(request)
+
+        with self.__lock:
+            running_job = self.__jobs_by_key.get(key)
+            if running_job is not None and running_job.subscribe(request):
+                self.__log.info('Attached request %s to %s.',
+                                request.token, running_job.name)
+                return
+
+            self.__queue_job(job, priority)
+            if key is not None:
+                self.__jobs_by_key[key] = job
+
+    def cancel_request(self, request):
+        """
+        Stops processing a cancelled request: if it waits for a BugEx slot,
+        its job is dropped, if BugEx is running for it, the process is
+        killed and its slot freed. If the request is attached to the job of
+        another identical request, it is only detached from it.
+
+        If other identical requests are attached to the job of the cancelled
+        request, a new job is started for them: BugEx runs in the folder of
+        the cancelled request, which is deleted together with it.
+
+        Returns True, if a job of the request has been found.
+
+        """
+        with self.__lock:
+            jobs = list(self.__monitor_jobs)
+
+        for job in jobs:
+            withdrawn = job.withdraw(request)
+            if withdrawn:
+                job.discard_partial(request)
+            elif withdrawn is None:
+                subscribers = job.retire()
+                if subscribers:
+                    job.stop('Cancelled by the user, handing over to '
+                             '{0}.'.format(subscribers[0].token))
+                    self.__hand_over(job, subscribers[0], subscribers[1:])
+                elif subscribers is not None:
+                    # nobody else waits for the result
+                    job.cancel(UserRequestStatus.CANCELLED,
+                               'Cancelled by the user.')
+            if withdrawn is not False:
+                self.__log.info('Cancelled request %s.', request.token)
+                return True
+        return False
+
+    def __check_cancelled(self):
+        """
+        Cancels the jobs of requests that have been cancelled meanwhile,
+        e.g. by a web server process while this process is a standalone
+        worker. Called periodically by a housekeeping worker.
+
+        """
+        # defered import to avoid circular dependency problems
+        from bugex_webapp.models import UserRequest
+
+        with self.__lock:
+            requests = dict((request.pk, request)
+                            for job in self.__monitor_jobs
+                            for request in job.user_requests)
+        if not requests:
+            return
+
+        cancelled = UserRequest.objects.filter(
+            pk__in=requests.keys(), status=UserRequestStatus.CANCELLED
+            ).values_list('pk', flat=True)
+        for pk in cancelled:
+            self.cancel_request(requests[pk])
+
+    def reap_stalled(self):
+        """
+        Kills the BugEx processes of stalled jobs and retries them (or fails
+        them after core_config.MAX_ATTEMPTS). A running job is stalled, if
+        - it has not recorded a heartbeat for core_config.HEARTBEAT_TIMEOUT
+          seconds, e.g. because the process monitoring it died, or
+        - its BugEx process has not used any CPU time for
+          core_config.PROGRESS_TIMEOUT seconds, e.g. because the JVM hangs.
+
+        Called periodically by a housekeeping worker, independently of the
+        threads running the jobs and of the TimerScheduler, since reaping
+        may block on the database or on sending mails. Jobs of other processes are only reaped,
+        if their heartbeat stopped and they are not claimed by a standalone
+        worker (whose jobs are recovered when its lease expires).
+
+        Returns the number of reaped jobs.
+
+        """
+        # defered import to avoid circular dependency problems
+        from bugex_webapp.models import BugExJob
+
+        with self.__lock:
+            local_jobs = dict((job.user_request.pk, job)
+                              for job in self.__monitor_jobs)
+
+        heartbeat_limit = datetime.now() - timedelta(
+            seconds=core_config.HEARTBEAT_TIMEOUT)
+        reaped = 0
+        for job in BugExJob.stalled(core_config.HEARTBEAT_TIMEOUT,
+                                    core_config.PROGRESS_TIMEOUT):
+            if job.heartbeat_at < heartbeat_limit:
+                reason = 'No heartbeat since {0}'.format(job.heartbeat_at)
+            else:
+                reason = 'No progress since {0}'.format(job.progress_at)
+
+            monitor_job = local_jobs.get(job.user_request_id)
+            if monitor_job is not None:
+                if monitor_job.reap(reason):
+                    reaped += 1
+                continue
+
+            if (job.heartbeat_at >= heartbeat_limit or job.worker or
+                    not job.claim()):
+                # still monitored by another process
+                continue
+
+            request = job.user_request
+            self.__log.info('%s, reaping request %s.', reason, request.token)
+            if (job.host == socket.gethostname() and job.pid and
+                    process_alive(job.pid, request.token)):
+                signal_process_group(job.pid, signal.SIGKILL)
+            BugExJob.mark_queued(request)
+            job.state = BugExJobState.QUEUED
+            self.resume(job)
+            reaped += 1
+        return reaped
+
+    def collect_partial(self, job):
+        """
+        Queues the collection of the partial result of a running job (see
+        BugExMonitorJob._collect_partial()) for the next free partial worker.
+
+        """
+        self.__partial_workers.submit(job._collect_partial)
+
+    def retry(self, job, delay):
+        """
+        Queues the request of a job, whose BugEx run failed transiently, for
+        BugEx again after the given delay (in seconds). The subscribers of
+        the job are taken along.
+
+        """
+        self.__log.info('Retrying %s in %s seconds.', job.name, delay)
+        TimerScheduler.Instance().schedule(
+            delay, self.__housekeeping.submit, self.__resubmit, job)
+
+    def __resubmit(self, job):
+        """
+        Replaces a job waiting for its retry by a new one. Queued for a
+        housekeeping worker by the timer of retry().
+
+        """
+        subscribers = job.retire()
+        if subscribers is None:
+            # canceled meanwhile
+            return
+        self.__hand_over(job, job.user_request, subscribers)
+
+    def __hand_over(self, job, user_request, subscribers):
+        """
+        Replaces a retired job by a new job for the given request and the
+        subscribers of the old job (see __replace_job()). If the new job can
+        not be created, e.g. because the archive has been deleted meanwhile,
+        the requests are failed instead.
+
+        """
+        try:
+            new_job = self.__create_job(user_request)
+            priority = self.__priority(user_request)
+            with self.__lock:
+                self.__replace_job(job, new_job, priority, subscribers)
+            return
+        except Exception as e:
+            traceback.print_exc(file=sys.stdout)
+            self.__log.info('Could not replace %s: %s', job.name, e)
+
+        self.remove_job(job)
+        for failed_request in [user_request] + subscribers:
+            job.discard_partial(failed_request)
+            failed_request.update_status(UserRequestStatus.FAILED)
+
+    def __replace_job(self, job, new_job, priority, subscribers):
+        """
+        Replaces a retired job by a new job created by __create_job(), which
+        takes the subscribers of the old job along. The lock of the monitor
+        needs to be acquired.
+
+        """
+        if job in self.__monitor_jobs:
+            self.__monitor_jobs.remove(job)
+
+        self.__queue_job(new_job, priority)
+        for subscriber in subscribers:
+            new_job.subscribe(subscriber)
+        for key, running_job in self.__jobs_by_key.items():
+            if running_job is job:
+                self.__jobs_by_key[key] = new_job
+        return new_job
 
     def remove_job(self, job):
         """
         Removes a job from the list of all jobs, e.g. after it has finished.
         """
-        self.__monitor_jobs.remove(job)
+        with self.__lock:
+            if job in self.__monitor_jobs:
+                self.__monitor_jobs.remove(job)
+            for key, running_job in self.__jobs_by_key.items():
+                if running_job is job:
+                    del self.__jobs_by_key[key]
 
 class BugExMonitorJob(object):
     """
     The BugExMonitorJob monitors one BugExInstance.
 
-    If the instance terminates in time, it stores the result to the database.
+    The job is run by a BugEx slot of the BugExMonitor, which starts the
+    instance and waits for its process to exit. If the instance terminates in
+    time, it stores the result to the database right away. Failed runs are
+    retried with exponential backoff, if the failure is transient (see
+    bugex_failure.classify_failure()). While BugEx is running, the facts it
+    has written to the result file so far are stored as partial result, and
+    heartbeats are recorded, so stalled jobs can be reaped.
     """
 
     def __init__(self, bug_ex_instance, user_request):
@@ -125,9 +561,20 @@ class BugExMonitorJob(object):
         # members
         self._bug_ex_instance = bug_ex_instance
         self._user_request = user_request
-        self._task = None # no task yet
-        self._tries = 0
-        self._creation_date = datetime.now()
+        self._subscribers = list() # identical requests waiting for the result
+        self._done = False
+        self._lock = threading.Lock()
+        self._result_lock = threading.Lock() # held while the result is
+                                             # copied to the subscribers
+        self._start_date = None # start with run() method
+        self._expired = False # maximum life time exceeded
+        self._follower = None # follows the result file while BugEx runs
+        self._partials = dict() # results with the facts found so far, by
+                                # the primary keys of their requests
+        self._partial_queued = False # whether _collect_partial() is queued
+        self._partial_lock = threading.Lock()
+        self._thread = None # the thread running the job
+        self._stalled = None # why the job has been reaped, if it has been
 
         # job name
         self.name = 'job-' + user_request.token
@@ -144,61 +591,251 @@ class BugExMonitorJob(object):
         self._log.info('Created BugExMonitorJob \'%s\'', self.name)
 
 
-    def _run(self):
+    def run(self, pid=None, life_time=None):
         """
-        The run() method checks if
-        - a stop criteria of the job has been met. This can either be the
-          maxmimum execution time, or an unexpected BugEx exit code.
-          In this case the job is being canceled.
-        - BugEx finished successfully. In this case it tries to parse
-          and persist the resulting XML file to the database.
+        The run method starts the underlying BugEx instance and waits for it
+        to exit. It is executed by a BugEx slot and blocks the slot meanwhile.
+
+        The process is killed by a deadline timer of the TimerScheduler, if it
+        exceeds the maximum life time. As soon as the process exits, its
+        result is processed. Meanwhile, the job records heartbeats, so it can
+        be reaped if it stalls (see BugExMonitor.reap_stalled()).
+
+        Arguments:
+        pid       -- the id of a running BugEx process to adopt (optional)
+        life_time -- the remaining life time of the process in seconds
+                     (defaults to the maximum life time of the test case,
+                     see max_life_time())
+        """
+        # defered import to avoid circular dependency problems
+        from bugex_webapp.models import BugExJob
 
-        The run() method should be called periodically by a PeriodicTask.
-        Calling the schedule() method will take care of scheduling and
-        running the task.
+        if self._done:
+            # canceled while waiting for a slot
+            return
 
-        """
-        self._log.debug('running the job.. (try %s)', str(self._tries))
+        if life_time is None:
+            life_time = max_life_time(self._user_request.test_case.name)
 
-        # increase try count
-        self._tries += 1
+        # start process
+        self._thread = threading.current_thread()
+        self._start_date = datetime.now()
+        if pid is not None:
+            self._bug_ex_instance.adopt(pid)
+        else:
+            # do not mistake the result of an earlier attempt for a new one
+            self._bug_ex_instance.result_file.delete()
+            try:
+                self._bug_ex_instance.start()
+            except Exception as e:
+                # counts as attempt, too
+                BugExJob.mark_running(self._user_request, None, life_time)
+                self._fail(True, 'Could not start BugEx: {0}'.format(e))
+                return
+            BugExJob.mark_running(self._user_request,
+                                  self._bug_ex_instance.pid, life_time)
+        self._log.info('Started.')
+
+        # until the result has been processed
+        self._heartbeat()
+        heartbeat = TimerScheduler.Instance().schedule_periodic(
+            core_config.HEARTBEAT_INTERVAL, self._heartbeat)
+        try:
+            self._wait(pid, life_time)
+        finally:
+            heartbeat.cancel()
 
-        # check stop criteria
+    def _wait(self, pid, life_time):
+        """
+        Waits for the started BugEx process to exit and processes its result.
 
-        # (1) life time
-        time_diff = datetime.now() - self._creation_date    #timedelta
-        if (time_diff.total_seconds() > core_config.MAX_LIFE_TIME):
-            self.cancel(UserRequestStatus.FAILED, 'Maximum life time exceeded (%s seconds)',
+        """
+        # defered import to avoid circular dependency problems
+        from bugex_webapp.models import BugExJob
+
+        deadline = TimerScheduler.Instance().schedule(
+            life_time, self._expire)
+        partial = None
+        if core_config.RESULT_POLL_INTERVAL:
+            self._follower = ResultFileFollower(
+                self._bug_ex_instance.result_file)
+            partial = TimerScheduler.Instance().schedule_periodic(
+                core_config.RESULT_POLL_INTERVAL, self._queue_partial)
+        try:
+            status = self._bug_ex_instance.wait()
+        finally:
+            deadline.cancel()
+            if partial is not None:
+                partial.cancel()
+                with self._partial_lock:
+                    # wait for a running _collect_partial()
+                    self._follower = None
+
+        if pid is None:
+            # the run time of adopted processes is unknown
+            run_time = (datetime.now() - self._start_date).total_seconds()
+            BugExJob.record_run(self._user_request, run_time,
+                                self._bug_ex_instance.resource_usage)
+
+        if not self._done and self._cancelled():
+            # by another process meanwhile, e.g. a web server process while
+            # this process is a standalone worker
+            BugExMonitor.Instance().cancel_request(self._user_request)
+        elif self._expired:
+            time_diff = datetime.now() - self._start_date    #timedelta
+            self.cancel(UserRequestStatus.FAILED,
+                'Maximum life time exceeded (%s seconds)',
                 str(time_diff.total_seconds()))
-            return
+        elif self._stalled is not None and not self._done:
+            self._fail(True, self._stalled)
+        elif not self._done:
+            # not canceled (and killed) meanwhile
+            self._process_result(status)
+
+    def _cancelled(self):
+        """Returns whether the request of this job has been cancelled."""
+        # defered import to avoid circular dependency problems
+        from bugex_webapp.models import UserRequest
+
+        return UserRequest.objects.filter(
+            pk=self._user_request.pk,
+            status=UserRequestStatus.CANCELLED).exists()
+
+    def _queue_partial(self):
+        """
+        Queues _collect_partial() for a partial worker, unless it is queued
+        already. Called periodically by the TimerScheduler while BugEx is
+        running, which must not parse the result file itself.
 
-        # (2) check process status
-        status = self._bug_ex_instance.status
+        """
+        with self._lock:
+            if self._partial_queued or self._done:
+                return
+            self._partial_queued = True
+        BugExMonitor.Instance().collect_partial(self)
 
-        if status == -1:
-            self._log.debug('BugEx is not ready yet..')
-            return
-        elif not status == 0:
-            self.cancel(UserRequestStatus.FAILED, 
-                ("BugEx terminated unsuccessfully (status code %s)! " +
-                "Please check bugex.log in the request directory for more " +
-                "details."), status)
-            return
+    def _collect_partial(self):
+        """
+        Stores the facts BugEx has added to the result file since the last
+        call as partial result of the request and all subscribed requests.
+        Requests that subscribed later get a copy of the facts found before.
+        Executed by a partial worker (see _queue_partial()).
+
+        """
+        # defered import to avoid circular dependency problems
+        from bugex_webapp.models import BugExResult
+
+        with self._partial_lock:
+            self._partial_queued = False
+            if self._follower is None or self._done:
+                return
+            facts = self._follower.poll()
+            if not facts:
+                return
+
+            user_requests = self.user_requests
+            for user_request in user_requests:
+                if user_request.pk in self._partials:
+                    continue
+                if self._partials:
+                    partial = self._partials.values()[0].copy(
+                        user_request, complete=False)
+                else:
+                    partial = BugExResult.start_partial(
+                        user_request, self._bug_ex_instance.version or '')
+                if partial is not None:
+                    # not cancelled meanwhile
+                    self._partials[user_request.pk] = partial
+
+            for partial in self._partials.values():
+                partial.add_facts(facts)
+            self._log.debug('Stored %s partial facts.', len(facts))
+
+    def discard_partial(self, user_request):
+        """
+        Deletes the partial result of a request, which will not get a
+        complete result from this job, e.g. because it has been withdrawn.
 
-        # check result file
-        if not self._bug_ex_instance.result_file.exists():
-            self.cancel(UserRequestStatus.FAILED, 'Result file should exist, but does not.')
+        """
+        # defered import to avoid circular dependency problems
+        from bugex_webapp.models import BugExResult
+
+        with self._partial_lock:
+            self._partials.pop(user_request.pk, None)
+            BugExResult.discard_partial(user_request)
+
+    def _heartbeat(self):
+        """
+        Records a heartbeat of this job (see BugExJob.heartbeat()), unless
+        the thread running it has died. Called periodically while the job
+        is running.
+
+        """
+        # defered import to avoid circular dependency problems
+        from bugex_webapp.models import BugExJob
+
+        if self._done or not self._thread.is_alive():
             return
+        BugExJob.heartbeat(self._user_request, self._bug_ex_instance.pid,
+                           self._bug_ex_instance.cpu_time)
+
+    def reap(self, reason):
+        """
+        Kills the BugEx process of this job, because it has stalled (see
+        BugExMonitor.reap_stalled()). If the thread running the job is still
+        alive, it retries the job as soon as it notices the exit of the
+        process, otherwise the job is retried right away.
+
+        Returns False, if the job is done already.
+        """
+        with self._lock:
+            if self._done or self._stalled is not None:
+                return False
+            self._stalled = reason
+
+        self._log.info('%s, reaping.', reason)
+        self._bug_ex_instance.kill()
+        if self._thread is None or not self._thread.is_alive():
+            self._fail(True, reason)
+        return True
+
+    def _expire(self):
+        """
+        Kills the process, because the maximum life time has been exceeded.
+        Called by the deadline timer of the run() method, the job is canceled
+        as soon as run() notices the exit of the process.
+
+        """
+        self._expired = True
+        self._bug_ex_instance.kill()
 
-        xml_content = self._bug_ex_instance.result_file.read()
+    def _process_result(self, status):
+        """
+        The _process_result() method is called as soon as the BugEx process
+        has exited. It checks if
+        - BugEx returned an unexpected exit code. In this case the job is
+          being canceled.
+        - BugEx finished successfully. In this case it tries to parse
+          and persist the resulting XML file to the database.
 
-        self._log.debug('Processing XML: \n%s',xml_content)
+        """
+        self._log.debug('BugEx exited with status code %s.', status)
+
+        # the status code of adopted processes is unknown (None)
+        result_missing = not self._bug_ex_instance.result_file.exists()
+        if (status is not None and not status == 0) or result_missing:
+            self._fail(*classify_failure(
+                status, self._bug_ex_instance.log_tail(
+                    core_config.FAILURE_LOG_TAIL), result_missing))
+            return
 
         # convert and store this to database
         try:
             # defered import to avoid circular dependency problems
             from bugex_webapp.models import BugExResult
-            BugExResult.new(xml_content, self._user_request)
+            BugExResult.new(self._bug_ex_instance.result_file.path,
+                            self._user_request,
+                            self._bug_ex_instance.version)
         except Exception as e:
             traceback.print_exc(file=sys.stdout)
             self.cancel(UserRequestStatus.FAILED, 'Could not store the BugExResult: %s',e)
@@ -208,32 +845,162 @@ class BugExMonitorJob(object):
         self.cancel(UserRequestStatus.FINISHED, 'Success!')
 
 
-    def schedule(self, interval):
+    def _fail(self, transient, reason):
+        """
+        Handles a failed BugEx run: transient failures are retried after
+        a delay (doubling with every attempt), unless BugEx has been started
+        core_config.MAX_ATTEMPTS times already. Otherwise the job is
+        canceled.
+
+        """
+        # defered import to avoid circular dependency problems
+        from bugex_webapp.models import BugExJob
+
+        attempts = BugExJob.objects.filter(
+            user_request=self._user_request).values_list(
+            'attempts', flat=True)
+        if transient and attempts and attempts[0] < core_config.MAX_ATTEMPTS:
+            delay = min(core_config.RETRY_DELAY * 2 ** (attempts[0] - 1),
+                        core_config.RETRY_MAX_DELAY)
+            self._log.info('%s (attempt %s), retrying.', reason, attempts[0])
+            BugExJob.mark_queued(self._user_request)
+            BugExMonitor.Instance().retry(self, delay)
+            return
+
+        self.cancel(UserRequestStatus.FAILED,
+            ("%s! Please check bugex.log in the request directory for more " +
+             "details."), reason)
+
+    def withdraw(self, user_request):
         """
-        The schedule method starts the underlying BugEx instance.
-        Also it sets up a periodic task to check for completion.
+        Detaches a cancelled request from this job.
 
-        The interval specifies the time in seconds between executing the
-        run() method.
+        Returns False, if the request does not belong to this job (or the job
+        is done already), True, if it has been subscribed to this job, and
+        None, if it is the request of this job. BugEx runs in the folder of
+        this request, so the job can not go on without it (see
+        BugExMonitor.cancel_request()).
 
+        While the result of this job is copied to its subscribers, the
+        request is only withdrawn afterwards, so its result and files are
+        not deleted before the subscribers have their copies.
         """
-        # start process
-        self._bug_ex_instance.start()
+        with self._result_lock:
+            with self._lock:
+                if self._done:
+                    return False
+                for subscriber in self._subscribers:
+                    if subscriber.pk == user_request.pk:
+                        self._subscribers.remove(subscriber)
+                        return True
+                if self._user_request.pk != user_request.pk:
+                    return False
+                return None
+
+    @property
+    def user_requests(self):
+        """Returns the request of this job and all subscribed requests."""
+        with self._lock:
+            return [self._user_request] + self._subscribers
+
+    def retire(self):
+        """
+        Marks a job as done, since it is replaced by a new job, e.g. while
+        it waits for its retry (see BugExMonitor.retry()). The subscribed
+        requests are detached from it.
+
+        Returns the subscribed requests, or None if the job has been
+        canceled meanwhile.
+        """
+        with self._lock:
+            if self._done:
+                return None
+            self._done = True
+            subscribers = self._subscribers
+            self._subscribers = list()
+            return subscribers
+
+    def stop(self, message):
+        """
+        Kills the BugEx process of a retired job (see retire()) and deletes
+        the partial result of its request, e.g. because the request has been
+        cancelled and its subscribers are taken over by a new job.
+        """
+        self._log.info(message)
+        if self._start_date is not None:
+            self._bug_ex_instance.kill()
+        self.discard_partial(self._user_request)
 
-        # create timer task
-        self._task = PeriodicTask(interval, self._run)
+    @property
+    def user_request(self):
+        """Returns the user request of this job."""
+        return self._user_request
 
-        # start task
-        self._task.start()
-        self._log.info('Scheduled to run every %s seconds.', str(interval))
+    def subscribe(self, user_request):
+        """
+        Attaches an identical user request to this job, so it receives the
+        result (or failure) of this job as well.
 
+        Returns False, if the job is done already and can not take any more
+        subscribers.
+        """
+        with self._lock:
+            if self._done:
+                return False
+            self._subscribers.append(user_request)
+            return True
 
     def cancel(self, status, message, *args):
         """
         This method cancels the underlying task and updates the status of the
-        user request.
+        user request and all subscribed requests.
         """
+        # the request must not be withdrawn (and its result deleted) until
+        # the result has been copied to the subscribers
+        self._result_lock.acquire()
+        try:
+            with self._lock:
+                self._done = True
+                subscribers = list(self._subscribers)
+
+            self._log.info(message, *args)
+            try:
+                if self._start_date is not None:
+                    # do not leave a process behind, e.g. if the job was
+                    # canceled
+                    self._bug_ex_instance.kill()
+            finally:
+                BugExMonitor.Instance().remove_job(self)
+
+                if status != UserRequestStatus.FINISHED:
+                    # partial results are only kept together with the
+                    # complete result
+                    for user_request in [self._user_request] + subscribers:
+                        self.discard_partial(user_request)
+
+                statuses = list()
+                for user_request in subscribers:
+                    statuses.append(self._copy_result(user_request, status))
+        finally:
+            self._result_lock.release()
+
+        for user_request, user_request_status in zip(subscribers, statuses):
+            user_request.update_status(user_request_status)
         self._user_request.update_status(status)
-        self._log.info(message, *args)
-        self._task.cancel()
-        #BugExMonitor.Instance().remove(self)
+
+    def _copy_result(self, user_request, status):
+        """
+        Copies the result of this job to a subscribed request, if the job
+        has finished successfully.
+
+        Returns the new status of the subscribed request.
+        """
+        if status != UserRequestStatus.FINISHED:
+            return status
+        try:
+            self._user_request.result.copy(user_request)
+        except Exception as e:
+            self._log.info('Could not copy the result to %s: %s',
+                           user_request.token, e)
+            return UserRequestStatus.FAILED
+        return status
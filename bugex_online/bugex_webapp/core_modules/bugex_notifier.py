@@ -28,6 +28,7 @@ class EmailNotifier(Notifier):
     - BugEx has failed to process their request due to internal error (FAILED);
     - BugEx has failed to process their request due to invalid input (INVALID);
     - they have successfully deleted their BugEx result files (DELETED);
+    - they have successfully cancelled their request (CANCELLED);
     '''
 
     def __init__(self):
@@ -37,27 +38,31 @@ class EmailNotifier(Notifier):
         self.__log = logging.getLogger("EmailNotifier")
         self.__log.info('EmailNotifier created.')
     
-    def notify_user(self, user_request):
+    def notify_user(self, user_request, additional_requests=()):
         '''User is notified in case of a change in the UserRequest status
         
         UserRequest instance is providing all data needed to notify the user 
         (user email, UserRequest status)
         
-        user_request -- a UserRequest instance
+        user_request        -- a UserRequest instance
+        additional_requests -- the requests for additional test cases that
+                               have been submitted together with it, the user
+                               is notified of them in the same email
         '''
         from bugex_webapp.models import UserRequest
 
         status = UserRequestStatus.const_name(user_request.status)
         
         if status not in ('VALID', 'PROCESSING', 'VALIDATING'):
-            subject, content = self._get_content(user_request, status)
+            subject, content = self._get_content(
+                user_request, status, additional_requests)
             try:
                 send_mail(subject, content, settings.EMAIL_HOST_USER, 
                           [user_request.user.email], fail_silently=False)
             except Exception as e:
                 self.__log.info("Email notification failed: %s", e)
                 
-    def _get_content(self, user_request, status):
+    def _get_content(self, user_request, status, additional_requests=()):
         '''Retrieve the email subject and content defined in Notifications
         '''
         subject = Notifications.CONTENT[status]['subject']
@@ -68,6 +73,10 @@ class EmailNotifier(Notifier):
             #include corresponding urls in the email content
             content = content.format(user_request.result_url, 
                                      user_request.delete_url)
+        elif status == 'PENDING':
+            content = content.format('\n'.join(
+                request.cancel_url
+                for request in [user_request] + list(additional_requests)))
         
         return subject, content  
 
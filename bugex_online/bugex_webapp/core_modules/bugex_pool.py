@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+
+"""
+Project: BugEx Online
+Authors: Amir Baradaran
+         Tim Krones
+         Frederik Leonhardt
+         Christos Monogios
+         Akmal Qodirov
+         Iliana Simova
+         Peter Stahl
+"""
+# stdlib dependencies
+import logging
+import itertools
+import sys, traceback
+import threading
+from Queue import Empty, PriorityQueue, Queue
+
+
+class WorkerPool(object):
+    """
+    The WorkerPool executes queued work items with a fixed number of worker
+    threads.
+
+    No matter how many items are submitted, at most `size` of them are
+    executed at the same time; all others wait in the queue (first in, first
+    out). The worker threads are started with the first submitted item.
+
+    pool = WorkerPool('ingest', 2)
+    pool.submit(f, 1, 2)    # executes f(1, 2) as soon as a worker is free
+    pool.shutdown()         # stops the workers after their current item
+
+    """
+
+    def __init__(self, name, size):
+        """
+        Arguments:
+
+        name -- the name of the pool, used for the worker threads and logging
+        size -- the number of worker threads
+        """
+        self.name = name
+        self.size = max(int(size), 1)
+
+        self._queue = Queue()
+        self._workers = list()
+        self._lock = threading.Lock()
+
+        # logging
+        self._log = logging.getLogger('pool-' + name)
+
+    def submit(self, function, *args, **kwargs):
+        """
+        Queues a function call, which will be executed by the next free
+        worker.
+        """
+        self._start_workers()
+        self._put((function, args, kwargs))
+        self._log.debug('Queued %s (%s waiting).', function, self.waiting)
+
+    @property
+    def waiting(self):
+        """Returns the (approximate) number of queued items."""
+        return self._queue.qsize()
+
+    def shutdown(self):
+        """
+        Stops all workers, as soon as they have finished their current item.
+        Items that are still waiting in the queue are dropped.
+        """
+        with self._lock:
+            workers = self._workers
+            self._workers = list()
+        try:
+            while True:
+                self._queue.get_nowait()
+        except Empty:
+            pass
+        for _ in workers:
+            self._put(None)
+        self._log.info('Shutting down %s workers.', len(workers))
+
+    def _start_workers(self):
+        """Starts the worker threads, unless they are running already."""
+        with self._lock:
+            if self._workers:
+                return
+            for number in range(self.size):
+                worker = threading.Thread(
+                    name='{0}-worker-{1}'.format(self.name, number),
+                    target=self._work)
+                worker.daemon = True
+                worker.start()
+                self._workers.append(worker)
+        self._log.info('Started %s workers.', self.size)
+
+    def _put(self, item):
+        """Queues an item, None stops a worker."""
+        self._queue.put(item)
+
+    def _take(self):
+        """Waits for the next item and removes it from the queue."""
+        return self._queue.get()
+
+    def _work(self):
+        """The loop of a worker thread."""
+        while True:
+            item = self._take()
+            if item is None:
+                # shut down
+                return
+
+            function, args, kwargs = item
+            try:
+                function(*args, **kwargs)
+            except Exception as e:
+                traceback.print_exc(file=sys.stdout)
+                self._log.info('%s failed: %s', function, e)
+
+
+class PriorityWorkerPool(WorkerPool):
+    """
+    A WorkerPool that executes the queued item with the lowest priority
+    value first, instead of the oldest one. Items with equal priorities are
+    executed first in, first out.
+
+    pool = PriorityWorkerPool('bugex', 2)
+    pool.submit(10.0, f, 1, 2)  # executes f(1, 2) before all items with
+                                # a priority greater than 10.0
+
+    """
+
+    def __init__(self, name, size):
+        WorkerPool.__init__(self, name, size)
+        self._queue = PriorityQueue()
+        self._sequence = itertools.count()  # keeps items with equal
+                                            # priorities in order
+
+    def submit(self, priority, function, *args, **kwargs):
+        """
+        Queues a function call with the given priority.
+        """
+        self._start_workers()
+        self._queue.put(
+            (priority, next(self._sequence), (function, args, kwargs)))
+        self._log.debug('Queued %s with priority %s (%s waiting).',
+                        function, priority, self.waiting)
+
+    def _put(self, item):
+        """Queues an item before all others, only used to stop workers."""
+        self._queue.put((float('-inf'), next(self._sequence), item))
+
+    def _take(self):
+        """Waits for the item with the lowest priority value."""
+        return self._queue.get()[2]
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+
+"""
+Project: BugEx Online
+Authors: Amir Baradaran
+         Tim Krones
+         Frederik Leonhardt
+         Christos Monogios
+         Akmal Qodirov
+         Iliana Simova
+         Peter Stahl
+"""
+# stdlib dependencies
+import logging
+import threading
+import time
+
+# django dependencies
+from bugex_webapp import UserRequestStatus
+
+# internal dependencies
+import core_config
+from bugex_decorators import Singleton
+
+
+def features(class_count, source_lines, content_size):
+    """
+    Returns the feature vector of a code archive, scaled to similar
+    magnitudes: a constant, the number of class files, the thousands of
+    source lines and the megabytes of uncompressed content.
+
+    """
+    return [1.0, float(class_count), source_lines / 1000.0,
+            content_size / float(1024 * 1024)]
+
+
+def least_squares(rows, values, regularization):
+    """
+    Returns the weights w minimizing |rows * w - values|^2 +
+    regularization * |w|^2, i.e. the solution of the normal equations
+    (rows^T rows + regularization * I) w = rows^T values.
+
+    """
+    n = len(rows[0])
+    # augmented matrix of the normal equations
+    matrix = [[sum(row[i] * row[j] for row in rows) for j in range(n)] +
+              [sum(row[i] * value for row, value in zip(rows, values))]
+              for i in range(n)]
+    for i in range(n):
+        matrix[i][i] += regularization
+
+    # gaussian elimination with partial pivoting
+    for i in range(n):
+        pivot = max(range(i, n), key=lambda r: abs(matrix[r][i]))
+        matrix[i], matrix[pivot] = matrix[pivot], matrix[i]
+        if matrix[i][i] == 0:
+            continue
+        for r in range(i + 1, n):
+            factor = matrix[r][i] / matrix[i][i]
+            for c in range(i, n + 1):
+                matrix[r][c] -= factor * matrix[i][c]
+
+    weights = [0.0] * n
+    for i in reversed(range(n)):
+        if matrix[i][i] == 0:
+            continue
+        rest = sum(matrix[i][j] * weights[j] for j in range(i + 1, n))
+        weights[i] = (matrix[i][n] - rest) / matrix[i][i]
+    return weights
+
+
+@Singleton
+class RuntimePredictor(object):
+    """
+    The RuntimePredictor estimates the run time of BugEx for a code archive,
+    so short jobs can be scheduled first (see core_config.SCHEDULING_POLICY).
+
+    The estimate is a linear function of the features recorded when the
+    archive was stored (see ArchiveIngest), fitted with least squares to the
+    run times of the last core_config.PREDICTOR_SAMPLES successful BugEx
+    runs. The model is fitted again every core_config.PREDICTOR_REFRESH
+    seconds. As long as there are not enough runs, the average run time is
+    used. It is a Singleton, retrieve an instance with:
+
+    predictor = RuntimePredictor.Instance()
+    seconds = predictor.predict(code_archive)
+
+    """
+
+    # minimum number of runs needed to fit the linear model
+    MIN_SAMPLES = 10
+
+    # regularization of the least squares fit, keeps it stable for few or
+    # very similar archives
+    REGULARIZATION = 1.0
+
+    def __init__(self):
+        """
+        Only to be called by Instance()
+
+        """
+        self.__weights = None       # the fitted weights, or None
+        self.__average = 0.0        # average run time, used without weights
+        self.__fitted_at = None     # time.time() of the last fit
+        self.__lock = threading.Lock()
+
+        # logging
+        self.__log = logging.getLogger('RuntimePredictor')
+
+    def predict(self, code_archive):
+        """
+        Returns the estimated run time of BugEx for a code archive in
+        seconds, or the average run time, if its features are unknown.
+        """
+        with self.__lock:
+            if (self.__fitted_at is None or time.time() - self.__fitted_at >
+                    core_config.PREDICTOR_REFRESH):
+                self.__fit()
+            weights, average = self.__weights, self.__average
+
+        if weights is None or code_archive.class_count is None:
+            return average
+        x = features(code_archive.class_count, code_archive.source_lines,
+                     code_archive.content_size)
+        return max(sum(w * f for w, f in zip(weights, x)), 0.0)
+
+    def reset(self):
+        """Forgets the fitted model, it is fitted again on the next call."""
+        with self.__lock:
+            self.__fitted_at = None
+
+    def __fit(self):
+        """Fits the model to the most recent successful runs."""
+        # defered import to avoid circular dependency problems
+        from bugex_webapp.models import BugExJob
+
+        self.__fitted_at = time.time()
+        runs = BugExJob.objects.filter(
+            run_time__isnull=False,
+            user_request__status=UserRequestStatus.FINISHED
+            ).order_by('-started_at').values_list(
+            'run_time',
+            'user_request__codearchive__class_count',
+            'user_request__codearchive__source_lines',
+            'user_request__codearchive__content_size',
+            'user_request__archive_request__codearchive__class_count',
+            'user_request__archive_request__codearchive__source_lines',
+            'user_request__archive_request__codearchive__content_size'
+            )[:core_config.PREDICTOR_SAMPLES]
+
+        rows = list()
+        values = list()
+        run_times = list()
+        for run in runs:
+            run_times.append(run[0])
+            # requests for additional test cases use the archive of their
+            # archive request
+            archive = run[1:4] if run[1] is not None else run[4:7]
+            if None not in archive:
+                rows.append(features(*archive))
+                values.append(run[0])
+
+        if run_times:
+            self.__average = sum(run_times) / len(run_times)
+        if len(rows) >= self.MIN_SAMPLES:
+            self.__weights = least_squares(rows, values, self.REGULARIZATION)
+        else:
+            self.__weights = None
+        self.__log.info('Fitted to %s runs: %s (average %.1f seconds).',
+                        len(rows), self.__weights, self.__average)
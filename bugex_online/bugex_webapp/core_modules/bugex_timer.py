@@ -1,70 +1,232 @@
-'''
-Created on 19.06.2012
+# -*- coding: utf-8 -*-
 
-@author: Frederik Leonhardt <frederik.leonhardt@googlemail.com>
-'''
+"""
+Project: BugEx Online
+Authors: Amir Baradaran
+         Tim Krones
+         Frederik Leonhardt
+         Christos Monogios
+         Akmal Qodirov
+         Iliana Simova
+         Peter Stahl
+"""
+# stdlib dependencies
+import errno
+import fcntl
+import heapq
+import itertools
+import logging
+import os
+import select
+import sys, traceback
 import threading
+import time
 
-class PeriodicTask(threading._Timer):
+# internal dependencies
+from bugex_decorators import Singleton
+
+
+class Timer(object):
     """
-    The PeriodicTask is a recurring Timer.
-    
-    Regularly executes a function, interval given in seconds, e.g.:
-    
-    pt = PeriodicTask(30.0, f, args=[], kwargs={})
-    t.start()     # executes f every 30 seconds
-    t.cancel()    # stop the tasks's action
-    
+    A timer registered with the TimerScheduler, as returned by its
+    schedule() and schedule_periodic() methods.
+
     """
-    
-    def __init__(self, *args, **kwargs):
-        threading._Timer.__init__(self, *args, **kwargs)
-        self._canceled = False
-        #print 'Created task..'
-    
-    def run(self):
-        while True:
-            if self._canceled:
-                # timer has been canceled
-                self.finished.clear()
-                self.finished.set()
-                break
-            else:
-                self.finished.clear()
-                self.finished.wait(self.interval)
-                if not self.finished.isSet():
-                    # if last job finished, execute again
-                    self.function(*self.args, **self.kwargs)
-                else:
-                    return
-                self.finished.set()
-            
+
+    def __init__(self, scheduler, due, interval, function, args, kwargs):
+        self._scheduler = scheduler
+        self.due = due              # time.time() of the next execution
+        self.interval = interval    # seconds between executions, or None
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.canceled = False
+        self.queued = False         # whether it is in the heap
+
     def cancel(self):
-        # even a periodic task needs to be canceled sometimes!
-        self._canceled = True
-        #print 'Canceled task..'
+        """
+        Cancels the timer, it will not be executed anymore.
+        """
+        if not self.canceled:
+            self.canceled = True
+            self._scheduler._timer_canceled(self)
 
 
-class UserRequestThread(threading.Thread):
+@Singleton
+class TimerScheduler(object):
     """
-    The UserRequestThread is responsible for calling _parse_archive()
-    and _run_bugex() on the user request.
+    The TimerScheduler executes all timers (deadlines, retries and periodic
+    housekeeping) on a single thread, no matter how many timers there are.
+
+    The timers are kept in a heap ordered by their due time, so scheduling a
+    timer takes O(log n) and canceling one O(1) (amortized): canceled timers
+    stay in the heap and are dropped once they are due, or all at once as
+    soon as they make up half of the heap. The functions are executed
+    on the scheduler thread and should return quickly, e.g. by killing a
+    process or queueing further work.
+
+    Between two timers, the scheduler thread blocks in select() on a pipe
+    (the self-pipe trick), which is written to when an earlier timer is
+    added. It does not use threading.Condition.wait() with a timeout, which
+    polls every 50 ms in Python 2. It is a Singleton, retrieve an instance
+    with:
 
-    This runs in a separate thread and allows the (browser) view to render
-    before the archive is processed.
+    scheduler = TimerScheduler.Instance()
+    timer = scheduler.schedule(30.0, f, 1, 2)  # executes f(1, 2) in 30 seconds
+    timer.cancel()
 
     """
 
-    def __init__(self, user_request):
+    def __init__(self):
+        """
+        Only to be called by Instance()
+
+        """
+        self.__heap = list()
+        self.__sequence = itertools.count() # keeps timers with equal due
+                                            # times in order
+        self.__lock = threading.Lock()
+        self.__thread = None
+        self.__canceled = 0  # number of canceled timers in the heap
+
+        # written to, to wake the scheduler thread up (see __wait())
+        self.__wakeup_read, self.__wakeup_write = os.pipe()
+        for fd in (self.__wakeup_read, self.__wakeup_write):
+            flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+            fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+            flags = fcntl.fcntl(fd, fcntl.F_GETFD)
+            fcntl.fcntl(fd, fcntl.F_SETFD, flags | fcntl.FD_CLOEXEC)
+
+        # logging
+        self.__log = logging.getLogger('TimerScheduler')
+
+    def schedule(self, delay, function, *args, **kwargs):
+        """
+        Executes a function once, after the given delay (in seconds).
+
+        Returns the Timer, which can be canceled.
+        """
+        return self.__add(Timer(self, time.time() + delay, None, function,
+                                args, kwargs))
+
+    def schedule_periodic(self, interval, function, *args, **kwargs):
         """
-        Arguments:
+        Executes a function every `interval` seconds, until the returned Timer
+        is canceled.
+        """
+        return self.__add(Timer(self, time.time() + interval, interval,
+                                function, args, kwargs))
+
+    @property
+    def pending(self):
+        """Returns the number of timers in the heap, including canceled ones."""
+        with self.__lock:
+            return len(self.__heap)
+
+    def _timer_canceled(self, timer):
+        """
+        Called by Timer.cancel(). Removes all canceled timers from the heap,
+        as soon as they make up half of it.
+        """
+        with self.__lock:
+            if not timer.queued:
+                return
+            self.__canceled += 1
+            if self.__canceled * 2 > len(self.__heap):
+                for entry in self.__heap:
+                    if entry[2].canceled:
+                        entry[2].queued = False
+                self.__heap = [entry for entry in self.__heap
+                               if not entry[2].canceled]
+                heapq.heapify(self.__heap)
+                self.__canceled = 0
+
+    def __add(self, timer):
+        """
+        Pushes a timer to the heap and wakes up the scheduler thread, if the
+        timer is due before all others.
+        """
+        with self.__lock:
+            timer.queued = True
+            heapq.heappush(self.__heap,
+                           (timer.due, next(self.__sequence), timer))
+            self.__start()
+            earliest = self.__heap[0][2] is timer
+        if earliest:
+            try:
+                os.write(self.__wakeup_write, 'x')
+            except OSError as e:
+                # if the pipe is full, the thread will wake up anyway
+                if e.errno != errno.EAGAIN:
+                    raise
+        return timer
+
+    def __start(self):
+        """Starts the scheduler thread, unless it is running already."""
+        if self.__thread is None:
+            self.__thread = threading.Thread(
+                name='timer-scheduler', target=self.__run)
+            self.__thread.daemon = True
+            self.__thread.start()
+
+    def __run(self):
+        """The loop of the scheduler thread."""
+        while True:
+            with self.__lock:
+                timer, delay = self.__next_due()
+            if timer is None:
+                self.__wait(delay)
+                continue
+
+            try:
+                timer.function(*timer.args, **timer.kwargs)
+            except Exception as e:
+                traceback.print_exc(file=sys.stdout)
+                self.__log.info('%s failed: %s', timer.function, e)
+
+            if timer.interval is not None and not timer.canceled:
+                timer.due += timer.interval
+                self.__add(timer)
+
+    def __next_due(self):
+        """
+        Pops the next timer from the heap, if it is due.
 
-        user_request -- the user request to be used
+        Returns the timer and None, or None and the seconds until the next
+        timer is due (None if there are no timers). The lock needs to be
+        acquired.
         """
-        super(UserRequestThread, self).__init__(group = None)
-        self.user_request = user_request
+        # drop canceled timers
+        while self.__heap and self.__heap[0][2].canceled:
+            heapq.heappop(self.__heap)[2].queued = False
+            self.__canceled -= 1
 
-    def run(self):
-        self.user_request._async_processing()
-        #self.user_request._parse_archive()
-        #self.user_request._run_bugex()
+        if not self.__heap:
+            return None, None
+
+        delay = self.__heap[0][0] - time.time()
+        if delay > 0:
+            return None, delay
+
+        timer = heapq.heappop(self.__heap)[2]
+        timer.queued = False
+        return timer, None
+
+    def __wait(self, timeout):
+        """
+        Blocks the scheduler thread for the given number of seconds (forever
+        if None), or until an earlier timer has been added (see __add()).
+        """
+        try:
+            readable, _, _ = select.select(
+                [self.__wakeup_read], [], [], timeout)
+        except select.error as e:
+            if e.args[0] == errno.EINTR:
+                return
+            raise
+        if readable:
+            try:
+                os.read(self.__wakeup_read, 4096)
+            except OSError as e:
+                if e.errno != errno.EAGAIN:
+                    raise
@@ -10,6 +10,94 @@ DEBUG = True
 ARTIFICIAL_DELAY = 5
 
 
+# [ INGEST ]
+
+# Number of rows collected in memory before they are written to the database
+# in one go while an uploaded archive is stored.
+# Default is 1000.
+INGEST_BATCH_SIZE = 1000
+
+# Storage engine for the content of Java source files.
+# 'BLOB' stores every file once as compressed blob together with its line
+# offsets, 'LINES' stores one Line row per source line.
+# Default is 'BLOB'.
+SOURCE_STORAGE = 'BLOB'
+
+# If turned on, source files that are unchanged (same path, CRC-32 and size)
+# since the previous upload of an archive with the same name by the same user
+# are not parsed again, but share the stored content of the previous upload.
+# Only available with the 'BLOB' source storage.
+# Default is True.
+INCREMENTAL_INGEST = True
+
+
+# [ SCHEDULING ]
+
+# Number of worker threads parsing uploaded archives at the same time.
+# Further uploads wait in a queue.
+# Default is 2.
+INGEST_WORKERS = 2
+
+# Number of BugEx processes running at the same time.
+# Further requests wait in a queue until a slot is free.
+# Default is 2.
+BUGEX_SLOTS = 2
+
+# Number of worker threads storing partial results (see RESULT_POLL_INTERVAL),
+# so the result files of running jobs are not parsed on the timer thread.
+# Default is 1.
+PARTIAL_WORKERS = 1
+
+# Number of worker threads doing the periodic housekeeping of the monitor
+# (see CANCEL_CHECK_INTERVAL and REAPER_INTERVAL), which may block on the
+# database or on sending mails and must not delay the timers.
+# Default is 1.
+HOUSEKEEPING_WORKERS = 1
+
+# Order in which queued requests get a free BugEx slot.
+# 'FIFO' runs them in the order they have been queued, 'SJF' (shortest job
+# first) runs the requests with the shortest estimated run time first (see
+# RuntimePredictor), so short requests do not wait behind long ones.
+# Default is 'SJF'.
+SCHEDULING_POLICY = 'SJF'
+
+# Ageing of queued requests with the 'SJF' policy: every second a request
+# waits, its estimated run time is reduced by this many seconds, so long
+# requests are not starved by a steady stream of short ones.
+# Default is 1.0.
+SJF_AGEING = 1.0
+
+# Number of recent successful BugEx runs the run time of new requests is
+# estimated from.
+# Default is 200.
+PREDICTOR_SAMPLES = 200
+
+# Seconds after which the run time estimation is fitted to the recent runs
+# again.
+# Default is 300 seconds.
+PREDICTOR_REFRESH = 300
+
+
+# [ WORKERS ]
+
+# Where requests are processed.
+# 'EMBEDDED' parses archives and runs BugEx inside the web server processes,
+# 'STANDALONE' only queues requests in the database; they are processed by
+# one or more `manage.py bugex_worker` processes, possibly on other hosts.
+# All web server processes and workers need to use the same mode.
+# Default is 'EMBEDDED'.
+WORKER_MODE = 'EMBEDDED'
+
+# Seconds a standalone worker holds a claimed request without renewing its
+# lease. Afterwards, other workers may take the request over.
+# Default is 60 seconds.
+WORKER_LEASE_TIME = 60
+
+# Seconds between two looks for queued requests by a standalone worker.
+# Default is 2.0 seconds.
+WORKER_POLL_INTERVAL = 2.0
+
+
 # [ BUG EX ]
 
 # The name of the result file produced by BugEx.
@@ -18,12 +106,214 @@ RESULT_FILE_NAME = 'bugex-results.xml'
 # Absolute path of the BugEx executable.
 EXECUTABLE = '/var/django/bugex-mock-0.0.6-SNAPSHOT-jar-with-dependencies.jar'
 
-# [ MONITORING ]
+# How BugEx is run.
+# 'PROCESS' starts a new JVM for every request, 'JAVA' submits requests to
+# long-lived BugEx server JVMs (see JAVA_SERVER_CLASS), which saves the JVM
+# startup for every request.
+# 'JAVA' is not supported with the BugEx mock jars shipped in java_mock/bin
+# and java_mock/bugex-mock/target: they were built before BugExServer was
+# added and do not contain JAVA_SERVER_CLASS. Rebuild the mock with Maven
+# before using it.
+# Default is 'PROCESS'.
+INSTANCE_TYPE = 'PROCESS'
 
-# Interval in seconds, in which the system will check if a BugEx process has finished.
-# Default is 30.0 seconds.
-CHECK_INTERVAL = 5.0
+# Number of facts collected in memory before they are written to the database
+# in one go while the result of BugEx is stored.
+# Default is 1000.
+RESULT_BATCH_SIZE = 1000
+
+
+# [ LIMITS ]
+
+# Limits applied to every BugEx process and BugEx server (see INSTANCE_TYPE),
+# so a single runaway analysis can not take the whole host down. None turns a
+# limit off. A server runs many requests, so it gets no CPU time limit and the
+# other limits apply to all of its requests together.
+
+# Maximum address space of a BugEx process in bytes (RLIMIT_AS). Note that
+# the JVM reserves much more virtual memory than its heap size.
+# Default is None.
+MEMORY_LIMIT = None
+
+# Maximum CPU seconds of a BugEx process (RLIMIT_CPU), afterwards it is
+# killed by the kernel. Not applied to BugEx servers.
+# Default is None.
+CPU_TIME_LIMIT = None
+
+# Maximum size in bytes of a file written by a BugEx process (RLIMIT_FSIZE).
+# Default is 1 GB.
+FILE_SIZE_LIMIT = 1024 * 1024 * 1024
+
+# Niceness added to BugEx processes, so they do not slow down the web server.
+# Default is 10.
+NICENESS = 10
+
+# Maximum size in bytes of bugex.log. The output of BugEx is written to the
+# log until only LOG_END_SIZE bytes are left, of the rest only the last
+# LOG_END_SIZE bytes are kept, which are appended when BugEx exits.
+# Default is 10 MB.
+LOG_MAX_SIZE = 10 * 1024 * 1024
+
+# Number of bytes at the end of the output of BugEx that are kept in the log.
+# Needs to be at least FAILURE_LOG_TAIL.
+# Default is 1 MB.
+LOG_END_SIZE = 1024 * 1024
+
+# Whether bugex.log is compressed (bugex.log.gz) after BugEx exits.
+# Default is False.
+LOG_COMPRESS = False
+
+# I/O scheduling class of BugEx processes, as understood by `ionice -c`
+# (1: realtime, 2: best-effort, 3: idle). Only applied, if ionice is
+# installed.
+# Default is 2.
+IO_CLASS = 2
+
+
+# [ LOG TAIL ]
+
+# Maximum number of bytes of bugex.log returned by one request to the log
+# page.
+# Default is 64KB.
+LOG_TAIL_MAX_SIZE = 64 * 1024
+
+# Maximum number of seconds a request to the log page waits for new bytes
+# (long polling).
+# Default is 30.
+LOG_TAIL_MAX_WAIT = 30
+
+# Number of seconds between two checks for new bytes while waiting.
+# Default is 1.0.
+LOG_TAIL_POLL_INTERVAL = 1.0
+
+
+# [ BUG EX SERVER ]
+
+# The main class of the BugEx server, contained in the BugEx executable.
+JAVA_SERVER_CLASS = 'de.unisl.cs.st.BugExServer'
+
+# Number of requests a BugEx server runs before it is replaced by a fresh
+# one, to avoid leaking memory or state across many requests.
+# Default is 50.
+JAVA_SERVER_MAX_JOBS = 50
+
+# Seconds a BugEx server may take to start or to answer a health check
+# before it is considered broken and replaced.
+# Default is 30 seconds.
+JAVA_SERVER_TIMEOUT = 30
+
+# [ RESULT CACHE ]
+
+# A boolean that turns on/off the result cache.
+# If turned on, a request for an archive and test case that have already been
+# analysed successfully by the same BugEx executable reuses the earlier result
+# instead of running BugEx again.
+RESULT_CACHE = True
+
+
+# [ MONITORING ]
 
 # Maximum lifetime in seconds a monitor job will live.
 # Default is 12 hours.
 MAX_LIFE_TIME = 12 * 60 * 60
+
+# Maximum lifetimes in seconds for specific test cases, overriding
+# MAX_LIFE_TIME. A list of (pattern, seconds) tuples, where the pattern is
+# matched against the test case name with fnmatch (e.g. 'de.slow.*'); the
+# first matching pattern wins.
+# Default is [].
+TEST_CASE_LIFE_TIMES = []
+
+# Seconds a BugEx process and its children get to terminate after SIGTERM,
+# before they are killed with SIGKILL.
+# Default is 10 seconds.
+KILL_GRACE_PERIOD = 10
+
+# Interval in seconds, in which the system checks if an adopted BugEx process
+# (started before a restart of the server, see RECOVER_JOBS) has finished.
+# Default is 5.0 seconds.
+ADOPT_CHECK_INTERVAL = 5.0
+
+# Interval in seconds, in which the system checks whether requests processed
+# by this process have been cancelled by another process (e.g. a web server
+# process, while BugEx runs in a standalone worker).
+# Default is 5.0 seconds.
+CANCEL_CHECK_INTERVAL = 5.0
+
+# Interval in seconds, in which the result file is checked for new facts
+# while BugEx is running. New facts are shown to the user as partial result.
+# None turns partial results off.
+# Default is 10.0 seconds.
+RESULT_POLL_INTERVAL = 10.0
+
+# Interval in seconds, in which every running job records a heartbeat: the
+# time, the process id and the CPU time used by BugEx so far.
+# Default is 30.0 seconds.
+HEARTBEAT_INTERVAL = 30.0
+
+# Seconds without a heartbeat, after which a running job is considered
+# stalled, e.g. because the thread or process monitoring it died.
+# Default is 5 minutes.
+HEARTBEAT_TIMEOUT = 5 * 60
+
+# Seconds without any CPU time used by BugEx, after which a running job is
+# considered stalled, e.g. because the JVM hangs.
+# Default is 30 minutes.
+PROGRESS_TIMEOUT = 30 * 60
+
+# Interval in seconds, in which stalled jobs are looked for. Their BugEx
+# processes are killed and they are retried, or failed after MAX_ATTEMPTS.
+# Default is 60.0 seconds.
+REAPER_INTERVAL = 60.0
+
+
+# [ RECOVERY ]
+
+# A boolean that turns on/off job recovery at startup (see wsgi.py).
+# If turned on, requests left unfinished by the previous server process are
+# parsed again, their BugEx processes adopted if they are still running on
+# this host, or BugEx is started again.
+RECOVER_JOBS = True
+
+# Maximum number of times BugEx is started for a single request.
+# Default is 3.
+MAX_ATTEMPTS = 3
+
+
+# [ RETRY ]
+
+# Failed BugEx runs are classified as transient or permanent (see
+# bugex_failure.classify_failure()). Requests whose run failed transiently
+# are queued for BugEx again after a delay, until BugEx has been started
+# MAX_ATTEMPTS times; permanent failures are reported to the user right away.
+
+# Signals that kill BugEx processes for reasons outside of BugEx, e.g. the
+# out-of-memory killer (SIGKILL) or a crash of the JVM.
+TRANSIENT_SIGNALS = ['SIGKILL', 'SIGTERM', 'SIGSEGV', 'SIGBUS']
+
+# Regular expressions matched against the end of bugex.log, which indicate
+# a transient failure.
+TRANSIENT_LOG_PATTERNS = [
+    r'No space left on device',
+    r'Too many open files',
+]
+
+# Regular expressions matched against the end of bugex.log, which indicate
+# that the JVM itself ran out of memory (an OutOfMemoryError may as well be
+# thrown by the program under test). They are transient failures, unless
+# MEMORY_LIMIT is set: with a limit, the JVM fails the same way every time.
+MEMORY_LOG_PATTERNS = [
+    r'insufficient memory for the Java Runtime Environment',
+    r'Could not reserve enough space',
+    r'Cannot allocate memory',
+]
+
+# Number of bytes at the end of bugex.log that are matched.
+# Default is 8 KB.
+FAILURE_LOG_TAIL = 8 * 1024
+
+# Seconds to wait before the first retry; the delay doubles with every
+# further retry, up to RETRY_MAX_DELAY seconds.
+# Defaults are 30 seconds and 30 minutes.
+RETRY_DELAY = 30
+RETRY_MAX_DELAY = 30 * 60
@@ -12,9 +12,11 @@ Authors: Amir Baradaran
 """
 
 from django import forms
+from django.forms.formsets import BaseFormSet, formset_factory
 from captcha.fields import CaptchaField
 
 from bugex_webapp.validators import validate_archive_file_extension
+from bugex_webapp.validators import validate_archive_integrity
 from bugex_webapp.validators import validate_archive_copyright
 from bugex_webapp.validators import validate_test_case_name
 from bugex_webapp.validators import validate_name
@@ -57,7 +59,8 @@ class UserRequestForm(forms.Form):
     EmailBaseForm.
     """
     code_archive = forms.FileField(
-        validators=[validate_archive_file_extension],
+        validators=[validate_archive_file_extension,
+                    validate_archive_integrity],
         help_text='The archive (ZIP or JAR) that contains your code.'
     )
     test_case = forms.CharField(
@@ -75,12 +78,54 @@ class UserRequestForm(forms.Form):
 
 
 class AdditionalTestCaseForm(forms.Form):
-    """The AdditionalTestCaseForm form for uploading additional test cases."""
-    additional_test_case = forms.FileField(
-        help_text='The additional failing test case that you want to upload.'
+    """The AdditionalTestCaseForm form for entering additional test cases.
+
+    Every additional test case is run against the archive uploaded with the
+    UserRequestForm, without uploading the archive again.
+    """
+    additional_test_case = forms.CharField(
+        max_length=100,
+        required=False,
+        validators=[validate_test_case_name],
+        label='Additional test case',
+        help_text='The name of another failing test case related to your ' \
+                  'program.'
     )
 
 
+class BaseAdditionalTestCaseFormSet(BaseFormSet):
+    """The formset for the AdditionalTestCaseForm.
+
+    It limits the number of additional test cases per upload.
+    """
+    MAX_TEST_CASES = 20
+
+    def clean(self):
+        """Checks the number of additional test cases."""
+        if any(self.errors):
+            return
+        if len(self.names()) > self.MAX_TEST_CASES:
+            raise forms.ValidationError(
+                'Please enter at most {0} additional test cases.'.format(
+                    self.MAX_TEST_CASES))
+
+    def names(self, test_case_name=None):
+        """
+        Returns the names of the additional test cases that have been entered,
+        without duplicates and without the given test case name.
+        """
+        names = list()
+        for form in self.forms:
+            name = form.cleaned_data.get('additional_test_case')
+            if name and name != test_case_name and name not in names:
+                names.append(name)
+        return names
+
+
+AdditionalTestCaseFormSet = formset_factory(
+    AdditionalTestCaseForm, formset=BaseAdditionalTestCaseFormSet, extra=1)
+
+
 class ChangeEmailForm(forms.Form):
     """The ChangeEmailForm for changing a user's email address.
 
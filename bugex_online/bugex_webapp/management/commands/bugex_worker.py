@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+"""
+Project: BugEx Online
+Authors: Amir Baradaran
+         Tim Krones
+         Frederik Leonhardt
+         Christos Monogios
+         Akmal Qodirov
+         Iliana Simova
+         Peter Stahl
+"""
+
+import os
+import socket
+import threading
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from bugex_webapp import BugExJobState
+from bugex_webapp.models import BugExJob
+from bugex_webapp.core_modules import core_config
+from bugex_webapp.core_modules.bugex_monitor import BugExMonitor
+
+
+class Command(BaseCommand):
+    """The bugex_worker command.
+
+    Runs a standalone worker, which claims queued requests from the database
+    and processes them (parsing the archive and running BugEx), see
+    core_config.WORKER_MODE. Several workers, also on different hosts, can
+    share the same database.
+
+    While a worker is alive, it renews the leases of its requests. If it
+    dies, its requests are taken over by other workers as soon as their
+    leases have expired. The leases are renewed by a thread of their own,
+    so they do not expire while the worker is busy, e.g. while the timers
+    of the TimerScheduler are delayed.
+    """
+    help = 'Claims queued BugEx requests from the database and processes them.'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--name',
+            help='The name of the worker (defaults to <host>:<pid>).'),
+        make_option('--capacity', type='int',
+            help='The maximum number of requests processed at the same ' \
+                 'time (defaults to INGEST_WORKERS + BUGEX_SLOTS).'),
+    )
+
+    def handle(self, **options):
+        name = options.get('name') or '{0}:{1}'.format(
+            socket.gethostname(), os.getpid())
+        capacity = options.get('capacity') or (
+            core_config.INGEST_WORKERS + core_config.BUGEX_SLOTS)
+        lease_time = core_config.WORKER_LEASE_TIME
+
+        monitor = BugExMonitor.Instance()
+        self.running = True
+        renewal = threading.Thread(name='lease-renewal',
+                                   target=self.renew_leases,
+                                   args=(name, lease_time))
+        renewal.daemon = True
+        renewal.start()
+        self.stdout.write('Worker {0} started (capacity {1}).\n'.format(
+            name, capacity))
+
+        try:
+            while True:
+                # end the current transaction to see the changes of others
+                transaction.commit_unless_managed()
+
+                job = None
+                busy = BugExJob.objects.filter(worker=name).exclude(
+                    state=BugExJobState.DONE).count()
+                if busy < capacity:
+                    job = BugExJob.claim_next(name, lease_time)
+
+                if job is None:
+                    time.sleep(core_config.WORKER_POLL_INTERVAL)
+                    continue
+
+                self.stdout.write('Claimed request {0}.\n'.format(
+                    job.user_request.token))
+                monitor.resume(job)
+        except KeyboardInterrupt:
+            self.running = False
+            self.stdout.write('Worker {0} stopped, its requests will be ' \
+                              'taken over by other workers.\n'.format(name))
+
+    def renew_leases(self, name, lease_time):
+        """
+        Renews the leases of the requests claimed by the worker every third
+        of the lease time, until the worker is stopped.
+        """
+        while True:
+            time.sleep(lease_time / 3.0)
+            if not self.running:
+                return
+            try:
+                BugExJob.renew_leases(name, lease_time)
+            except Exception as e:
+                self.stderr.write('Could not renew leases: {0}\n'.format(e))
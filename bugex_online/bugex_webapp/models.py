@@ -11,23 +11,32 @@ Authors: Amir Baradaran
          Peter Stahl
 """
 
+import hashlib
 import logging
 import re
 import os
 import shutil
+import socket
 import uuid
-from xml.etree.ElementTree import fromstring
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from xml.etree.ElementTree import iterparse
 from zipfile import ZipFile
 
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
-from django.db import models
-
-from bugex_webapp import UserRequestStatus, XMLNode
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+
+from bugex_webapp import BugExJobState, UserRequestStatus, XMLNode
+from bugex_webapp.core_modules import core_config
+from bugex_webapp.core_modules.bugex_blob import CompressedSource
+from bugex_webapp.core_modules.bugex_files import BugExLogFile
+from bugex_webapp.core_modules.bugex_instance import executable_version
+from bugex_webapp.core_modules.bugex_instance import process_alive
 from bugex_webapp.core_modules.bugex_monitor import BugExMonitor
 from bugex_webapp.core_modules.bugex_notifier import EmailNotifier
-from bugex_webapp.core_modules.bugex_timer import UserRequestThread
 from bugex_webapp.validators import validate_archive_file_extension
 from bugex_webapp.validators import validate_class_file_extension
 from bugex_webapp.validators import validate_source_file_extension
@@ -68,32 +77,63 @@ class UserRequest(models.Model):
         verbose_name='date of creation',
         help_text='The date when this request was created.'
     )
+    archive_request = models.ForeignKey('self',
+        blank=True,
+        null=True,
+        related_name='dependent_requests',
+        help_text='The request whose code archive is used by this request, ' \
+                  'if it was submitted together with additional test cases.'
+    )
+
+    # statuses that do not change anymore (apart from DELETED)
+    FINAL_STATUSES = (
+        UserRequestStatus.INVALID,
+        UserRequestStatus.FAILED,
+        UserRequestStatus.FINISHED,
+        UserRequestStatus.DELETED,
+        UserRequestStatus.CANCELLED
+    )
+
+    # statuses of requests that can still be cancelled
+    CANCELLABLE_STATUSES = (
+        UserRequestStatus.PENDING,
+        UserRequestStatus.VALIDATING,
+        UserRequestStatus.VALID,
+        UserRequestStatus.PROCESSING
+    )
 
     def __unicode__(self):
         """Return a unicode representation for a UserRequest model object."""
         return u'{0}: {1}'.format(self.token, self.test_case)
 
     @staticmethod
-    def new(user, test_case_name, archive_file):
+    def new(user, test_case_name, archive_file, additional_test_case_names=()):
         """
         Creates a new UserRequest object, saves it to database and returns a
         reference to it.
 
+        For every additional test case, another UserRequest is created that
+        uses the same code archive (see archive_request). The archive is
+        stored and parsed only once, BugEx runs once per test case.
+
         Also triggers archive parsing and runs BugEx.
 
         Arguments:
 
-        user            -- the user associated to the request
-        test_case_name  -- the fully qulified nam eof the test case
-        archive_file    -- the uploaded file (user archive)
+        user                       -- the user associated to the request
+        test_case_name             -- the fully qulified nam eof the test case
+        archive_file               -- the uploaded file (user archive)
+        additional_test_case_names -- the fully qualified names of further
+                                      failing test cases (optional)
 
         """
         # logging
         log = logging.getLogger(__name__)
         log.setLevel('DEBUG')
 
-        # create unique token for request
-        token = str(uuid.uuid4())
+        # create unique token for request, unless the upload handler
+        # already reserved one for the streamed archive
+        token = getattr(archive_file, 'token', None) or str(uuid.uuid4())
         log.info("Created token for incoming UserRequest: %s", token)
         delete_token = str(uuid.uuid4())
         log.info("Created delete token for incoming UserRequest: %s", token)
@@ -117,11 +157,19 @@ class UserRequest(models.Model):
         # create code archive
         code_archive = CodeArchive()
         code_archive.user_request = user_request
-        # save file to disk
-        code_archive.archive_file.save(
-            name=archive_file.name,
-            content=archive_file
-        )
+        if hasattr(archive_file, 'relative_path'):
+            # already streamed to disk by the CodeArchiveUploadHandler
+            code_archive.archive_file.name = archive_file.relative_path
+            code_archive.content_hash = archive_file.content_hash
+            archive_file.close()
+        else:
+            # save file to disk
+            code_archive.content_hash = CodeArchive.hash_file(archive_file)
+            code_archive.archive_file.save(
+                name=archive_file.name,
+                content=archive_file,
+                save=False
+            )
         # extract file type
         archive_file_ext = os.path.splitext(archive_file.name)[1][1:].strip()
         code_archive.archive_format = archive_file_ext.upper()
@@ -129,17 +177,47 @@ class UserRequest(models.Model):
 
         # save user request
         user_request.save()
-
-        # update status to PENDING
-        user_request.update_status(UserRequestStatus.PENDING)
+        # in embedded mode, this process processes the requests (see
+        # BugExMonitor.recover())
+        owner = ''
+        if core_config.WORKER_MODE == 'EMBEDDED':
+            owner = BugExJob.current_owner()
+        BugExJob.objects.create(user_request=user_request, owner=owner)
+
+        # create the requests for the additional test cases, they only get
+        # a folder for their results
+        dependent_requests = list()
+        for name in additional_test_case_names:
+            dependent_request = UserRequest.objects.create(
+                user=user,
+                test_case=TestCase.objects.create(name=name),
+                token=str(uuid.uuid4()),
+                delete_token=str(uuid.uuid4()),
+                status=UserRequestStatus.PENDING,
+                archive_request=user_request
+            )
+            BugExJob.objects.create(user_request=dependent_request,
+                                    owner=owner)
+            os.makedirs(dependent_request.folder)
+            dependent_requests.append(dependent_request)
+        if dependent_requests:
+            log.info("Created %s requests for additional test cases.",
+                     len(dependent_requests))
+
+        # update status to PENDING, the user is notified of all requests
+        # at once
+        for request in [user_request] + dependent_requests:
+            request.update_status(UserRequestStatus.PENDING, notify=False)
+        EmailNotifier().notify_user(user_request, dependent_requests)
 
         # Now the user input has been validated, and thus
         # the http request should respond.
         # Therefore, further action will be carried out asynchronously
-        log.debug("Starting threaded execution..")
+        log.debug("Queueing asynchronous execution..")
 
-        thread = UserRequestThread(user_request)
-        thread.start()
+        if core_config.WORKER_MODE == 'EMBEDDED':
+            BugExMonitor.Instance().new_upload(user_request)
+        # otherwise the BugExJob is claimed by a standalone worker
 
         log.debug("Returning to view..")
 
@@ -149,10 +227,11 @@ class UserRequest(models.Model):
 
     def _async_processing(self):
         """
-        This method is to be called by a Thread.
+        This method is to be called by an ingest worker of the BugExMonitor.
 
         It starts parsing the archive asynchronously, so that the HTTP request
-        can terminate.
+        can terminate. Afterwards BugEx is run for this request and all
+        requests for additional test cases that use its archive.
 
         """
         log = logging.getLogger(__name__)
@@ -165,8 +244,9 @@ class UserRequest(models.Model):
             log.info("Parsing failed: %s", e)
         else:
             log.debug("Running BugEx..")
-            # run BugEx
-            self.__run_bugex()
+            # run BugEx, once per test case
+            for user_request in self.__archive_requests():
+                user_request.__run_bugex()
 
 
     @property
@@ -178,6 +258,14 @@ class UserRequest(models.Model):
         return '{0}/result/{1}'.format(
             settings.APPLICATION_BASE_URL, self.token)
 
+    @property
+    def cancel_url(self):
+        """
+        Return URL for cancelling a specific UserRequest
+        """
+        return '{0}/cancel/{1}'.format(
+            settings.APPLICATION_BASE_URL, self.delete_token)
+
     @property
     def delete_url(self):
         """
@@ -203,14 +291,65 @@ class UserRequest(models.Model):
 
         (relative to MEDIA_ROOT)
         """
-        return os.path.join(
-            'user_{0}'.format(self.user.id), self.token
-        )
+        return request_relative_folder(self.user, self.token)
+
+    @property
+    def log_file(self):
+        """
+        Returns the log of the BugEx run of this request (see BugExLogFile).
+        """
+        return BugExLogFile(os.path.join(self.folder, 'bugex.log'))
+
+    @property
+    def code_archive(self):
+        """
+        Returns the code archive used by this request, which is the one of
+        its archive request, if it has one.
+        """
+        if self.archive_request_id is not None:
+            return self.archive_request.codearchive
+        return self.codearchive
+
+    def release_code_archive(self):
+        """
+        Deletes the folder of this request together with the code archive it
+        uses (the archive file, folders, files and lines), unless the archive
+        is still used by other requests that have not been deleted yet.
+
+        The folder of the request that uploaded a shared archive is kept
+        until the archive is deleted.
+        """
+        owner = self.archive_request or self
+        in_use = UserRequest.objects.filter(
+            models.Q(pk=owner.pk) | models.Q(archive_request=owner)).exclude(
+            pk=self.pk).exclude(status=UserRequestStatus.DELETED).exists()
+
+        if not in_use:
+            code_archive = owner.codearchive
+            code_archive.archive_file.delete()
+            code_archive.delete()
+            shutil.rmtree(owner.folder, ignore_errors=True)
+        if self != owner or not in_use:
+            shutil.rmtree(self.folder, ignore_errors=True)
 
     def _build_path(self, *sub_folders):
         """Returns the joined path of a folder and its subfolders."""
         return os.path.join(self.folder, *sub_folders)
 
+    def __archive_requests(self):
+        """
+        Returns this request and all requests that use its code archive.
+        """
+        return [self] + list(self.dependent_requests.order_by('pk'))
+
+    def __update_archive_status(self, new_status):
+        """
+        Updates the status of all requests that use the code archive of this
+        request (see update_status).
+        """
+        for user_request in self.__archive_requests():
+            user_request.update_status(new_status)
+
     def __parse_archive(self):
         """
         Traverses the archive and parses its files.
@@ -220,60 +359,137 @@ class UserRequest(models.Model):
         This step is important to display the source code later on.
         """
         # VALIDATION phase starts now
-        self.update_status(UserRequestStatus.VALIDATING)
+        self.__update_archive_status(UserRequestStatus.VALIDATING)
 
-        # extract user archive
-        path_extracted = self.codearchive.absolute_extracted_path #_build_path('tmp_extracted')
+        # open user archive, its entries are read without extracting them
         try:
             archive = ZipFile(self.codearchive.path, 'r')
-            archive.extractall(path_extracted)
-            archive.close()
         except:
             # oops, no zip?
-            self.update_status(UserRequestStatus.INVALID)
+            self.__update_archive_status(UserRequestStatus.INVALID)
             # raise exception for handling somewhere else
             raise
         else:
             # trigger archive traversal
-            self.codearchive.traverse()
+            try:
+                self.codearchive.traverse(archive)
+            finally:
+                archive.close()
 
             # archive seems to be VALID!
-            self.update_status(UserRequestStatus.VALID)
-
-            # delete temporary folder again
-            shutil.rmtree(path_extracted)
+            self.__update_archive_status(UserRequestStatus.VALID)
 
 
     def __run_bugex(self):
         """
         Creates and starts a BugEx Instance by notifying the BugExMonitor.
 
+        If the result cache is turned on and an earlier result for the same
+        archive content, test case and BugEx version exists, a copy of it is
+        used instead.
+
         """
         # PROCESSING phase stars now
         self.update_status(UserRequestStatus.PROCESSING)
+        if self.status == UserRequestStatus.CANCELLED:
+            return
+
+        # maybe BugEx already analysed this archive and test case
+        if core_config.RESULT_CACHE and BugExResult.copy_cached(
+                self, executable_version(core_config.EXECUTABLE)):
+            self.update_status(UserRequestStatus.FINISHED)
+            return
 
         # notify monitor
         bugex_mon = BugExMonitor.Instance()
         bugex_mon.new_request(self)
 
 
-    def update_status(self, new_status):
+    @property
+    def can_cancel(self):
+        """
+        Returns whether this request can still be cancelled (see cancel()).
+        """
+        return self.status in UserRequest.CANCELLABLE_STATUSES
+
+    def cancel(self, notify=True):
+        """
+        Cancels this request, unless it has reached a final status already.
+        A running BugEx process is killed, unless other identical requests
+        wait for its result (see BugExMonitor.cancel_request()).
+
+        Returns True, if the request has been cancelled.
+
+        Arguments:
+        notify -- whether the user is notified (not needed, if the request
+                  is deleted right away)
+        """
+        cancelled = UserRequest.objects.filter(
+            pk=self.pk, status__in=UserRequest.CANCELLABLE_STATUSES).update(
+            status=UserRequestStatus.CANCELLED)
+        if not cancelled:
+            return False
+
+        self.status = UserRequestStatus.CANCELLED
+        self.__status_changed(notify)
+        if core_config.WORKER_MODE == 'EMBEDDED':
+            BugExMonitor.Instance().cancel_request(self)
+        return True
+
+    def update_status(self, new_status, notify=True):
         """
         Updates the status of this user request and saves itself to the
         database.
 
         Also triggers notification of the user.
 
+        A cancelled request keeps its status, unless it is deleted, and the
+        user is only notified of the cancellation once (by cancel()).
+
         Arguments:
         new_status  -- the new status of the request (see UserRequestStatus)
+        notify      -- whether the user is notified (not needed, if the user
+                       is notified of several requests at once)
         """
+        if new_status != UserRequestStatus.DELETED and \
+                UserRequest.objects.filter(
+                    pk=self.pk, status=UserRequestStatus.CANCELLED).exists():
+            self.status = UserRequestStatus.CANCELLED
+            return
+
         self.status = new_status
         self.save()
+        self.__status_changed(notify)
+
+    def __status_changed(self, notify=True):
+        """
+        Marks the job of this request as done, if the new status is final,
+        and notifies the user.
+        """
         print 'Status of {0} changed to: {1}'.format(
             self.token, UserRequestStatus.const_name(self.status))
 
-        notifier = EmailNotifier()
-        notifier.notify_user(self)
+        if self.status in UserRequest.FINAL_STATUSES:
+            BugExJob.objects.filter(user_request=self).exclude(
+                state=BugExJobState.DONE).update(
+                state=BugExJobState.DONE, updated_at=datetime.now())
+
+        if notify:
+            notifier = EmailNotifier()
+            notifier.notify_user(self)
+
+
+def request_relative_folder(user, token):
+    """
+    Returns the folder of a user request with the given token, relative to
+    MEDIA_ROOT.
+
+    Arguments:
+    user  -- the user who submitted the request
+    token -- the token of the request
+
+    """
+    return os.path.join('user_{0}'.format(user.id), token)
 
 
 def archive_file_path(instance, filename):
@@ -314,6 +530,27 @@ class CodeArchive(models.Model):
         choices=EXTENSIONS,
         help_text='The format of this archive (either *.jar or *.zip)'
     )
+    content_hash = models.CharField(
+        max_length=40,
+        blank=True,
+        db_index=True,
+        help_text='The SHA-1 hash of the content of this archive.'
+    )
+    class_count = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+        help_text='The number of class files in this archive.'
+    )
+    source_lines = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+        help_text='The number of lines of the source files in this archive.'
+    )
+    content_size = models.BigIntegerField(
+        blank=True,
+        null=True,
+        help_text='The uncompressed size of this archive in bytes.'
+    )
 
     def __unicode__(self):
         """Return a unicode representation for a CodeArchive model object."""
@@ -330,28 +567,66 @@ class CodeArchive(models.Model):
         return os.path.join(settings.MEDIA_ROOT, self.archive_file.name)
 
     @property
-    def absolute_extracted_path(self):
+    def archive_basename(self):
+        """Returns the base name of the code archive without its extension."""
+        return os.path.splitext(os.path.basename(self.archive_file.name))[0]
+
+    def delete(self, *args, **kwargs):
         """
-        Returns the absolute path to the extracted archive.
+        Deletes this code archive together with its folders and files and
+        releases the source contents referenced by its source files.
+        """
+        content_ids = list(self.sourcefile_set.exclude(
+            source_content=None).values_list('source_content', flat=True))
+        super(CodeArchive, self).delete(*args, **kwargs)
+        SourceContent.release(content_ids)
 
+    def previous_version(self):
+        """
+        Returns the most recent other code archive with the same name that
+        the same user has uploaded and that has been stored completely, or
+        None if there is none.
         """
-        return self.user_request._build_path(self.archive_basename)
+        # archives are stored in a folder per request (see archive_file_path)
+        candidates = CodeArchive.objects.filter(
+            user_request__user=self.user_request.user,
+            user_request__status__in=[UserRequestStatus.VALID,
+                                      UserRequestStatus.PROCESSING,
+                                      UserRequestStatus.FAILED,
+                                      UserRequestStatus.FINISHED],
+            archive_file__endswith='/' + self.name
+            ).exclude(pk=self.pk).order_by('-user_request__date', '-pk')[:1]
+        if candidates:
+            return candidates[0]
+        return None
 
-    @property
-    def archive_basename(self):
-        """Returns the base name of the code archive without its extension."""
-        return os.path.splitext(os.path.basename(self.archive_file.name))[0]
+    @staticmethod
+    def hash_file(archive_file):
+        """
+        Returns the SHA-1 hex digest of an uploaded archive file.
+
+        Arguments:
+        archive_file -- the uploaded file (user archive)
 
-    def traverse(self):
-        # ok, lets create the root folder
-        root_folder = Folder.objects.create(
-                # the name of the root folder does not really matter..
-                name = self.archive_basename,
-                parent_folder = None,
-                code_archive = self)
+        """
+        content_hash = hashlib.sha1()
+        for chunk in archive_file.chunks():
+            content_hash.update(chunk)
+        return content_hash.hexdigest()
 
-        # easy enough, now let it traverse itself
-        root_folder.traverse()
+    def traverse(self, archive):
+        """
+        Creates the folder structure and the source and class files of this
+        code archive straight from the entries of the zip archive. Nothing is
+        extracted to disk.
+
+        Arguments:
+        archive -- the opened ZipFile of this code archive
+
+        """
+        # defered import to avoid circular dependency problems
+        from bugex_webapp.core_modules.bugex_ingest import ArchiveIngest
+        ArchiveIngest(self).run(archive)
 
 
 class TestCase(models.Model):
@@ -370,6 +645,330 @@ class TestCase(models.Model):
         return u'{0}'.format(self.name)
 
 
+class BugExJob(models.Model):
+    """The BugExJob model.
+
+    The BugExJob model records the processing state of a single UserRequest,
+    so requests that were left unfinished by a restart of the server can be
+    recovered (see BugExMonitor.recover()).
+    """
+    user_request = models.OneToOneField('UserRequest',
+        help_text='The user request processed by this job.'
+    )
+    state = models.PositiveIntegerField(
+        default=BugExJobState.QUEUED,
+        db_index=True,
+        help_text='The state of this job (see BugExJobState).'
+    )
+    attempts = models.PositiveIntegerField(
+        default=0,
+        help_text='The number of times BugEx has been started for this job.'
+    )
+    pid = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+        help_text='The process id of the running BugEx process.'
+    )
+    host = models.CharField(
+        max_length=255,
+        blank=True,
+        help_text='The host the BugEx process is running on.'
+    )
+    owner = models.CharField(
+        max_length=255,
+        blank=True,
+        help_text='The server process (<host>:<pid>) processing this job.'
+    )
+    queued_at = models.DateTimeField(
+        auto_now_add=True,
+        help_text='The date when this job was created.'
+    )
+    started_at = models.DateTimeField(
+        blank=True,
+        null=True,
+        help_text='The date when BugEx has been started the last time.'
+    )
+    deadline = models.DateTimeField(
+        blank=True,
+        null=True,
+        help_text='The date when the running BugEx process will be killed.'
+    )
+    updated_at = models.DateTimeField(
+        default=datetime.now,
+        help_text='The date of the last change of this job.'
+    )
+    worker = models.CharField(
+        max_length=255,
+        blank=True,
+        help_text='The standalone worker that has claimed this job.'
+    )
+    lease_expires = models.DateTimeField(
+        blank=True,
+        null=True,
+        help_text='The date when the claim of the worker expires, unless ' \
+                  'it is renewed.'
+    )
+    run_time = models.FloatField(
+        blank=True,
+        null=True,
+        help_text='The seconds the last BugEx process has been running.'
+    )
+    cpu_time = models.FloatField(
+        blank=True,
+        null=True,
+        help_text='The CPU seconds (user and system) used by the last ' \
+                  'BugEx process, or by the running one so far.'
+    )
+    heartbeat_at = models.DateTimeField(
+        blank=True,
+        null=True,
+        db_index=True,
+        help_text='The date of the last heartbeat of the running job.'
+    )
+    progress_at = models.DateTimeField(
+        blank=True,
+        null=True,
+        help_text='The date when the running BugEx process was last seen ' \
+                  'using CPU time.'
+    )
+    max_rss = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+        help_text='The maximum resident set size of the last BugEx process ' \
+                  'in kilobytes.'
+    )
+    blocks_read = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+        help_text='The number of blocks read by the last BugEx process.'
+    )
+    blocks_written = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+        help_text='The number of blocks written by the last BugEx process.'
+    )
+
+    # maximum number of candidates looked at by claim_next()
+    CLAIM_CANDIDATES = 10
+
+    def __unicode__(self):
+        """Return a unicode representation for a BugExJob model object."""
+        return u'{0}: {1}'.format(self.user_request.token,
+                                  BugExJobState.const_name(self.state))
+
+    @staticmethod
+    def mark_running(user_request, pid, life_time):
+        """
+        Records that BugEx has been started for a user request.
+
+        Arguments:
+        user_request -- the user request BugEx is running for
+        pid          -- the process id of the BugEx process
+        life_time    -- the maximum life time of the process in seconds
+        """
+        now = datetime.now()
+        BugExJob.objects.filter(user_request=user_request).update(
+            state=BugExJobState.RUNNING,
+            attempts=F('attempts') + 1,
+            pid=pid,
+            host=socket.gethostname(),
+            owner=BugExJob.current_owner(),
+            started_at=now,
+            deadline=now + timedelta(seconds=life_time),
+            updated_at=now,
+            heartbeat_at=now,
+            progress_at=now,
+            cpu_time=None)
+
+    @staticmethod
+    def heartbeat(user_request, pid, cpu_time):
+        """
+        Records that the job of a user request is still being monitored,
+        and whether its BugEx process has made progress, i.e. used CPU time,
+        since the last heartbeat.
+
+        Arguments:
+        user_request -- the user request BugEx is running for
+        pid          -- the process id of the BugEx process
+        cpu_time     -- the CPU seconds used by the process so far, None if
+                        unknown (which counts as progress)
+        """
+        now = datetime.now()
+        jobs = BugExJob.objects.filter(user_request=user_request,
+                                       state=BugExJobState.RUNNING)
+        if cpu_time is None:
+            jobs.update(heartbeat_at=now, progress_at=now, pid=pid)
+            return
+        jobs.filter(models.Q(cpu_time__isnull=True) |
+                    models.Q(cpu_time__lt=cpu_time)).update(progress_at=now)
+        jobs.update(heartbeat_at=now, pid=pid, cpu_time=cpu_time)
+
+    @staticmethod
+    def stalled(heartbeat_timeout, progress_timeout):
+        """
+        Returns the running jobs without a heartbeat for `heartbeat_timeout`
+        seconds, or whose BugEx process has not used CPU time for
+        `progress_timeout` seconds.
+        """
+        now = datetime.now()
+        return BugExJob.objects.filter(
+            models.Q(heartbeat_at__lt=now - timedelta(
+                seconds=heartbeat_timeout)) |
+            models.Q(progress_at__lt=now - timedelta(
+                seconds=progress_timeout)),
+            state=BugExJobState.RUNNING).select_related('user_request')
+
+    @staticmethod
+    def mark_queued(user_request):
+        """
+        Records that a user request waits for BugEx again, e.g. to retry a
+        failed run.
+        """
+        BugExJob.objects.filter(user_request=user_request).update(
+            state=BugExJobState.QUEUED,
+            pid=None,
+            deadline=None,
+            heartbeat_at=None,
+            progress_at=None,
+            updated_at=datetime.now())
+
+    @staticmethod
+    def record_run(user_request, run_time, usage=None):
+        """
+        Records the run time of the BugEx process of a user request and the
+        resources it has used.
+
+        Arguments:
+        user_request -- the user request BugEx has been running for
+        run_time     -- the seconds the process has been running
+        usage        -- the resource usage of the process, as returned by
+                        os.wait4() (optional)
+        """
+        values = dict(run_time=run_time)
+        if usage is not None:
+            values.update(
+                cpu_time=usage.ru_utime + usage.ru_stime,
+                max_rss=usage.ru_maxrss,
+                blocks_read=usage.ru_inblock,
+                blocks_written=usage.ru_oublock)
+        BugExJob.objects.filter(user_request=user_request).update(**values)
+
+    @staticmethod
+    def current_owner():
+        """Returns the owner name of this process, i.e. <host>:<pid>."""
+        return '{0}:{1}'.format(socket.gethostname(), os.getpid())
+
+    def owner_gone(self):
+        """
+        Returns whether the server process that owns this job has exited,
+        e.g. because it has been recycled, so the job can be recovered.
+
+        Only processes on this host can be checked: jobs owned by processes
+        on other hosts are recovered by the reaper as soon as their heartbeat
+        stops (see BugExMonitor.reap_stalled()). A job owned by a process
+        with the id of this process belongs to an earlier process, since
+        recovery runs before this process takes any jobs.
+        """
+        if not self.owner:
+            return True
+        host, _, pid = self.owner.rpartition(':')
+        if host != socket.gethostname():
+            return False
+        return int(pid) == os.getpid() or not process_alive(int(pid))
+
+    def claim(self):
+        """
+        Claims this job for recovery by this process. Only succeeds, if the
+        job has not been changed since it was loaded, so the same job can not
+        be recovered twice, e.g. by several server processes.
+
+        Returns True, if the job has been claimed.
+        """
+        now = datetime.now()
+        owner = BugExJob.current_owner()
+        claimed = BugExJob.objects.filter(
+            pk=self.pk, updated_at=self.updated_at).update(
+            updated_at=now, owner=owner)
+        if claimed:
+            self.updated_at = now
+            self.owner = owner
+        return claimed == 1
+
+    @staticmethod
+    def claim_next(worker, lease_time):
+        """
+        Claims the oldest unfinished job that has not been claimed by a
+        worker yet, or whose lease has expired, e.g. because its worker died.
+
+        The job is claimed with a conditional UPDATE, so several workers
+        (even on different hosts) never claim the same job. A request for
+        additional test cases that still waits for its archive is not claimed
+        on its own, but together with its archive request.
+
+        Returns the claimed job, or None if there is none.
+
+        Arguments:
+        worker     -- the name of the worker
+        lease_time -- the seconds the claim lasts, unless it is renewed
+        """
+        now = datetime.now()
+        owner = BugExJob.current_owner()
+        candidates = BugExJob.objects.exclude(
+            state=BugExJobState.DONE).filter(
+            models.Q(worker='') | models.Q(lease_expires__lt=now)).exclude(
+            user_request__archive_request__isnull=False,
+            user_request__status__in=[UserRequestStatus.PENDING,
+                                      UserRequestStatus.VALIDATING]
+            ).select_related('user_request').order_by('queued_at')
+
+        for job in candidates[:BugExJob.CLAIM_CANDIDATES]:
+            lease_expires = now + timedelta(seconds=lease_time)
+            claimed = BugExJob.objects.filter(
+                pk=job.pk, updated_at=job.updated_at).update(
+                worker=worker, lease_expires=lease_expires, updated_at=now,
+                owner=owner)
+            if not claimed:
+                # claimed by another worker in the meantime
+                continue
+
+            job.worker = worker
+            job.lease_expires = lease_expires
+            job.updated_at = now
+            job.owner = owner
+            if job.user_request.status in (UserRequestStatus.PENDING,
+                                           UserRequestStatus.VALIDATING):
+                # take the requests for additional test cases along
+                BugExJob.objects.filter(
+                    user_request__archive_request=job.user_request).update(
+                    worker=worker, lease_expires=lease_expires,
+                    updated_at=now, owner=owner)
+            return job
+        return None
+
+    @staticmethod
+    def renew_leases(worker, lease_time):
+        """
+        Renews the leases of all unfinished jobs claimed by a worker.
+
+        Returns the number of these jobs.
+        """
+        now = datetime.now()
+        return BugExJob.objects.filter(worker=worker).exclude(
+            state=BugExJobState.DONE).update(
+            lease_expires=now + timedelta(seconds=lease_time),
+            updated_at=now)
+
+    @property
+    def remaining_life_time(self):
+        """
+        Returns the seconds until the deadline of the job, or None if there
+        is no deadline.
+        """
+        if self.deadline is None:
+            return None
+        return max((self.deadline - datetime.now()).total_seconds(), 0)
+
+
 class BugExResult(models.Model):
     """The BugExResult model.
 
@@ -381,63 +980,222 @@ class BugExResult(models.Model):
         verbose_name='date of creation',
         help_text='The date when this BugEx result was created.'
     )
+    bugex_version = models.CharField(
+        max_length=40,
+        blank=True,
+        help_text='The version of the BugEx executable that created this ' \
+                  'result.'
+    )
+    complete = models.BooleanField(
+        default=True,
+        help_text='Whether BugEx has finished this result. Incomplete ' \
+                  'results contain the facts found so far.'
+    )
 
     def __unicode__(self):
         """Return a unicode representation for a BugExResult model object."""
         return u'{0}'.format(self.date)
 
     @staticmethod
-    def new(xml_string, user_request):
+    def start_partial(user_request, bugex_version=''):
+        """
+        Creates an incomplete result for a user request BugEx is still
+        running for, replacing an earlier incomplete result (e.g. of a failed
+        attempt). Facts are added with add_facts() as soon as BugEx reports
+        them.
+
+        Returns the result, or None if the request has been cancelled.
+
+        user_request  -- the user request this result belongs to
+        bugex_version -- the version of the BugEx executable (optional)
+        """
+        be_res = BugExResult.objects.create(bugex_version=bugex_version,
+                                            complete=False)
+        if not BugExResult._replace(user_request, be_res):
+            return None
+        return be_res
+
+    def add_facts(self, facts):
+        """
+        Adds facts to this (incomplete) result. Facts with missing fields are
+        skipped.
+
+        Returns the number of facts added.
+
+        facts -- the facts as dicts, mapping the tags of the child elements
+                 of a fact node to their texts
+        """
+        log = logging.getLogger(__name__)
+        new_facts = list()
+        for fields in facts:
+            try:
+                new_facts.append(Fact.from_fields(fields, bugex_result=self))
+            except Exception as e:
+                log.info('Skipped incomplete fact %s: %s', fields, e)
+        Fact.objects.bulk_create(new_facts)
+        return len(new_facts)
+
+    @staticmethod
+    def _replace(user_request, be_res):
+        """
+        Associates a result with a user request and deletes the incomplete
+        result the request had before, if any.
+
+        Only the result of the request is updated, so a status changed
+        meanwhile is kept. If the request has been cancelled or deleted
+        meanwhile, the result is deleted instead and False is returned.
+        """
+        updated = UserRequest.objects.filter(pk=user_request.pk).exclude(
+            status__in=[UserRequestStatus.CANCELLED,
+                        UserRequestStatus.DELETED]).update(result=be_res)
+        if not updated:
+            be_res.delete()
+            return False
+
+        previous = user_request.result
+        user_request.result = be_res
+        if previous is not None and not previous.complete:
+            previous.delete()
+        return True
+
+    @staticmethod
+    def new(xml_file, user_request, bugex_version=''):
         """
         Creates a new instance of BugExResult.
 
-        xml_string -- a string containing the xml output of BugEx
+        The xml output is parsed incrementally and the facts are written in
+        batches of core_config.RESULT_BATCH_SIZE, so the memory needed does
+        not depend on the size of the output. The result and all of its facts
+        are stored in a single transaction: if the output is not valid or a
+        fact is malformed, nothing is stored.
+
+        xml_file      -- the file name or file object of the xml output of
+                         BugEx
+        user_request  -- the user request this result belongs to
+        bugex_version -- the version of the BugEx executable (optional)
         """
-        try:
-            facts = BugExResult._parse_xml(xml_string)
-        except Exception:
-            #re-raise any exceptions raised during xml parsing
-            raise
-        else:
-            #instantiate a BugExResult and save all corresponding Facts
-            #setting the ForeignKey field of each Fact properly
-            be_res = BugExResult.objects.create()
-            user_request.result = be_res
-            user_request.save()
-            #be_res.save()
-            for f in facts:
-                f.bugex_result = be_res
-                f.save()
+        with transaction.commit_on_success():
+            be_res = BugExResult.objects.create(bugex_version=bugex_version)
+
+            facts = list()
+            for number, fields in BugExResult._parse_xml(xml_file):
+                try:
+                    facts.append(Fact.from_fields(fields, bugex_result=be_res))
+                except Exception as e:
+                    raise ValueError('Fact {0} is malformed ({1}: {2}).'.format(
+                        number, type(e).__name__, e))
+                if len(facts) >= core_config.RESULT_BATCH_SIZE:
+                    Fact.objects.bulk_create(facts)
+                    facts = list()
+            Fact.objects.bulk_create(facts)
+
+            # replaces the partial result, if there is one
+            BugExResult._replace(user_request, be_res)
 
     @staticmethod
-    def _parse_xml(xml_string):
-        """Parse the xml string and if parse is successful create Facts."""
-        facts = []
+    def copy_cached(user_request, bugex_version):
+        """
+        Looks for a finished request with the same archive content and test
+        case, whose result was created by the given BugEx version. If there is
+        one, a copy of its result is associated with the user request.
+
+        Returns True, if a cached result has been copied.
+
+        user_request  -- the user request to find a cached result for
+        bugex_version -- the version of the BugEx executable
+        """
+        content_hash = user_request.code_archive.content_hash
+        if not content_hash or not bugex_version:
+            return False
+
+        # the archive may also be shared with an archive request
+        cached_results = BugExResult.objects.filter(
+            models.Q(userrequest__codearchive__content_hash=content_hash) |
+            models.Q(userrequest__archive_request__codearchive__content_hash=
+                     content_hash),
+            userrequest__status=UserRequestStatus.FINISHED,
+            userrequest__test_case__name=user_request.test_case.name,
+            bugex_version=bugex_version
+            ).exclude(userrequest__pk=user_request.pk).order_by('-date')[:1]
+        if not cached_results:
+            return False
 
         try:
-            #parse xml string and extract fact nodes
-            facts_xml = fromstring(xml_string).findall(XMLNode.FACT)
+            cached_results[0].copy(user_request)
+        except BugExResult.DoesNotExist:
+            # deleted together with its request meanwhile
+            return False
+        return True
 
-            #create a Fact for each fact node in the xml file only if all
-            #required information about the fact was found in the xml tree
-            for f in facts_xml:
-                try:
-                    my_fact = Fact(
-                        class_name=f.find(XMLNode.CLASS).text.strip(),
-                        method_name=f.find(XMLNode.METHOD).text.strip(),
-                        line_number=int(f.find(XMLNode.LINE).text.strip()),
-                        explanation=f.find(XMLNode.EXPL).text.strip(),
-                        fact_type=f.find(XMLNode.TYPE).text.strip()[-1])
-                except Exception:
-                    #nodes are missing
-                    raise
-                else:
-                    facts.append(my_fact)
-        except Exception:
-            #xml string is empty or not valid
-            raise
-        else:
-            return facts
+    def copy(self, user_request, complete=True):
+        """
+        Creates a copy of this result and all of its facts and associates it
+        with the given user request, replacing its incomplete result, if it
+        has one.
+
+        Returns the copy, or None if the request has been cancelled. Raises
+        BugExResult.DoesNotExist, if this result has been deleted meanwhile,
+        e.g. together with its request.
+
+        user_request -- the user request to associate the copy with
+        complete     -- whether the copy is complete (see start_partial())
+        """
+        be_res = BugExResult.objects.create(bugex_version=self.bugex_version,
+                                            complete=complete)
+        Fact.objects.bulk_create([
+            Fact(bugex_result=be_res, class_name=f.class_name,
+                 method_name=f.method_name, line_number=f.line_number,
+                 explanation=f.explanation, fact_type=f.fact_type)
+            for f in self.fact_set.all()])
+        # results are deleted in one transaction, so the facts are complete,
+        # unless the result is gone now
+        if not BugExResult.objects.filter(pk=self.pk).exists():
+            be_res.delete()
+            raise BugExResult.DoesNotExist(
+                'BugExResult {0} has been deleted.'.format(self.pk))
+        if not BugExResult._replace(user_request, be_res):
+            return None
+        return be_res
+
+    @staticmethod
+    def discard_partial(user_request):
+        """
+        Deletes the incomplete result of a user request, if it has one, e.g.
+        because BugEx failed or the request has been cancelled.
+        """
+        BugExResult.objects.filter(
+            userrequest__pk=user_request.pk, complete=False).delete()
+        if (user_request.result_id is not None and not
+                BugExResult.objects.filter(
+                    pk=user_request.result_id).exists()):
+            user_request.result = None
+
+    @staticmethod
+    def _parse_xml(xml_file):
+        """
+        Parses the xml output of BugEx incrementally and yields a tuple of
+        the number (starting at 1) and the fields of every fact node, as dict
+        mapping the tags of its child elements to their texts.
+
+        Every fact node is removed from the tree as soon as it has been
+        processed, so only the current fact is kept in memory. Raises a
+        ParseError, which tells the position, if the xml is not valid.
+        """
+        number = 0
+        parents = list()    # the open elements, the innermost last
+        for event, elem in iterparse(xml_file, events=('start', 'end')):
+            if event == 'start':
+                parents.append(elem)
+                continue
+
+            parents.pop()
+            if elem.tag == 'fact':
+                number += 1
+                yield number, dict((child.tag, child.text) for child in elem)
+                # drop the processed fact
+                elem.clear()
+                if parents:
+                    parents[-1].remove(elem)
 
     class Meta:
         """Inner class providing metadata options to the OutlineElement model."""
@@ -478,6 +1236,25 @@ class Fact(models.Model):
         help_text='The type of this fact.'
     )
 
+    @staticmethod
+    def from_fields(fields, **kwargs):
+        """
+        Creates an (unsaved) Fact from the fields of a fact node of the xml
+        output of BugEx. Raises an exception, if fields are missing or
+        invalid.
+
+        fields -- a dict mapping the tags of the child elements of the fact
+                  node to their texts
+        kwargs -- further field values of the Fact, e.g. bugex_result
+        """
+        return Fact(
+            class_name=fields[XMLNode.CLASS].strip(),
+            method_name=fields[XMLNode.METHOD].strip(),
+            line_number=int(fields[XMLNode.LINE].strip()),
+            explanation=fields[XMLNode.EXPL].strip(),
+            fact_type=fields[XMLNode.TYPE].strip()[-1],
+            **kwargs)
+
     def __unicode__(self):
         """Return a unicode representation for a Fact model object."""
         return u'type {0}, class {1}, line {2}'.format(
@@ -510,18 +1287,6 @@ class Folder(models.Model):
             return True
         return False
 
-    @property
-    def absolute_path(self):
-        if self.is_root_folder:
-            # just use absolute extracted path
-            return self.code_archive.absolute_extracted_path
-        else:
-            # recursively build path from parent
-            return os.path.join(
-                self.parent_folder.absolute_path,
-                self.name)
-
-
     def _get_path_elements(self, my_path):
         """Returns the current and parent folder names of a specified path.
 
@@ -533,33 +1298,6 @@ class Folder(models.Model):
         return parent_f, this_f
 
 
-    def traverse(self):
-        """Traverses the folder and creates appropriate File objects."""
-        for f in os.listdir(self.absolute_path):
-            f_path = os.path.join(self.absolute_path, f)
-            #if f_path points to a class or java file, create it
-            if os.path.isfile(f_path):
-                ext = os.path.splitext(f)[1][1:].strip()
-                if ext == 'java':
-                    try:
-                        SourceFile.new(code_archive=self.code_archive, name=f,
-                        folder=self, path=f_path)
-                    except Exception as e:
-                        print e
-                        #if something goes wring during SourceFile creation,
-                        #change UserRequest status to INVALID
-                elif ext == 'class':
-                    ClassFile.objects.create(code_archive=self.code_archive,
-                        folder=self, name=f)
-            else:
-                #current file is a folder, continue traversing
-                child = Folder.objects.create(
-                            name = f,
-                            code_archive = self.code_archive,
-                            parent_folder = self)
-                child.traverse()
-
-
 class ProjectFile(models.Model):
     """The ProjectFile model.
 
@@ -578,6 +1316,16 @@ class ProjectFile(models.Model):
         blank=True,
         help_text='The folder that this project file resides in.'
     )
+    crc = models.BigIntegerField(
+        blank=True,
+        null=True,
+        help_text='The CRC-32 of this project file, as stored in the archive.'
+    )
+    size = models.BigIntegerField(
+        blank=True,
+        null=True,
+        help_text='The uncompressed size of this project file in bytes.'
+    )
 
     class Meta:
         """Inner class providing metadata options to the ProjectFile model."""
@@ -609,32 +1357,41 @@ class SourceFile(ProjectFile):
         help_text='The class element associated with this source file.'
     )
 
+    source_content = models.ForeignKey('SourceContent',
+        blank=True,
+        null=True,
+        on_delete=models.PROTECT,
+        help_text='The (shared) content of this source file ' \
+                  '(BLOB source storage only).'
+    )
+
+    line_count = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+        help_text='The number of lines of this source file.'
+    )
+
     @staticmethod
-    def new(code_archive, name, path, folder):
+    def parse(source):
         """
-        Creates a new SourceFile object, parses its lines and stores everything
-        to database.
+        Parses the lines of a Java source file and extracts its package name.
 
-        Raises an IOError, if the file can not be opened.
-        """
-        source_file = SourceFile.objects.create(
-                code_archive=code_archive,
-                name=name,
-                folder=folder)
+        Returns a tuple of the package name (or None) and the list of lines,
+        without trailing whitespace.
 
-        print 'Parsing {0}..'.format(path)
+        Arguments:
+        source -- a file-like object providing the content of the file
+        """
+        package = None
+        lines = []
 
-        # read and store lines and extract package name
-        for number, line in enumerate(open(path).readlines(), 1):
-            Line.objects.create(
-                source_file=source_file,
-                number=number,
-                content=line.rstrip())
+        # read lines and extract package name
+        for line in source:
+            lines.append(line.rstrip())
             if line.startswith('package'):
-                source_file.package = re.search('package +(.+);', line).group(1)
-
-        source_file.save()
+                package = re.search('package +(.+);', line).group(1)
 
+        return package, lines
 
     def __unicode__(self):
         """Return a unicode representation for a SourceFile model object."""
@@ -645,8 +1402,204 @@ class SourceFile(ProjectFile):
         """
         Return a string representation of the content of a SourceFile
         """
+        if self.source_content_id:
+            return self.source_content.source.content
         return '\n'.join([line.content for line in self.line_set.order_by('number')])
 
+    def line(self, number):
+        """
+        Returns the content of a single line of this source file.
+
+        Raises an IndexError, if there is no such line.
+
+        Arguments:
+        number -- the line number, starting at 1
+        """
+        lines = self.lines(number, number)
+        if not lines:
+            raise IndexError('{0} has no line {1}'.format(self.name, number))
+        return lines[0]
+
+    def lines(self, first, last):
+        """
+        Returns a list of the lines from first to last (both inclusive).
+
+        Arguments:
+        first -- the number of the first line, starting at 1
+        last  -- the number of the last line
+        """
+        if self.source_content_id:
+            return self.source_content.source.lines(first, last)
+        return [line.content for line in self.line_set.filter(
+            number__range=(first, last)).order_by('number')]
+
+
+
+class SourceContent(models.Model):
+    """The SourceContent model.
+
+    The SourceContent model represents the content of one or more Java source
+    files with identical content, stored as compressed blob with a line offset
+    index. It is identified by the SHA-1 hash of the content and counts the
+    source files referencing it, so it can be shared across code archives.
+    """
+    content_hash = models.CharField(
+        max_length=40,
+        unique=True,
+        help_text='The SHA-1 hash of this content.'
+    )
+    blob = models.TextField(
+        help_text='The compressed content.'
+    )
+    line_offsets = models.TextField(
+        help_text='The start offsets of the lines of the content.'
+    )
+    references = models.PositiveIntegerField(
+        default=0,
+        help_text='The number of source files referencing this content.'
+    )
+
+    # maximum number of values in a single `__in` lookup
+    LOOKUP_SIZE = 500
+
+    def __unicode__(self):
+        """Return a unicode representation for a SourceContent model object."""
+        return u'{0}'.format(self.content_hash)
+
+    @property
+    def source(self):
+        """Returns the (cached) CompressedSource of this content."""
+        if not hasattr(self, '_source'):
+            self._source = CompressedSource(self.blob, self.line_offsets)
+        return self._source
+
+    @staticmethod
+    def acquire(sources):
+        """
+        Stores the contents of a list of source files, or references the
+        already stored ones with the same content, and counts one reference
+        per source file.
+
+        Returns the list of SourceContent ids, in the order of the sources.
+
+        Arguments:
+        sources -- a list of source files, each given as list of its lines
+        """
+        hashes = [hashlib.sha1('\n'.join(lines)).hexdigest()
+                  for lines in sources]
+        ids = SourceContent._lookup(hashes)
+
+        # compress and store contents that are new
+        new_contents = dict()
+        for content_hash, lines in zip(hashes, sources):
+            if content_hash not in ids and content_hash not in new_contents:
+                blob, line_offsets = CompressedSource.pack(lines)
+                new_contents[content_hash] = SourceContent(
+                    content_hash=content_hash, blob=blob,
+                    line_offsets=line_offsets)
+        if new_contents:
+            # the failed insert is rolled back to a savepoint, so the
+            # enclosing transaction stays usable (e.g. on MySQL/InnoDB)
+            savepoint = transaction.savepoint()
+            try:
+                SourceContent.objects.bulk_create(new_contents.values())
+                transaction.savepoint_commit(savepoint)
+            except IntegrityError:
+                transaction.savepoint_rollback(savepoint)
+                # some of them have been stored concurrently, skip those
+                stored = SourceContent._lookup(new_contents.keys())
+                for content_hash, content in new_contents.items():
+                    if content_hash not in stored:
+                        SourceContent._insert(content)
+            ids.update(SourceContent._lookup(new_contents.keys()))
+
+        content_ids = [ids[content_hash] for content_hash in hashes]
+        SourceContent.reference(content_ids)
+        return content_ids
+
+    @staticmethod
+    def _insert(content):
+        """
+        Stores a single content, unless one with the same hash has been
+        stored concurrently.
+        """
+        savepoint = transaction.savepoint()
+        try:
+            content.save()
+            transaction.savepoint_commit(savepoint)
+        except IntegrityError:
+            transaction.savepoint_rollback(savepoint)
+
+    @staticmethod
+    def reference(content_ids):
+        """
+        Counts one reference per given id.
+
+        Arguments:
+        content_ids -- a list of SourceContent ids, one per new reference
+        """
+        # grouped by the number of new references
+        counts = defaultdict(list)
+        for content_id, count in Counter(content_ids).items():
+            counts[count].append(content_id)
+        for count, ids in counts.items():
+            for i in range(0, len(ids), SourceContent.LOOKUP_SIZE):
+                SourceContent.objects.filter(
+                    pk__in=ids[i:i + SourceContent.LOOKUP_SIZE]
+                    ).update(references=F('references') + count)
+
+    @staticmethod
+    def lock(content_ids):
+        """
+        Returns the set of the given ids whose contents are still stored.
+
+        The contents are locked until the end of the transaction, so they can
+        not be released concurrently.
+        """
+        content_ids = list(set(content_ids))
+        stored = set()
+        for i in range(0, len(content_ids), SourceContent.LOOKUP_SIZE):
+            stored.update(SourceContent.objects.select_for_update().filter(
+                pk__in=content_ids[i:i + SourceContent.LOOKUP_SIZE]
+                ).values_list('id', flat=True))
+        return stored
+
+    @staticmethod
+    def release(content_ids):
+        """
+        Drops one reference per given id and deletes contents that are not
+        referenced anymore.
+
+        Arguments:
+        content_ids -- a list of SourceContent ids, one per released reference
+        """
+        for content_id, count in Counter(content_ids).items():
+            SourceContent.objects.filter(pk=content_id).update(
+                references=F('references') - count)
+
+        unique_ids = list(set(content_ids))
+        for i in range(0, len(unique_ids), SourceContent.LOOKUP_SIZE):
+            SourceContent.objects.filter(
+                pk__in=unique_ids[i:i + SourceContent.LOOKUP_SIZE],
+                references__lte=0).delete()
+
+    @staticmethod
+    def _lookup(hashes):
+        """
+        Returns a dictionary mapping the given content hashes to the ids of
+        the stored contents, for all contents that are stored already.
+
+        The contents are locked until the end of the transaction, so they can
+        not be released concurrently.
+        """
+        hashes = list(set(hashes))
+        ids = dict()
+        for i in range(0, len(hashes), SourceContent.LOOKUP_SIZE):
+            ids.update(SourceContent.objects.select_for_update().filter(
+                content_hash__in=hashes[i:i + SourceContent.LOOKUP_SIZE]
+                ).values_list('content_hash', 'id'))
+        return ids
+
 
 class ClassFile(ProjectFile):
     """The ClassFile model.
@@ -14,3 +14,5 @@ Authors: Amir Baradaran
 from model_tests import *
 from view_tests import *
 from validator_tests import *
+from upload_handler_tests import *
+from core_module_tests import *
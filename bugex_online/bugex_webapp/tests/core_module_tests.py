@@ -0,0 +1,709 @@
+# -*- coding: utf-8 -*-
+
+"""
+Project: BugEx Online
+Authors: Amir Baradaran
+         Tim Krones
+         Frederik Leonhardt
+         Christos Monogios
+         Akmal Qodirov
+         Iliana Simova
+         Peter Stahl
+"""
+
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import threading
+import time
+from StringIO import StringIO
+from zipfile import ZipFile
+
+from django.test import TestCase
+
+from bugex_webapp.models import CodeArchive, SourceContent, UserRequest
+from bugex_webapp.core_modules import core_config
+from bugex_webapp.core_modules.bugex_blob import CompressedSource
+from bugex_webapp.core_modules.bugex_failure import classify_failure
+from bugex_webapp.core_modules.bugex_files import BoundedLogWriter
+from bugex_webapp.core_modules.bugex_files import BugExLogFile
+from bugex_webapp.core_modules.bugex_files import BugExResultFile
+from bugex_webapp.core_modules.bugex_files import ResultFileFollower
+from bugex_webapp.core_modules.bugex_ingest import ArchiveIngest
+from bugex_webapp.core_modules.bugex_instance import BugExProcessInstance
+from bugex_webapp.core_modules.bugex_instance import process_cpu_time
+from bugex_webapp.core_modules.bugex_monitor import max_life_time
+from bugex_webapp.core_modules.bugex_jvm import BugExServer, BugExServerPool
+from bugex_webapp.core_modules.bugex_jvm import BugExServerError
+from bugex_webapp.core_modules.bugex_pool import PriorityWorkerPool
+from bugex_webapp.core_modules.bugex_pool import WorkerPool
+from bugex_webapp.core_modules.bugex_predictor import least_squares
+from bugex_webapp.core_modules.bugex_timer import TimerScheduler
+
+
+class ArchiveIngestTest(TestCase):
+    """
+    Tests for the ArchiveIngest, which stores code archives batch by batch
+    """
+    fixtures = ['test_data.json']
+
+    def setUp(self):
+        self.code_archive = CodeArchive.objects.get(archive_format='JAR')
+        self.code_archive.folder_set.all().delete()
+
+        buf = StringIO()
+        archive = ZipFile(buf, 'w')
+        archive.writestr('de/mypackage/MyClass.java',
+                         'package de.mypackage;\npublic class MyClass {}\n')
+        archive.writestr('de/mypackage/TestMyClass.java',
+                         'package de.mypackage;\n\nimport org.junit.Test;\n')
+        archive.writestr('de/other/Main.java', 'public class Main {}\n')
+        archive.writestr('de/mypackage/MyClass.class', '')
+        archive.writestr('de/mypackage/TestMyClass.class', '')
+        archive.close()
+        self.archive = ZipFile(buf, 'r')
+
+    def tearDown(self):
+        core_config.SOURCE_STORAGE = 'BLOB'
+
+    def test_run(self):
+        """ All records end up in the database, whatever the batch size """
+        rows = ArchiveIngest(self.code_archive, batch_size=2).run(self.archive)
+
+        # 4 folders, 3 source files and 2 class files
+        self.assertEqual(rows, 9)
+        self._check_records()
+
+    def test_run_lines(self):
+        """ The 'LINES' source storage additionally creates 6 lines """
+        core_config.SOURCE_STORAGE = 'LINES'
+        rows = ArchiveIngest(self.code_archive, batch_size=2).run(self.archive)
+
+        self.assertEqual(rows, 15)
+        self._check_records()
+
+    def _check_records(self):
+        self.assertEqual(self.code_archive.folder_set.count(), 4)
+        self.assertEqual(self.code_archive.classfile_set.count(), 2)
+
+        source_files = self.code_archive.sourcefile_set
+        self.assertEqual(
+            source_files.get(name='TestMyClass.java').content,
+            'package de.mypackage;\n\nimport org.junit.Test;')
+        self.assertEqual(
+            source_files.get(name='MyClass.java').folder.name, 'mypackage')
+        main = source_files.get(name='Main.java')
+        self.assertIsNone(main.package)
+        self.assertEqual(main.folder.name, 'other')
+        self.assertEqual(
+            source_files.get(name='MyClass.java').lines(2, 5),
+            ['public class MyClass {}'])
+
+    def test_shared_contents(self):
+        """ Identical source files share their content across archives """
+        ArchiveIngest(self.code_archive).run(self.archive)
+        other_archive = CodeArchive.objects.create(
+            user_request=UserRequest.objects.get(pk=1),
+            archive_file='user_2/other/other.jar', archive_format='JAR')
+        ArchiveIngest(other_archive).run(self.archive)
+
+        self.assertEqual(SourceContent.objects.count(), 3)
+        self.assertEqual(
+            [c.references for c in SourceContent.objects.all()], [2, 2, 2])
+
+        self.code_archive.delete()
+        self.assertEqual(
+            [c.references for c in SourceContent.objects.all()], [1, 1, 1])
+        self.assertEqual(
+            other_archive.sourcefile_set.get(name='Main.java').content,
+            'public class Main {}')
+
+        other_archive.delete()
+        self.assertEqual(SourceContent.objects.count(), 0)
+
+    def test_concurrent_contents(self):
+        """ Contents stored concurrently are referenced, not stored twice """
+        stored = SourceContent.acquire([['class A {}'], ['class B {}']])
+        lookup = SourceContent._lookup
+        # the first lookup misses the contents, as if they were stored
+        # in the meantime
+        SourceContent._lookup = staticmethod(lambda hashes: (
+            setattr(SourceContent, '_lookup', staticmethod(lookup)) or {}))
+        try:
+            ids = SourceContent.acquire(
+                [['class A {}'], ['class B {}'], ['class C {}']])
+        finally:
+            SourceContent._lookup = staticmethod(lookup)
+
+        self.assertEqual(ids[:2], stored)
+        self.assertEqual(SourceContent.objects.count(), 3)
+        self.assertEqual(SourceContent.objects.get(pk=stored[0]).references, 2)
+
+    def test_incremental(self):
+        """ Unchanged source files of the previous version are reused """
+        ArchiveIngest(self.code_archive).run(self.archive)
+
+        buf = StringIO()
+        archive = ZipFile(buf, 'w')
+        for info in self.archive.infolist():
+            if info.filename != 'de/other/Main.java':
+                archive.writestr(info, self.archive.read(info))
+        archive.writestr('de/other/Main.java', 'public class Main { }\n')
+        archive.close()
+
+        new_archive = CodeArchive.objects.create(
+            user_request=UserRequest.objects.get(pk=1),
+            archive_file='user_2/new/' + self.code_archive.name,
+            archive_format='JAR')
+        self.assertEqual(new_archive.previous_version(), self.code_archive)
+
+        new_zip = ZipFile(buf, 'r')
+        ingest = ArchiveIngest(new_archive)
+        ingest.run(new_zip)
+        self.assertEqual(ingest._reused, 2)
+
+        source_files = new_archive.sourcefile_set
+        self.assertEqual(source_files.get(name='Main.java').content,
+                         'public class Main { }')
+        self.assertEqual(source_files.get(name='MyClass.java').package,
+                         'de.mypackage')
+        self.assertEqual(
+            sorted(c.references for c in SourceContent.objects.all()),
+            [1, 1, 2, 2])
+
+        # the features include the lines of the reused files
+        new_archive = CodeArchive.objects.get(pk=new_archive.pk)
+        self.assertEqual(new_archive.class_count, 2)
+        self.assertEqual(new_archive.source_lines, 6)
+        self.assertEqual(new_archive.content_size,
+                         sum(i.file_size for i in new_zip.infolist()))
+
+        self.code_archive.delete()
+        self.assertEqual(
+            source_files.get(name='TestMyClass.java').lines(3, 3),
+            ['import org.junit.Test;'])
+
+
+class CompressedSourceTest(TestCase):
+    """
+    Tests for the CompressedSource, which stores a source file as blob
+    """
+
+    def setUp(self):
+        self.lines = ['package de.mypackage;', '', u'// \xfcber', '}']
+        self.source = CompressedSource(*CompressedSource.pack(self.lines))
+
+    def test_content(self):
+        """ The content is restored with line breaks """
+        self.assertEqual(len(self.source), 4)
+        self.assertEqual(self.source.content, u'\n'.join(self.lines))
+
+    def test_lines(self):
+        """ Single lines and line ranges are sliced from the content """
+        self.assertEqual(self.source.line(1), 'package de.mypackage;')
+        self.assertEqual(self.source.line(2), '')
+        self.assertEqual(self.source.line(4), '}')
+        self.assertEqual(self.source.lines(2, 3), self.lines[1:3])
+        self.assertEqual(self.source.lines(0, 10), self.lines)
+        self.assertEqual(self.source.lines(3, 2), [])
+        self.assertRaises(IndexError, self.source.line, 5)
+
+    def test_empty(self):
+        """ Empty files have no lines """
+        source = CompressedSource(*CompressedSource.pack([]))
+        self.assertEqual(len(source), 0)
+        self.assertEqual(source.content, '')
+
+
+class WorkerPoolTest(TestCase):
+    """
+    Tests for the WorkerPool, which limits the number of concurrent workers
+    """
+
+    def setUp(self):
+        self.pool = WorkerPool('test', 2)
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+        self.done = list()
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def work(self, number, event):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.05)
+        with self.lock:
+            self.running -= 1
+            self.done.append(number)
+        event.set()
+
+    def test_submit(self):
+        """ All items are executed, but never more than two at once """
+        events = [threading.Event() for _ in range(6)]
+        for number, event in enumerate(events):
+            self.pool.submit(self.work, number, event)
+        for event in events:
+            event.wait(5)
+
+        self.assertEqual(sorted(self.done), range(6))
+        self.assertEqual(self.max_running, 2)
+
+    def test_priority(self):
+        """ Queued items with lower priority values are executed first """
+        self.pool = PriorityWorkerPool('test', 1)
+        events = [threading.Event() for _ in range(5)]
+        # keeps the worker busy, until all other items are queued
+        self.pool.submit(0, self.work, 'first', events[0])
+        for number, priority in enumerate([3, 1, 2, 1], 1):
+            self.pool.submit(priority, self.work, number, events[number])
+        for event in events:
+            event.wait(5)
+
+        self.assertEqual(self.done, ['first', 2, 4, 3, 1])
+
+
+class TimerSchedulerTest(TestCase):
+    """
+    Tests for the TimerScheduler, which executes all timers on one thread
+    """
+
+    def setUp(self):
+        self.scheduler = TimerScheduler.Instance()
+        self.executed = list()
+        self.event = threading.Event()
+
+    def execute(self, name):
+        self.executed.append(name)
+        if name == 'last':
+            self.event.set()
+
+    def test_schedule(self):
+        """ Timers are executed in the order of their due time """
+        self.scheduler.schedule(0.2, self.execute, 'last')
+        self.scheduler.schedule(0.1, self.execute, 'second')
+        self.scheduler.schedule(0.0, self.execute, 'first')
+        canceled = self.scheduler.schedule(0.1, self.execute, 'canceled')
+        canceled.cancel()
+
+        self.assertTrue(self.event.wait(5))
+        self.assertEqual(self.executed, ['first', 'second', 'last'])
+
+    def test_schedule_periodic(self):
+        """ Periodic timers are executed until they are canceled """
+        timer = self.scheduler.schedule_periodic(0.01, self.execute, 'tick')
+        self.scheduler.schedule(0.2, self.execute, 'last')
+        self.assertTrue(self.event.wait(5))
+        timer.cancel()
+        time.sleep(0.05)
+
+        ticks = self.executed.count('tick')
+        self.assertTrue(ticks > 1)
+        time.sleep(0.05)
+        self.assertEqual(self.executed.count('tick'), ticks)
+
+    def test_cancel(self):
+        """ Canceled timers are removed from the heap """
+        pending = self.scheduler.pending
+        timers = [self.scheduler.schedule(60, self.execute, 'never')
+                  for _ in range(10)]
+        for timer in timers:
+            timer.cancel()
+        self.assertTrue(self.scheduler.pending <= pending + 1)
+
+
+# a fake `java` speaking the protocol of the BugEx server (BugExServer.java)
+FAKE_JAVA = """#!{python}
+import sys
+def respond(message):
+    sys.stdout.write('BUGEX-SERVER ' + message + '\\n')
+    sys.stdout.flush()
+respond('READY')
+for line in iter(sys.stdin.readline, ''):
+    command = line.rstrip('\\n').split('\\t')
+    if command[0] == 'PING':
+        respond('PONG')
+    elif command[0] == 'RUN':
+        sys.stdout.write('analysing ' + command[2] + '\\n')
+        respond('DONE ' + command[4])
+    elif command[0] == 'QUIT':
+        break
+"""
+
+
+class BugExServerTest(TestCase):
+    """
+    Tests for the BugExServer and its pool, which run BugEx in warm JVMs
+    """
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        java = os.path.join(self.folder, 'java')
+        with open(java, 'w') as f:
+            f.write(FAKE_JAVA.format(python=sys.executable))
+        os.chmod(java, 0755)
+        self.path = os.environ['PATH']
+        os.environ['PATH'] = self.folder + os.pathsep + self.path
+        self.pool = BugExServerPool.Instance()
+
+    def tearDown(self):
+        self.pool.shutdown()
+        os.environ['PATH'] = self.path
+        shutil.rmtree(self.folder)
+        core_config.JAVA_SERVER_MAX_JOBS = 50
+        core_config.JAVA_SERVER_TIMEOUT = 30
+
+    def test_result(self):
+        """ The output of a request ends up in its log, without responses """
+        server = BugExServer('bugex.jar')
+        self.assertTrue(server.ping(5))
+
+        log = StringIO()
+        server.submit('archive.jar', 'de.MyTest#test', '/tmp/', 3)
+        self.assertEqual(server.result(log), 3)
+        self.assertEqual(log.getvalue(), 'analysing de.MyTest#test\n')
+        self.assertEqual(server.jobs, 1)
+        server.stop()
+
+    def test_limits(self):
+        """ A server runs in its own process group, with the niceness """
+        server = BugExServer('bugex.jar')
+        with open('/proc/{0}/stat'.format(server.pid)) as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        self.assertEqual(os.getpgid(server.pid), server.pid)
+        self.assertEqual(int(fields[16]),
+                         os.nice(0) + core_config.NICENESS)
+        server.stop()
+
+    def test_start_timeout(self):
+        """ A server that does not get ready in time is killed """
+        pid_file = os.path.join(self.folder, 'pid')
+        with open(os.path.join(self.folder, 'java'), 'w') as f:
+            f.write('#!/bin/sh\necho $$ > {0}\nexec sleep 60\n'.format(
+                pid_file))
+        core_config.JAVA_SERVER_TIMEOUT = 0.5
+        self.assertRaises(BugExServerError, BugExServer, 'bugex.jar')
+        self.assertFalse(
+            os.path.exists('/proc/{0}'.format(open(pid_file).read().strip())))
+
+    def test_killed(self):
+        """ A killed server returns its exit code and is broken """
+        server = BugExServer('bugex.jar')
+        server.submit('archive.jar', 'de.MyTest#test', '/tmp/', 0)
+        server.stop(kill=True)
+        server.result(StringIO())
+        self.assertTrue(server.broken)
+        self.assertFalse(server.ping(1))
+
+    def test_pool(self):
+        """ Servers are reused until they have run enough requests """
+        core_config.JAVA_SERVER_MAX_JOBS = 2
+        server = self.pool.acquire('bugex.jar')
+        server.submit('archive.jar', 'de.MyTest#test', '/tmp/', 0)
+        server.result(StringIO())
+        self.pool.release(server)
+
+        self.assertTrue(self.pool.acquire('bugex.jar') is server)
+        server.submit('archive.jar', 'de.MyTest#test', '/tmp/', 0)
+        server.result(StringIO())
+        self.pool.release(server)
+
+        self.assertTrue(server.broken)
+        other = self.pool.acquire('bugex.jar')
+        self.assertFalse(other is server)
+        other.stop()
+
+
+class BugExProcessInstanceTest(TestCase):
+    """
+    Tests for the BugExProcessInstance, which runs BugEx as a child process
+    """
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        archive = os.path.join(self.folder, 'archive.zip')
+        ZipFile(archive, 'w').close()
+        self.path = os.environ['PATH']
+        os.environ['PATH'] = self.folder + os.pathsep + self.path
+        self.instance = BugExProcessInstance(
+            'bugex.jar', archive, 'de.MyTest#test', self.folder + '/',
+            'token')
+
+    def tearDown(self):
+        os.environ['PATH'] = self.path
+        shutil.rmtree(self.folder)
+        core_config.CPU_TIME_LIMIT = None
+        core_config.KILL_GRACE_PERIOD = 10
+        core_config.LOG_MAX_SIZE = 10 * 1024 * 1024
+        core_config.LOG_END_SIZE = 1024 * 1024
+
+    def fake_java(self, script):
+        """ Installs a shell script as `java` """
+        java = os.path.join(self.folder, 'java')
+        with open(java, 'w') as f:
+            f.write('#!/bin/sh\n' + script)
+        os.chmod(java, 0755)
+
+    def test_wait(self):
+        """ Limits are applied to the process and its usage is recorded """
+        self.fake_java('exit $(ulimit -t)\n')
+        core_config.CPU_TIME_LIMIT = 42
+        self.instance.start()
+        self.assertEqual(self.instance.wait(), 42)
+        self.assertEqual(self.instance.status, 42)
+        self.assertTrue(self.instance.resource_usage.ru_utime >= 0)
+
+    def test_log(self):
+        """ The output is copied to a bounded log through a pipe """
+        self.fake_java("echo first\nhead -c 100000 /dev/zero | tr '\\0' y\n"
+                       "echo\necho last >&2\n")
+        core_config.LOG_MAX_SIZE = 1000
+        core_config.LOG_END_SIZE = 100
+        self.instance.start()
+        self.assertEqual(self.instance.wait(), 0)
+
+        log = open(os.path.join(self.folder, 'bugex.log')).read()
+        self.assertLess(len(log), 1100)
+        self.assertIn('first', log)
+        self.assertTrue(log.endswith('yyy\nlast\n'))
+        self.assertIn('bytes omitted', self.instance.log_tail(200))
+
+    def test_kill(self):
+        """ The whole process group is killed, even if it ignores SIGTERM """
+        child = os.path.join(self.folder, 'child')
+        self.fake_java("trap '' TERM\nsleep 60 &\necho $! > {0}\n"
+                       "wait\n".format(child))
+        core_config.KILL_GRACE_PERIOD = 0.2
+        self.instance.start()
+        while not os.path.exists(child) or not open(child).read():
+            time.sleep(0.01)
+
+        self.instance.kill()
+        self.assertEqual(self.instance.wait(), -signal.SIGKILL)
+        time.sleep(0.1)
+        self.assertFalse(self.running(int(open(child).read())))
+
+    def test_cpu_time(self):
+        """ The CPU time of running processes is known """
+        self.fake_java('while :; do :; done\n')
+        self.instance.start()
+        time.sleep(0.5)
+        self.assertGreater(self.instance.cpu_time, 0)
+        self.instance.kill()
+        self.instance.wait()
+        self.assertIsNone(process_cpu_time(self.instance.pid))
+
+    def running(self, pid):
+        """ Whether a process is running (and not a zombie) """
+        try:
+            with open('/proc/{0}/stat'.format(pid)) as f:
+                return f.read().split(')')[-1].split()[0] != 'Z'
+        except IOError:
+            return False
+
+
+class MaxLifeTimeTest(TestCase):
+    """
+    Tests for the maximum life time of BugEx processes per test case
+    """
+
+    def tearDown(self):
+        core_config.TEST_CASE_LIFE_TIMES = []
+
+    def test_max_life_time(self):
+        """ The first matching pattern wins, MAX_LIFE_TIME otherwise """
+        core_config.TEST_CASE_LIFE_TIMES = [('de.slow.*', 100),
+                                            ('de.*', 10)]
+        self.assertEqual(max_life_time('de.slow.MyTest#test'), 100)
+        self.assertEqual(max_life_time('de.MyTest#test'), 10)
+        self.assertEqual(max_life_time('org.MyTest#test'),
+                         core_config.MAX_LIFE_TIME)
+
+
+class LeastSquaresTest(TestCase):
+    """
+    Tests for the least squares fit of the RuntimePredictor
+    """
+
+    def test_least_squares(self):
+        """ Exact linear relations are recovered """
+        rows = [[1.0, x, y] for x in range(5) for y in range(3)]
+        values = [10 + 3 * x - 2 * y for _, x, y in rows]
+        weights = least_squares(rows, values, 0.0)
+        for weight, expected in zip(weights, [10, 3, -2]):
+            self.assertAlmostEqual(weight, expected)
+
+    def test_singular(self):
+        """ Constant features do not break the fit """
+        rows = [[1.0, 0.0, x] for x in range(5)]
+        weights = least_squares(rows, [2 * x for x in range(5)], 0.001)
+        self.assertAlmostEqual(weights[1], 0.0)
+        self.assertAlmostEqual(weights[2], 2.0, places=2)
+
+
+class ClassifyFailureTest(TestCase):
+    """
+    Tests for the classification of failed BugEx runs
+    """
+
+    def test_signal(self):
+        """ Processes killed by the OOM killer are retried """
+        self.assertEqual(classify_failure(-signal.SIGKILL, ''),
+                         (True, 'BugEx has been killed by SIGKILL'))
+        self.assertFalse(classify_failure(-signal.SIGXCPU, '')[0])
+
+    def test_log(self):
+        """ Known transient errors in the log are retried """
+        log = 'Error: Could not reserve enough space for object heap\n'
+        self.assertTrue(classify_failure(1, log)[0])
+        self.assertTrue(classify_failure(0, 'No space left on device',
+                                         result_missing=True)[0])
+
+    def test_program_out_of_memory(self):
+        """ The program under test running out of memory is not retried """
+        log = 'Exception in thread "main" java.lang.OutOfMemoryError: heap\n'
+        self.assertFalse(classify_failure(1, log)[0])
+        self.assertTrue(classify_failure(-signal.SIGKILL, log)[0])
+
+    def test_memory_limit(self):
+        """ The JVM running out of memory is permanent with a limit """
+        log = 'Error: Could not reserve enough space for object heap\n'
+        core_config.MEMORY_LIMIT = 512 * 1024 * 1024
+        try:
+            self.assertFalse(classify_failure(1, log)[0])
+        finally:
+            core_config.MEMORY_LIMIT = None
+
+    def test_permanent(self):
+        """ Other exit codes are permanent failures """
+        self.assertEqual(
+            classify_failure(2, 'java.lang.ClassNotFoundException'),
+            (False, 'BugEx terminated unsuccessfully (status code 2)'))
+        self.assertTrue(classify_failure(0, '', result_missing=True)[0])
+
+
+class ResultFileFollowerTest(TestCase):
+    """
+    Tests for the ResultFileFollower, which parses result files while
+    BugEx is writing them
+    """
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, 'bugex-results.xml')
+        self.follower = ResultFileFollower(BugExResultFile(self.path))
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def append(self, content):
+        with open(self.path, 'a') as f:
+            f.write(content)
+
+    def test_poll(self):
+        """ Every fact is returned once, as soon as it is complete """
+        self.assertEqual(self.follower.poll(), [])
+        self.append('<?xml version="1.0"?>\n<facts><fact><className>A'
+                    '</className><lineNumber>1</lineNumber></fact><fact>'
+                    '<className>B')
+        self.assertEqual(self.follower.poll(),
+                         [{'className': 'A', 'lineNumber': '1'}])
+        self.assertEqual(self.follower.poll(), [])
+
+        self.append('</className></fact></facts>\n')
+        self.assertEqual(self.follower.poll(), [{'className': 'B'}])
+        self.assertFalse(self.follower.broken)
+
+    def test_broken(self):
+        """ Invalid or truncated files are not followed any further """
+        self.append('<facts><fact></facts>')
+        self.assertEqual(self.follower.poll(), [])
+        self.assertTrue(self.follower.broken)
+
+
+class BugExLogFileTest(TestCase):
+    """
+    Tests for the BugExLogFile, which reads parts of a growing log
+    """
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.log_file = BugExLogFile(os.path.join(self.folder, 'bugex.log'))
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def append(self, content):
+        with open(self.log_file.path, 'a') as f:
+            f.write(content)
+
+    def test_read_from(self):
+        """ Parts of the log are read from an offset, up to a maximum size """
+        self.assertEqual(self.log_file.read_from(0, 10), ('', 0))
+        self.append('0123456789abcdef')
+        self.assertEqual(self.log_file.read_from(4, 8), ('456789ab', 16))
+        self.assertEqual(self.log_file.read_from(16, 8), ('', 16))
+        # a replaced log is read from the start
+        self.assertEqual(self.log_file.read_from(20, 4), ('0123', 16))
+
+    def test_wait(self):
+        """ Reading waits for new bytes """
+        self.append('old')
+        appender = threading.Timer(0.2, self.append, ['new'])
+        appender.start()
+        self.assertEqual(self.log_file.read_from(3, 10, wait=5.0,
+                                                 interval=0.05),
+                         ('new', 6))
+        appender.join()
+
+        start = time.time()
+        self.assertEqual(self.log_file.read_from(6, 10, wait=0.2,
+                                                 interval=0.05), ('', 6))
+        self.assertGreaterEqual(time.time() - start, 0.2)
+
+    def test_compressed(self):
+        """ Compressed logs are read like plain ones """
+        with BoundedLogWriter(self.log_file.path, 100, 10,
+                              compress=True) as writer:
+            writer.write('0123456789abcdef')
+        self.assertFalse(os.path.exists(self.log_file.path))
+        self.assertTrue(self.log_file.exists())
+        self.assertEqual(self.log_file.size(), 16)
+        self.assertEqual(self.log_file.read_from(10, 4), ('abcd', 16))
+
+
+class BoundedLogWriterTest(TestCase):
+    """
+    Tests for the BoundedLogWriter, which keeps the head and the tail of
+    the output of BugEx
+    """
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, 'bugex.log')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_small(self):
+        """ Output below the maximum size is written completely """
+        with BoundedLogWriter(self.path, 20, 5) as writer:
+            writer.write('0123456789')
+            writer.write('abcdef')
+        self.assertEqual(open(self.path).read(), '0123456789abcdef')
+
+    def test_bounded(self):
+        """ Only the head and the tail of long output are kept """
+        writer = BoundedLogWriter(self.path, 10, 4)
+        writer.write('012345')
+        self.assertEqual(open(self.path).read(), '012345')
+        for chunk in ['abc', 'def', 'ghi', 'jk']:
+            writer.write(chunk)
+        writer.close()
+        self.assertEqual(writer.omitted, 7)
+        self.assertEqual(open(self.path).read(),
+                         '012345\n[... 7 bytes omitted ...]\nhijk')
@@ -12,14 +12,32 @@ Authors: Amir Baradaran
 """
 
 import os
+import resource
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from StringIO import StringIO
+from zipfile import ZipFile
 
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.core import mail
 from django.test import TestCase
 
-from bugex_webapp import UserRequestStatus
-from bugex_webapp.models import CodeArchive
+from bugex_webapp import BugExJobState, UserRequestStatus
+from bugex_webapp.core_modules import core_config
+from bugex_webapp.core_modules.bugex_monitor import BugExMonitor
+from bugex_webapp.core_modules.bugex_instance import BugExProcessInstance
+from bugex_webapp.core_modules.bugex_monitor import BugExMonitorJob
+from bugex_webapp.core_modules.bugex_predictor import RuntimePredictor
+from bugex_webapp.models import BugExJob, BugExResult, CodeArchive
+from bugex_webapp.models import TestCase as BugExTestCase
 from bugex_webapp.models import UserRequest
+from bugex_webapp.upload_handlers import StreamedArchiveFile
 
 
 class UserRequestTest(TestCase):
@@ -67,6 +85,127 @@ class UserRequestTest(TestCase):
         self.assertNotEqual(self.user_request.status, old_status)
         self.assertEqual(self.user_request.status, UserRequestStatus.PENDING)
 
+    def test_code_archive(self):
+        """ Requests for additional test cases use the shared code archive """
+        dependent_request = UserRequest.objects.get(pk=1)
+        dependent_request.archive_request = self.user_request
+        dependent_request.save()
+
+        self.assertEqual(dependent_request.code_archive,
+                         self.user_request.codearchive)
+        self.assertEqual(self.user_request.code_archive,
+                         self.user_request.codearchive)
+
+    def test_release_code_archive(self):
+        """ A shared code archive is kept until its last request is deleted """
+        dependent_request = UserRequest.objects.create(
+            user=self.user_request.user,
+            test_case=BugExTestCase.objects.create(
+                name='de.mypackage.TestMyClass#testOther'),
+            token='dependent', delete_token='dependent-delete',
+            status=UserRequestStatus.FINISHED,
+            archive_request=self.user_request)
+
+        self.user_request.release_code_archive()
+        self.user_request.update_status(UserRequestStatus.DELETED)
+        self.assertTrue(
+            CodeArchive.objects.filter(user_request=self.user_request).exists())
+
+        dependent_request.release_code_archive()
+        self.assertFalse(
+            CodeArchive.objects.filter(user_request=self.user_request).exists())
+
+
+    def test_new_notification(self):
+        """ Requests for additional test cases are notified at once """
+        media_root = settings.MEDIA_ROOT
+        settings.MEDIA_ROOT = tempfile.mkdtemp()
+        core_config.WORKER_MODE = 'STANDALONE'
+        archive_file = StreamedArchiveFile(
+            StringIO(), 'archive.jar', 'application/java-archive', 0, None,
+            '4e1b2c3d-5f6a-4b7c-8d9e-0a1b2c3d4e5f',
+            'user_2/4e1b2c3d-5f6a-4b7c-8d9e-0a1b2c3d4e5f/archive.jar',
+            'a' * 40, True)
+        mail.outbox = []
+        try:
+            user_request = UserRequest.new(
+                self.user_request.user, 'de.mypackage.TestMyClass#test1',
+                archive_file, ['de.mypackage.TestMyClass#test2',
+                               'de.mypackage.TestMyClass#test3'])
+        finally:
+            core_config.WORKER_MODE = 'EMBEDDED'
+            shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+            settings.MEDIA_ROOT = media_root
+
+        self.assertEqual(user_request.dependent_requests.count(), 2)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].body.count('/cancel/'), 3)
+        self.assertEqual(
+            [r.code_archive.name for r in user_request.dependent_requests.all()],
+            ['archive.jar', 'archive.jar'])
+
+    def test_cancel(self):
+        """ Cancelled requests keep their status, unless deleted """
+        self.user_request.update_status(UserRequestStatus.PROCESSING)
+        self.assertTrue(self.user_request.cancel())
+        self.assertFalse(self.user_request.cancel())
+
+        self.user_request.update_status(UserRequestStatus.FINISHED)
+        self.assertEqual(UserRequest.objects.get(pk=self.user_request.pk).status,
+                         UserRequestStatus.CANCELLED)
+        self.user_request.update_status(UserRequestStatus.DELETED)
+        self.assertEqual(UserRequest.objects.get(pk=self.user_request.pk).status,
+                         UserRequestStatus.DELETED)
+
+    def test_cancel_notification(self):
+        """ Users are notified of a cancellation only once """
+        self.user_request.update_status(UserRequestStatus.INVALID)
+        self.assertFalse(self.user_request.can_cancel)
+        self.assertFalse(self.user_request.cancel())
+
+        self.user_request.update_status(UserRequestStatus.PROCESSING)
+        self.assertTrue(self.user_request.can_cancel)
+        mail.outbox = []
+        self.assertTrue(self.user_request.cancel())
+        # the monitor cancels the job of the request, too
+        BugExMonitorJob(None, self.user_request).cancel(
+            UserRequestStatus.CANCELLED, 'Cancelled by the user.')
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_withdraw(self):
+        """ Jobs keep running for the other requests of a cancelled one """
+        other_request = UserRequest.objects.get(pk=1)
+        job = BugExMonitorJob(None, self.user_request)
+        self.assertTrue(job.subscribe(other_request))
+
+        self.assertTrue(job.withdraw(other_request))
+        self.assertEqual(job.user_requests, [self.user_request])
+        self.assertFalse(job.withdraw(other_request))
+
+    def test_withdraw_subscribed(self):
+        """ Jobs of cancelled requests hand their subscribers over """
+        other_request = UserRequest.objects.get(pk=1)
+        job = BugExMonitorJob(None, self.user_request)
+        self.assertTrue(job.subscribe(other_request))
+
+        # BugEx runs in the folder of the request, the job can not go on
+        self.assertIsNone(job.withdraw(self.user_request))
+        self.assertEqual(job.retire(), [other_request])
+        self.assertEqual(job.user_requests, [self.user_request])
+        self.assertFalse(job.subscribe(other_request))
+        self.assertIsNone(job.retire())
+
+
+    def test_cancel_not_started(self):
+        """ Jobs whose BugEx instance failed to start can be canceled """
+        instance = BugExProcessInstance(
+            'bugex.jar', __file__, 'de.MyTest#test', '/tmp/', 'token')
+        job = BugExMonitorJob(instance, self.user_request)
+        job._start_date = datetime.now()
+        job.cancel(UserRequestStatus.FAILED, 'Could not start BugEx.')
+        self.assertEqual(UserRequest.objects.get(pk=self.user_request.pk)
+                         .status, UserRequestStatus.FAILED)
+
 
 class CodeArchiveTest(TestCase):
     """
@@ -96,18 +235,376 @@ class CodeArchiveTest(TestCase):
                 'f99db44e-c841-444b-977b-ccc9baa11027',
                 'failing-program-0.0.2-SNAPSHOT-jar-with-dependencies.jar'))
 
-    def test_absolute_extracted_path(self):
+    def test_traverse(self):
         """
-        Test the 'absolute_extracted_path' property of CodeArchive,
-        which should return the absolute path of the root folder of
-        the archive contents. We are calling this folder
-        'tmp_extracted'.
+        Test the 'traverse' method of CodeArchive, which should create the
+        folders, source files and class files straight from the zip entries.
         """
+        buf = StringIO()
+        archive = ZipFile(buf, 'w')
+        archive.writestr('de/mypackage/MyClass.java',
+                         'package de.mypackage;\n\npublic class MyClass {}\n')
+        archive.writestr('de/mypackage/MyClass.class', '')
+        archive.writestr('META-INF/', '')
+        archive.close()
+
+        self.code_archive.folder_set.all().delete()
+        self.code_archive.traverse(ZipFile(buf, 'r'))
+
         self.assertEqual(
-            self.code_archive.absolute_extracted_path,
-            os.path.join(
-                settings.MEDIA_ROOT,
-                'user_2',
-                'f99db44e-c841-444b-977b-ccc9baa11027',
-                'failing-program-0.0.2-SNAPSHOT-jar-with-dependencies'))
+            sorted(f.name for f in self.code_archive.folder_set.all()),
+            ['META-INF', 'de',
+             'failing-program-0.0.2-SNAPSHOT-jar-with-dependencies',
+             'mypackage'])
+        source_file = self.code_archive.sourcefile_set.get()
+        self.assertEqual(source_file.package, 'de.mypackage')
+        self.assertEqual(source_file.folder.name, 'mypackage')
+        self.assertEqual(source_file.folder.parent_folder.name, 'de')
+        self.assertEqual(
+            source_file.content,
+            'package de.mypackage;\n\npublic class MyClass {}')
+        self.assertEqual(
+            self.code_archive.classfile_set.get().folder, source_file.folder)
+
+
+class BugExJobTest(TestCase):
+    """
+    Tests for the BugExJob model, which persists the state of a request
+    """
+    fixtures = ['test_data.json']
+
+    def setUp(self):
+        self.user_request = UserRequest.objects.get(
+            token='f99db44e-c841-444b-977b-ccc9baa11027')
+        self.user_request.update_status(UserRequestStatus.PROCESSING)
+        self.job = BugExJob.objects.create(user_request=self.user_request)
+
+    def test_mark_running(self):
+        """ Starting BugEx is recorded with process id and deadline """
+        BugExJob.mark_running(self.user_request, 4242, 60)
+        job = BugExJob.objects.get(pk=self.job.pk)
+        self.assertEqual(job.state, BugExJobState.RUNNING)
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual(job.pid, 4242)
+        self.assertTrue(0 < job.remaining_life_time <= 60)
+
+    def test_record_run(self):
+        """ Run time and resource usage of the BugEx process are recorded """
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        BugExJob.record_run(self.user_request, 12.5, usage)
+        job = BugExJob.objects.get(pk=self.job.pk)
+        self.assertEqual(job.run_time, 12.5)
+        self.assertAlmostEqual(job.cpu_time, usage.ru_utime + usage.ru_stime)
+        self.assertEqual(job.max_rss, usage.ru_maxrss)
+
+    def test_predict(self):
+        """ Without enough runs, the average run time is estimated """
+        BugExJob.record_run(self.user_request, 30.0)
+        self.user_request.update_status(UserRequestStatus.FINISHED)
+        predictor = RuntimePredictor.Instance()
+        predictor.reset()
+        self.assertEqual(predictor.predict(self.user_request.code_archive),
+                         30.0)
+        predictor.reset()
+
+    def test_predict_unlocked(self):
+        """ Run times are estimated without holding the lock of the monitor """
+        monitor = BugExMonitor.Instance()
+        predictor = RuntimePredictor.Instance()
+        locked = list()
+        def predict(code_archive):
+            lock = monitor._BugExMonitor__lock
+            locked.append(not lock.acquire(False))
+            if not locked[-1]:
+                lock.release()
+            raise ValueError('estimated')
+        archive_path = self.user_request.code_archive.path
+        os.makedirs(os.path.dirname(archive_path))
+        ZipFile(archive_path, 'w').close()
+        predictor.predict = predict
+        try:
+            self.assertRaises(ValueError, monitor.new_request,
+                              self.user_request)
+        finally:
+            del predictor.predict
+            shutil.rmtree(os.path.dirname(archive_path))
+        self.assertEqual(locked, [False])
+
+    def test_mark_queued(self):
+        """ Retried jobs are queued again, their attempts are kept """
+        BugExJob.mark_running(self.user_request, 4242, 60)
+        BugExJob.mark_queued(self.user_request)
+        job = BugExJob.objects.get(pk=self.job.pk)
+        self.assertEqual(job.state, BugExJobState.QUEUED)
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual(job.pid, None)
+
+    def test_heartbeat(self):
+        """ Jobs are stalled, if their process does not use CPU time """
+        BugExJob.mark_running(self.user_request, 4242, 60)
+        BugExJob.heartbeat(self.user_request, 4242, 1.5)
+        self.assertFalse(BugExJob.stalled(60, 60).exists())
+
+        an_hour_ago = datetime.now() - timedelta(hours=1)
+        BugExJob.objects.filter(pk=self.job.pk).update(
+            progress_at=an_hour_ago)
+        BugExJob.heartbeat(self.user_request, 4242, 1.5)
+        job = BugExJob.objects.get(pk=self.job.pk)
+        self.assertEqual(job.progress_at, an_hour_ago)
+        self.assertEqual(list(BugExJob.stalled(60, 60)), [self.job])
+        self.assertFalse(BugExJob.stalled(60, 7200).exists())
+
+        BugExJob.heartbeat(self.user_request, 4242, 2.5)
+        self.assertFalse(BugExJob.stalled(60, 60).exists())
+
+    def test_reap_stalled(self):
+        """ Jobs of dead processes are reaped """
+        BugExJob.mark_running(self.user_request, 4242, 60)
+        BugExJob.objects.filter(pk=self.job.pk).update(
+            attempts=3, host='elsewhere',
+            heartbeat_at=datetime.now() - timedelta(hours=1))
+        self.assertEqual(BugExMonitor.Instance().reap_stalled(), 1)
+
+        self.assertEqual(UserRequest.objects.get(pk=self.user_request.pk)
+                         .status, UserRequestStatus.FAILED)
+        self.assertEqual(BugExJob.objects.get(pk=self.job.pk).state,
+                         BugExJobState.DONE)
+        self.assertEqual(BugExMonitor.Instance().reap_stalled(), 0)
+
+    def test_resubmit_failed(self):
+        """ Retries fail the request, if their job can not be created """
+        code_archive = self.user_request.code_archive
+        code_archive.archive_file.name = 'user_2/released/archive.jar'
+        code_archive.save()
+        job = BugExMonitorJob(None, self.user_request)
+
+        BugExMonitor.Instance()._BugExMonitor__resubmit(job)
+        self.assertEqual(UserRequest.objects.get(pk=self.user_request.pk)
+                         .status, UserRequestStatus.FAILED)
+        self.assertEqual(BugExJob.objects.get(pk=self.job.pk).state,
+                         BugExJobState.DONE)
+
+    def test_housekeeping(self):
+        """ Timers only queue housekeeping, it is not queued twice """
+        calls = list()
+        event = threading.Event()
+        def housekeeping():
+            calls.append(time.time())
+            event.wait(5)
+        queue = BugExMonitor.Instance()._BugExMonitor__queue_housekeeping
+
+        queue(housekeeping)
+        while not calls:
+            time.sleep(0.01)
+        # queued while running, but only once
+        queue(housekeeping)
+        queue(housekeeping)
+        event.set()
+        time.sleep(0.2)
+        self.assertEqual(len(calls), 2)
+
+    def test_update_status(self):
+        """ Jobs are done as soon as their request has a final status """
+        self.user_request.update_status(UserRequestStatus.FINISHED)
+        self.assertEqual(BugExJob.objects.get(pk=self.job.pk).state,
+                         BugExJobState.DONE)
+
+    def test_claim(self):
+        """ A job can only be claimed once """
+        other = BugExJob.objects.get(pk=self.job.pk)
+        self.assertTrue(self.job.claim())
+        self.assertFalse(other.claim())
+
+    def test_claim_next(self):
+        """ Workers claim a job only once, unless its lease expires """
+        job = BugExJob.claim_next('worker-1', 60)
+        self.assertEqual(job, self.job)
+        self.assertEqual(job.worker, 'worker-1')
+        self.assertIsNone(BugExJob.claim_next('worker-2', 60))
+
+        BugExJob.objects.filter(pk=self.job.pk).update(
+            lease_expires=datetime.now() - timedelta(seconds=1))
+        self.assertEqual(BugExJob.claim_next('worker-2', 60), self.job)
+        self.assertEqual(BugExJob.renew_leases('worker-2', 60), 1)
+        self.assertEqual(BugExJob.renew_leases('worker-1', 60), 0)
+
+    def test_recover(self):
+        """ Requests are given up after the maximum number of attempts """
+        BugExJob.objects.filter(pk=self.job.pk).update(
+            state=BugExJobState.RUNNING, attempts=3, host='elsewhere')
+        BugExMonitor.Instance().recover()
+
+        self.assertEqual(UserRequest.objects.get(pk=self.user_request.pk)
+                         .status, UserRequestStatus.FAILED)
+        self.assertEqual(BugExJob.objects.get(pk=self.job.pk).state,
+                         BugExJobState.DONE)
+
+    def test_recover_owner(self):
+        """ Only requests of server processes that exited are recovered """
+        exited = subprocess.Popen(['true'])
+        exited.wait()
+        BugExJob.objects.filter(pk=self.job.pk).update(
+            state=BugExJobState.RUNNING, attempts=3, host='elsewhere',
+            owner='{0}:{1}'.format(socket.gethostname(), os.getppid()))
+        BugExMonitor.Instance().recover()
+        self.assertEqual(UserRequest.objects.get(pk=self.user_request.pk)
+                         .status, UserRequestStatus.PROCESSING)
+
+        BugExJob.objects.filter(pk=self.job.pk).update(
+            owner='{0}:{1}'.format(socket.gethostname(), exited.pid))
+        BugExMonitor.Instance().recover()
+        self.assertEqual(UserRequest.objects.get(pk=self.user_request.pk)
+                         .status, UserRequestStatus.FAILED)
+
+
+class BugExResultTest(TestCase):
+    """
+    Tests for methods of the BugExResult model
+    """
+    fixtures = ['test_data.json']
+
+    def setUp(self):
+        self.cached_request = UserRequest.objects.get(
+            token='f99db44e-c841-444b-977b-ccc9baa11027')
+        self.cached_request.codearchive.content_hash = 'a' * 40
+        self.cached_request.codearchive.save()
+        self.cached_request.result.bugex_version = 'b' * 40
+        self.cached_request.result.save()
+
+        self.user_request = UserRequest.objects.create(
+            user=self.cached_request.user,
+            test_case=BugExTestCase.objects.create(
+                name=self.cached_request.test_case.name),
+            token='0b6ec2a4-8cd7-4e4f-9b0e-32e4e2b6d6b1',
+            delete_token='a3d9b7b8-2c5a-4c39-8a8b-0f7e1b6b2a55',
+            status=UserRequestStatus.PROCESSING)
+        CodeArchive.objects.create(
+            user_request=self.user_request, archive_format='JAR',
+            archive_file='user_2/0b6ec2a4/archive.jar', content_hash='a' * 40)
+
+    def test_copy_cached(self):
+        """ A result for the same archive, test case and version is copied """
+        self.assertTrue(BugExResult.copy_cached(self.user_request, 'b' * 40))
+
+        result = UserRequest.objects.get(pk=self.user_request.pk).result
+        self.assertNotEqual(result, self.cached_request.result)
+        self.assertEqual(result.bugex_version, 'b' * 40)
+        self.assertEqual(
+            sorted(f.line_number for f in result.fact_set.all()),
+            sorted(f.line_number
+                   for f in self.cached_request.result.fact_set.all()))
+
+    def test_copy_cancelled(self):
+        """ Results are not attached to requests cancelled meanwhile """
+        self.assertTrue(self.user_request.cancel())
+        self.user_request.status = UserRequestStatus.PROCESSING
+        results = BugExResult.objects.count()
+
+        self.assertIsNone(self.cached_request.result.copy(self.user_request))
+        self.assertIsNone(BugExResult.start_partial(self.user_request))
+        request = UserRequest.objects.get(pk=self.user_request.pk)
+        self.assertEqual(request.status, UserRequestStatus.CANCELLED)
+        self.assertIsNone(request.result)
+        self.assertEqual(BugExResult.objects.count(), results)
+
+    def test_copy_deleted(self):
+        """ Results deleted while they are copied are not attached """
+        result = self.cached_request.result
+        results = BugExResult.objects.count()
+        BugExResult.objects.filter(pk=result.pk).delete()
+
+        self.assertRaises(BugExResult.DoesNotExist,
+                          result.copy, self.user_request)
+        self.assertIsNone(UserRequest.objects.get(
+            pk=self.user_request.pk).result)
+        self.assertEqual(BugExResult.objects.count(), results - 1)
+
+    def test_copy_cached_miss(self):
+        """ Other BugEx versions or test cases do not match """
+        self.assertFalse(BugExResult.copy_cached(self.user_request, 'c' * 40))
+
+        self.user_request.test_case.name = 'de.mypackage.TestMyClass#testX'
+        self.user_request.test_case.save()
+        self.assertFalse(BugExResult.copy_cached(self.user_request, 'b' * 40))
+        self.assertIsNone(self.user_request.result)
+
+    def test_partial_subscribers(self):
+        """ Subscribers get partial results, which are discarded on failure """
+        class Follower(object):
+            def poll(self):
+                return [{'className': 'MyClass', 'methodName': 'myMethod',
+                         'lineNumber': '42', 'explanation': 'x',
+                         'factType': 'TYPE_A'}]
+
+        class Instance(object):
+            version = 'c' * 40
+
+        job = BugExMonitorJob(Instance(), self.user_request)
+        job._follower = Follower()
+        job._collect_partial()
+        self.assertTrue(job.subscribe(self.cached_request))
+        job._collect_partial()
+        for request in job.user_requests:
+            result = UserRequest.objects.get(pk=request.pk).result
+            self.assertFalse(result.complete)
+            self.assertEqual(result.fact_set.count(), 2)
+
+        job.cancel(UserRequestStatus.FAILED, 'BugEx failed.')
+        for request in (self.user_request, self.cached_request):
+            self.assertIsNone(UserRequest.objects.get(pk=request.pk).result)
+
+    def test_partial(self):
+        """ Partial results are replaced by the complete result """
+        fact = {'className': 'MyClass', 'methodName': 'myMethod',
+                'lineNumber': ' 42 ', 'explanation': 'x', 'factType': 'TYPE_A'}
+        partial = BugExResult.start_partial(self.user_request)
+        self.assertEqual(partial.add_facts([fact, {'className': 'Other'}]), 1)
+        self.assertFalse(
+            UserRequest.objects.get(pk=self.user_request.pk).result.complete)
+
+        BugExResult.new(StringIO(
+            '<facts><fact><className>MyClass</className>'
+            '<methodName>myMethod</methodName><lineNumber>42</lineNumber>'
+            '<explanation>x</explanation><factType>TYPE_B</factType>'
+            '</fact></facts>'), self.user_request)
+        result = UserRequest.objects.get(pk=self.user_request.pk).result
+        self.assertTrue(result.complete)
+        self.assertEqual([f.fact_type for f in result.fact_set.all()], ['B'])
+        self.assertFalse(BugExResult.objects.filter(pk=partial.pk).exists())
+
+    def test_new(self):
+        """ Facts are parsed incrementally and inserted in batches """
+        fact = ('<fact><className>MyClass</className>'
+                '<methodName>myMethod</methodName>'
+                '<lineNumber>{0}</lineNumber><explanation>x</explanation>'
+                '<factType>TYPE_A</factType></fact>')
+        xml = '<bugex><facts>{0}</facts></bugex>'.format(
+            ''.join(fact.format(n) for n in range(1, 2501)))
+
+        facts = list(BugExResult._parse_xml(StringIO(xml)))
+        self.assertEqual(facts[-1][0], 2500)
+        self.assertEqual(facts[-1][1]['lineNumber'], '2500')
+
+        BugExResult.new(StringIO(xml), self.user_request, 'c' * 40)
+        result = UserRequest.objects.get(pk=self.user_request.pk).result
+        self.assertEqual(result.bugex_version, 'c' * 40)
+        self.assertEqual(result.fact_set.count(), 2500)
+        self.assertEqual(
+            sorted(result.fact_set.values_list('line_number', flat=True)),
+            range(1, 2501))
+
+    def test_new_malformed(self):
+        """ Malformed facts are reported with their number """
+        fact = ('<fact><className>MyClass</className>'
+                '<methodName>myMethod</methodName>'
+                '<lineNumber>{0}</lineNumber><explanation>x</explanation>'
+                '<factType>TYPE_A</factType></fact>')
+        xml = '<facts>{0}{1}</facts>'.format(fact.format(1), fact.format('x'))
+        with self.assertRaisesRegexp(ValueError, 'Fact 2 is malformed'):
+            BugExResult.new(StringIO(xml), self.user_request)
 
+        # invalid xml
+        with self.assertRaisesRegexp(Exception, 'line 1'):
+            BugExResult.new(StringIO('<facts><fact>'), self.user_request)
+        self.assertIsNone(
+            UserRequest.objects.get(pk=self.user_request.pk).result)
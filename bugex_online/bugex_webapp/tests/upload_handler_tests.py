@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+"""
+Project: BugEx Online
+Authors: Amir Baradaran
+         Tim Krones
+         Frederik Leonhardt
+         Christos Monogios
+         Akmal Qodirov
+         Iliana Simova
+         Peter Stahl
+"""
+
+import os
+import shutil
+import tempfile
+from StringIO import StringIO
+from zipfile import ZipFile
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadhandler import StopFutureHandlers
+from django.test import TestCase
+from django.test.client import RequestFactory
+
+from bugex_webapp.upload_handlers import CodeArchiveUploadHandler
+from bugex_webapp.upload_handlers import EOCD_SEARCH_SIZE
+from bugex_webapp.upload_handlers import has_end_of_central_directory
+
+
+class EndOfCentralDirectoryTest(TestCase):
+    """Tests for the zip check of the CodeArchiveUploadHandler"""
+
+    def setUp(self):
+        buf = StringIO()
+        archive = ZipFile(buf, 'w')
+        archive.writestr('de/mypackage/MyClass.java', 'package de.mypackage;')
+        archive.close()
+        self.archive = buf.getvalue()
+
+    def _check(self, content):
+        return has_end_of_central_directory(
+            content[-EOCD_SEARCH_SIZE:], len(content))
+
+    def test_valid_archive(self):
+        """ A zip archive is recognized as such """
+        self.assertTrue(self._check(self.archive))
+
+    def test_large_archive(self):
+        """ Only the tail of a large archive needs to be inspected """
+        buf = StringIO()
+        archive = ZipFile(buf, 'w')
+        archive.writestr('data.bin', 'x' * (2 * EOCD_SEARCH_SIZE))
+        archive.close()
+        self.assertTrue(self._check(buf.getvalue()))
+
+    def test_invalid_archive(self):
+        """ Anything else is not """
+        self.assertFalse(self._check('public class MyClass {}'))
+        self.assertFalse(self._check(self.archive[:-1]))
+        self.assertFalse(self._check(''))
+
+
+class CodeArchiveUploadHandlerTest(TestCase):
+    """Tests for the cleanup of archives streamed by the upload handler"""
+
+    def setUp(self):
+        self.media_root = settings.MEDIA_ROOT
+        settings.MEDIA_ROOT = tempfile.mkdtemp()
+
+        request = RequestFactory().post('/')
+        request.user = User(id=1, username='uploader')
+        self.handler = CodeArchiveUploadHandler(request)
+        self.assertRaises(StopFutureHandlers, self.handler.new_file,
+            'code_archive', 'archive.zip', 'application/zip', None)
+        self.folder = os.path.dirname(self.handler.file.name)
+
+    def tearDown(self):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        settings.MEDIA_ROOT = self.media_root
+
+    def test_valid_archive(self):
+        """ A valid archive is kept """
+        buf = StringIO()
+        archive = ZipFile(buf, 'w')
+        archive.writestr('de/mypackage/MyClass.java', 'package de.mypackage;')
+        archive.close()
+
+        self.handler.receive_data_chunk(buf.getvalue(), 0)
+        archive_file = self.handler.file_complete(len(buf.getvalue()))
+        self.handler.upload_complete()
+
+        self.assertTrue(archive_file.is_valid_archive)
+        self.assertTrue(os.path.exists(archive_file.path))
+        archive_file.discard()
+        self.assertFalse(os.path.exists(self.folder))
+
+    def test_invalid_archive(self):
+        """ An invalid archive is removed right away """
+        content = 'public class MyClass {}'
+        self.handler.receive_data_chunk(content, 0)
+        archive_file = self.handler.file_complete(len(content))
+
+        self.assertFalse(archive_file.is_valid_archive)
+        self.assertFalse(os.path.exists(self.folder))
+        self.assertEqual(archive_file.read(), content)
+        archive_file.discard()
+
+    def test_interrupted(self):
+        """ A partially written archive is removed """
+        self.handler.receive_data_chunk('PK\x03\x04', 0)
+        self.handler.upload_complete()
+
+        self.assertFalse(os.path.exists(self.folder))
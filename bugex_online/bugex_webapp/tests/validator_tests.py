@@ -18,6 +18,7 @@ from bugex_webapp.models import CodeArchive
 from bugex_webapp.validators import validate_source_file_extension
 from bugex_webapp.validators import validate_class_file_extension
 from bugex_webapp.validators import validate_archive_file_extension
+from bugex_webapp.validators import validate_archive_integrity
 from bugex_webapp.validators import validate_archive_copyright
 from bugex_webapp.validators import validate_test_case_name
 
@@ -87,6 +88,17 @@ class ValidatorTestCase(TestCase):
                 validate_archive_file_extension(code_archive.archive_file)
             )
 
+    def test_archive_integrity(self):
+        """Verify that the code archive integrity validator works correctly."""
+        for code_archive in CodeArchive.objects.all():
+            self.assertIsNone(
+                validate_archive_integrity(code_archive.archive_file)
+            )
+
+        code_archive.archive_file.is_valid_archive = False
+        self.assertRaises(ValidationError, validate_archive_integrity,
+                          code_archive.archive_file)
+
     def test_archive_copyright(self):
         """Verify that the archive copyright validator works correctly."""
         self.assertIsNone(validate_archive_copyright(True))
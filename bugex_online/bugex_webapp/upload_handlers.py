@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+
+"""
+Project: BugEx Online
+Authors: Amir Baradaran
+         Tim Krones
+         Frederik Leonhardt
+         Christos Monogios
+         Akmal Qodirov
+         Iliana Simova
+         Peter Stahl
+
+This module contains the upload handler for code archives. It is registered
+in FILE_UPLOAD_HANDLERS (see settings.py). For more information about upload
+handlers, see:
+
+https://docs.djangoproject.com/en/1.4/topics/http/file-uploads/
+
+"""
+
+import hashlib
+import os
+import shutil
+import struct
+import uuid
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from django.core.files.uploadhandler import StopFutureHandlers
+
+from bugex_webapp.models import request_relative_folder
+
+
+# the zip "end of central directory" record: signature and fixed size
+EOCD_SIGNATURE = 'PK\x05\x06'
+EOCD_SIZE = 22
+EOCD_FORMAT = '<4s4H2LH'
+# the record may be followed by a comment of up to 64k
+EOCD_SEARCH_SIZE = EOCD_SIZE + 0xFFFF
+# central directory offset of zip64 archives (stored in a separate record)
+ZIP64_OFFSET = 0xFFFFFFFF
+
+
+class StreamedArchiveFile(UploadedFile):
+    """
+    A code archive that has been streamed to its final location in MEDIA_ROOT
+    by the CodeArchiveUploadHandler.
+
+    Besides the usual UploadedFile attributes, it knows the token reserved for
+    the user request, its path relative to MEDIA_ROOT, its content hash and
+    whether it looks like a valid zip archive.
+    """
+
+    def __init__(self, file, name, content_type, size, charset, token,
+                 relative_path, content_hash, is_valid_archive):
+        super(StreamedArchiveFile, self).__init__(
+            file, name, content_type, size, charset)
+        self.token = token
+        self.relative_path = relative_path
+        self.content_hash = content_hash
+        self.is_valid_archive = is_valid_archive
+
+    @property
+    def path(self):
+        """Returns the absolute path of the archive."""
+        return os.path.join(settings.MEDIA_ROOT, self.relative_path)
+
+    def discard(self):
+        """
+        Removes the archive and its request folder again, e.g. if the form
+        it was submitted with turned out to be invalid.
+        """
+        self.close()
+        _remove_folder(self.path)
+
+
+class CodeArchiveUploadHandler(FileUploadHandler):
+    """
+    Streams the `code_archive` field of the UserRequestForm in a single pass.
+
+    The archive is written directly to the location it would have been saved
+    to by CodeArchive.archive_file, its SHA-1 hash is computed on the fly and
+    the zip end of central directory record is checked as soon as the last
+    chunk has arrived. All other files are passed on to the next handler.
+    """
+    FIELD_NAME = 'code_archive'
+
+    def __init__(self, request=None):
+        super(CodeArchiveUploadHandler, self).__init__(request)
+        self.activated = False
+
+    def new_file(self, field_name, file_name, content_type, content_length,
+                 charset=None):
+        super(CodeArchiveUploadHandler, self).new_file(
+            field_name, file_name, content_type, content_length, charset)
+
+        # we need the user to know where the archive will end up
+        user = getattr(self.request, 'user', None)
+        self.activated = (field_name == self.FIELD_NAME and
+                          user is not None and user.is_authenticated())
+        if not self.activated:
+            return
+
+        # reserve the token of the user request to be created
+        self.token = str(uuid.uuid4())
+        file_name = default_storage.get_valid_name(
+            os.path.basename(file_name))
+        self.relative_path = os.path.join(
+            request_relative_folder(user, self.token), file_name)
+
+        path = os.path.join(settings.MEDIA_ROOT, self.relative_path)
+        os.makedirs(os.path.dirname(path))
+        self.file = open(path, 'wb')
+        self.hash = hashlib.sha1()
+        self.tail = ''
+
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.activated:
+            return raw_data
+
+        self.file.write(raw_data)
+        self.hash.update(raw_data)
+        self.tail = (self.tail + raw_data)[-EOCD_SEARCH_SIZE:]
+
+    def file_complete(self, file_size):
+        if not self.activated:
+            return None
+
+        self.activated = False
+        self.file.close()
+        is_valid_archive = has_end_of_central_directory(self.tail, file_size)
+
+        archive = open(self.file.name, 'rb')
+        if not is_valid_archive:
+            # the request will be rejected, so do not leave the archive on
+            # disk (the open file can still be read until it is closed)
+            _remove_folder(self.file.name)
+
+        return StreamedArchiveFile(
+            file=archive,
+            name=os.path.basename(self.relative_path),
+            content_type=self.content_type,
+            size=file_size,
+            charset=self.charset,
+            token=self.token,
+            relative_path=self.relative_path,
+            content_hash=self.hash.hexdigest(),
+            is_valid_archive=is_valid_archive)
+
+    def upload_interrupted(self):
+        """
+        Removes the partially written archive and its request folder if the
+        upload has been aborted before the archive was complete.
+        """
+        if not self.activated:
+            return
+
+        self.activated = False
+        self.file.close()
+        _remove_folder(self.file.name)
+
+    def upload_complete(self):
+        # Django 1.4 has no upload_interrupted() signal, but still completes
+        # the upload if it has been stopped in the middle of the archive
+        self.upload_interrupted()
+
+
+def _remove_folder(path):
+    """Removes the request folder containing the given archive path."""
+    shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+
+
+def has_end_of_central_directory(tail, file_size):
+    """
+    Checks whether the last bytes of a file contain a plausible zip end of
+    central directory record.
+
+    Arguments:
+    tail      -- the last (up to EOCD_SEARCH_SIZE) bytes of the file
+    file_size -- the total size of the file in bytes
+
+    """
+    position = tail.rfind(EOCD_SIGNATURE)
+    while position >= 0:
+        record = tail[position:position + EOCD_SIZE]
+        if len(record) == EOCD_SIZE:
+            (_, _, _, _, _, cd_size, cd_offset,
+                comment_length) = struct.unpack(EOCD_FORMAT, record)
+            record_offset = file_size - len(tail) + position
+            # the record has to end the file (apart from its comment) and
+            # the central directory has to precede it
+            if (position + EOCD_SIZE + comment_length <= len(tail) and
+                    (cd_offset == ZIP64_OFFSET or
+                     cd_offset + cd_size <= record_offset)):
+                return True
+        position = tail.rfind(EOCD_SIGNATURE, 0, position)
+    return False
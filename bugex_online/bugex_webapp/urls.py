@@ -17,6 +17,7 @@ from django.views.generic import TemplateView
 from bugex_webapp.views import provide_user_content, process_main_page_forms
 from bugex_webapp.views import submit_contact_form, log_user_out, show_bugex_result
 from bugex_webapp.views import delete_bugex_result, get_source_file_content
+from bugex_webapp.views import cancel_user_request, tail_bugex_log
 
 urlpatterns = patterns('',
     url(r'^$', process_main_page_forms, name='main-page'),
@@ -30,6 +31,10 @@ urlpatterns = patterns('',
         name='results-page'),
     url(r'^delete/(?P<delete_token>[a-z0-9\-]{36})$', delete_bugex_result,
         name='delete-page'),
+    url(r'^cancel/(?P<delete_token>[a-z0-9\-]{36})$', cancel_user_request,
+        name='cancel-page'),
+    url(r'^log/(?P<token>[a-z0-9\-]{36})$', tail_bugex_log,
+        name='log-page'),
 
     url(r'^account/$', provide_user_content, name='user-page'),
     url(r'^account/logout/$', log_user_out, name='logout'),
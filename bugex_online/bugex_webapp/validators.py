@@ -75,6 +75,24 @@ def validate_archive_file_extension(archive_file):
             u'{0} is not a valid archive format'.format(archive_file.name)
         )
 
+def validate_archive_integrity(archive_file):
+    """Validate the code_archive field of the UserRequestForm form.
+
+    Archives streamed to disk by the CodeArchiveUploadHandler have already
+    been checked for a zip end of central directory record. If this check
+    failed, a ValidationError is raised and the request is rejected before
+    anything is saved to the database. Files uploaded through other upload
+    handlers are left to the archive parsing later on.
+
+    Arguments:
+    archive_file -- value of UserRequestForm form's `code_archive` field
+
+    """
+    if not getattr(archive_file, 'is_valid_archive', True):
+        raise ValidationError(
+            u'{0} is not a valid ZIP or JAR archive'.format(archive_file.name)
+        )
+
 def validate_archive_copyright(has_copyright):
     """Validate the has_copyright field of the UserRequestForm form.
 
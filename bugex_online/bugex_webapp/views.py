@@ -11,13 +11,12 @@ Authors: Amir Baradaran
          Peter Stahl
 """
 
-import shutil
 import logging
 
 from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
 from django.core.mail import send_mail
-from django.http import HttpResponse, HttpResponseRedirect
+from django.http import Http404, HttpResponse, HttpResponseRedirect
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate, login, logout
@@ -28,6 +27,8 @@ from bugex_webapp import UserRequestStatus, Notifications
 from bugex_webapp.models import UserRequest, Fact
 from bugex_webapp.forms import UserRequestForm, ChangeEmailForm, ContactForm
 from bugex_webapp.forms import RegistrationForm, EmailBaseForm
+from bugex_webapp.forms import AdditionalTestCaseFormSet
+from bugex_webapp.core_modules import core_config
 from bugex_webapp.core_modules.password_generator import get_pronounceable_pass
 
 
@@ -51,6 +52,8 @@ def process_main_page_forms(request):
             'auth_form': AuthenticationForm(),
             'registration_form': RegistrationForm(),
             'user_req_form': UserRequestForm(),
+            'additional_test_case_formset': AdditionalTestCaseFormSet(
+                prefix='additional'),
             'password_recovery_form': EmailBaseForm()
         }
 
@@ -172,21 +175,34 @@ def _register_user(request):
 def _submit_user_request(request):
     """Submit a user request."""
     user_req_form = UserRequestForm(request.POST, request.FILES)
+    additional_test_case_formset = AdditionalTestCaseFormSet(
+        request.POST, prefix='additional')
 
-    if user_req_form.is_valid():
+    if user_req_form.is_valid() and additional_test_case_formset.is_valid():
 
         UserRequest.new(
             user=request.user,
             test_case_name=user_req_form.cleaned_data['test_case'],
-            archive_file=request.FILES['code_archive']
+            archive_file=request.FILES['code_archive'],
+            additional_test_case_names=additional_test_case_formset.names(
+                user_req_form.cleaned_data['test_case'])
         )
 
         message= 'Upload successful! We have received your code.'
 
     else:
+        # do not keep archives that have already been streamed to disk
+        archive_file = request.FILES.get('code_archive')
+        if hasattr(archive_file, 'discard'):
+            archive_file.discard()
+
         message = 'Unfortunately, your request could not be processed.'
 
-    template_context = {'user_req_form': user_req_form, 'message': message}
+    template_context = {
+        'user_req_form': user_req_form,
+        'additional_test_case_formset': additional_test_case_formset,
+        'message': message
+    }
 
     return template_context
 
@@ -313,6 +329,8 @@ def _log_user_in(request):
 
     template_context = {
         'user_req_form': UserRequestForm(),
+        'additional_test_case_formset': AdditionalTestCaseFormSet(
+            prefix='additional'),
         'auth_form': AuthenticationForm(),
         'registration_form': RegistrationForm(),
         'password_recovery_form': EmailBaseForm(),
@@ -370,7 +388,12 @@ def show_bugex_result(request, token):
     # now we have to check the current status to properly inform the user
     ur_status = user_request.status
 
-    if ur_status == UserRequestStatus.FINISHED:
+    # facts found so far, while BugEx is still running
+    in_progress = (ur_status == UserRequestStatus.PROCESSING and
+                   user_request.result is not None and
+                   not user_request.result.complete)
+
+    if ur_status == UserRequestStatus.FINISHED or in_progress:
         # prepare context and render response
 
         # Dictionary of facts
@@ -388,7 +411,8 @@ def show_bugex_result(request, token):
 
         template_context = {
             'fact_dict': fact_dict,
-            'token': token
+            'token': token,
+            'in_progress': in_progress
         }
         return render(request, 'bugex_webapp/results.html', template_context)
 
@@ -399,6 +423,8 @@ def show_bugex_result(request, token):
     elif ur_status == UserRequestStatus.DELETED:
         # already deleted, sorry.
         message = "This BugEx result has already been deleted."
+    elif ur_status == UserRequestStatus.CANCELLED:
+        message = "This request has been cancelled."
     elif ur_status == UserRequestStatus.INVALID:
         # not our fault - the user messed it up!
         message = "The archive you provided was invalid.\
@@ -426,18 +452,18 @@ def delete_bugex_result(request, delete_token):
         message = 'This BugEx result has already been deleted.'
     else:
         try:
-            # Deleting underlying archive file
-            user_request.codearchive.archive_file.delete()
-            # Deleting BugExResult, CodeArchive, all Facts, all SourceFiles,
-            # all ClassFiles, all Folders, all Lines
+            # Stop BugEx, if it is still running for this request
+            user_request.cancel(notify=False)
+            # Deleting BugExResult and all Facts
             if user_request.result:
                 # only try to delete result, if there actually is one
                 user_request.result.delete()
                 user_request.result = None # manually set relation to null
                 user_request.save()
-            user_request.codearchive.delete()
-            # Delete the entire directory where the archive file was stored
-            shutil.rmtree(user_request.folder)
+            # Deleting the request directory and, unless other requests
+            # still use it, the archive file, CodeArchive, all SourceFiles,
+            # all ClassFiles, all Folders, all Lines
+            user_request.release_code_archive()
             # Set user request status to DELETED
             user_request.update_status(UserRequestStatus.DELETED)
 
@@ -454,6 +480,76 @@ def delete_bugex_result(request, delete_token):
             'pagetitle': 'Delete result'})
 
 
+@login_required(login_url='/')
+def cancel_user_request(request, delete_token):
+    """Cancel a user request that has not been processed completely."""
+
+    # get user request
+    user_request = get_object_or_404(UserRequest, delete_token=delete_token)
+
+    if user_request.status == UserRequestStatus.CANCELLED:
+        message = 'This request has already been cancelled.'
+    elif user_request.cancel():
+        message = 'Your request has been cancelled successfully.'
+    else:
+        message = 'This request can not be cancelled anymore, ' \
+                  'it has been processed already.'
+
+    # render status page with appropriate content
+    return render(request, 'bugex_webapp/status.html',
+            {'message': message,
+            'pagetitle': 'Cancel request'})
+
+
+@login_required(login_url='/')
+def tail_bugex_log(request, token):
+    """
+    Returns a part of the BugEx log of a user request as plain text, so it
+    can be followed while BugEx is running. Only the owner of the request
+    and staff members may read it.
+
+    The query parameter `offset` is the byte offset to start at; without
+    it, the end of the log is returned. If there are no new bytes yet, the
+    response is delayed for up to `wait` seconds (long polling). At most
+    core_config.LOG_TAIL_MAX_SIZE bytes are returned. The X-Log-Offset
+    header contains the offset to continue at, X-Log-Size the current size
+    of the log.
+
+    Arguments:
+    token -- see UserRequest token
+    """
+    user_request = get_object_or_404(UserRequest, token=token)
+    if user_request.user != request.user and not request.user.is_staff:
+        raise Http404
+
+    max_size = core_config.LOG_TAIL_MAX_SIZE
+    log_file = user_request.log_file
+    try:
+        offset = max(int(request.GET['offset']), 0)
+    except (KeyError, ValueError):
+        offset = max(log_file.size() - max_size, 0)
+    try:
+        wait = min(max(float(request.GET.get('wait', 0)), 0),
+                   core_config.LOG_TAIL_MAX_WAIT)
+    except ValueError:
+        wait = 0
+
+    # the log does not grow anymore
+    if user_request.status in UserRequest.FINAL_STATUSES:
+        wait = 0
+
+    data, size = log_file.read_from(offset, max_size, wait,
+                                    core_config.LOG_TAIL_POLL_INTERVAL)
+    if size < offset:
+        # the log has been replaced, it is read from the start
+        offset = 0
+
+    response = HttpResponse(data, content_type="text/plain")
+    response['X-Log-Offset'] = str(offset + len(data))
+    response['X-Log-Size'] = str(size)
+    return response
+
+
 def get_source_file_content(request, token, class_name):
     """
     Returns the content of a java source code file, identified by the unique
@@ -472,7 +568,7 @@ def get_source_file_content(request, token, class_name):
     ur = get_object_or_404(UserRequest, token=token)
 
     try:
-        source_file = ur.codearchive.sourcefile_set.get(package=package_name, name=class_name)
+        source_file = ur.code_archive.sourcefile_set.get(package=package_name, name=class_name)
     except ObjectDoesNotExist:
         #raise Http404
         # no source available
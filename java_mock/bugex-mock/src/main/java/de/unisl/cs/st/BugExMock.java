@@ -51,40 +51,60 @@ public class BugExMock {
 			return;
 		}
 
+		String outputPath = args.length > 2 ? args[2] : null;
+
+		// check for artificial delay
+		long delayInSeconds = 0l;
+
+		if (args.length > 3 && args[3] != null) {
+			delayInSeconds = Long.parseLong(args[3]);
+		}
+
+		System.exit(run(args[0], args[1], outputPath, delayInSeconds));
+	}
+
+	/**
+	 * Analyses a failing test case and exports the facts to the output path.
+	 * Used by main() and by the BugExServer, which analyses several test cases
+	 * in the same JVM.
+	 * 
+	 * @param archivePath path of jar archive with failing test case
+	 * @param failingTest failing test case
+	 * @param outputPath path of output file (may be null)
+	 * @param delayInSeconds artificial delay in seconds (for testing/simulating purpose)
+	 * @return the exit code (0 on success)
+	 */
+	public static int run(String archivePath, String failingTest, String outputPath, long delayInSeconds) {
 		// check input archive
-		if (args[0] != null) {
+		if (archivePath != null) {
 			// input archive path is specified
-			if (!isSupported(args[0])) {
-				System.out.println("Input archive path is not valid: '"+args[0]+"' (Archive not supported!)");
-				System.exit(-1);
-				return;
+			if (!isSupported(archivePath)) {
+				System.out.println("Input archive path is not valid: '"+archivePath+"' (Archive not supported!)");
+				return -1;
 			}
 		}
 		
 		// check output path
-		String outputPath = "";
+		String oPath = "";
 			
-		if (args.length > 2 && args[2] != null) {
+		if (outputPath != null) {
 			// output path is specified
-			if (!args[2].endsWith("/")) {
-				System.out.println("Oops, you forgot the trailing slash after: '"+args[2]);
+			if (!outputPath.endsWith("/")) {
+				System.out.println("Oops, you forgot the trailing slash after: '"+outputPath);
 				System.out.println("Since I am a very kind program, I will add it for you :]");
-				outputPath = args[2]+"/";
+				oPath = outputPath+"/";
 			} else {
-				outputPath = args[2];
+				oPath = outputPath;
 			}
 		}
 		
 		// check for artificial delay
 		long delayInMillis = 0l;
 		
-		if (args.length > 3 && args[3] != null) {
-			long delayInSeconds = Long.parseLong(args[3]);
-			if (delayInSeconds > 0)
-				delayInMillis = delayInSeconds*1000;
-		}
+		if (delayInSeconds > 0)
+			delayInMillis = delayInSeconds*1000;
 
-		List<Fact> facts = new BugExMock(args[0],args[1]).explainFailure();
+		List<Fact> facts = new BugExMock(archivePath,failingTest).explainFailure();
 		
 		if (delayInMillis > 0) {
 			System.out.println("Delaying process for "+delayInMillis/1000+" seconds..");
@@ -98,8 +118,8 @@ public class BugExMock {
 			System.out.println("Waking up..");
 		}
 		
-		exportToXml(facts, outputPath);
-		System.exit(0);
+		exportToXml(facts, oPath);
+		return 0;
 	}
 	
 	/**
@@ -0,0 +1,55 @@
+package de.unisl.cs.st;
+
+import java.io.BufferedReader;
+import java.io.IOException;
+import java.io.InputStreamReader;
+
+/**
+ * Runs BugEx for several requests in the same (warm) JVM.
+ * 
+ * The server reads one command per line from stdin, the fields of a command
+ * are separated by tabs:
+ * 
+ * PING                                          answered with PONG
+ * RUN archive failingTest outputPath delay      answered with DONE exitCode
+ * QUIT                                          stops the server
+ * 
+ * Answers are written to stdout, prefixed with RESPONSE_PREFIX, all other
+ * output on stdout belongs to the current request. The server answers READY
+ * as soon as it has been started.
+ */
+public class BugExServer {
+
+	public static final String RESPONSE_PREFIX = "BUGEX-SERVER ";
+
+	public static void main(String[] args) throws IOException {
+		BufferedReader in = new BufferedReader(new InputStreamReader(System.in, "UTF-8"));
+		respond("READY");
+
+		String line;
+		while ((line = in.readLine()) != null) {
+			String[] command = line.split("\t", -1);
+			if ("PING".equals(command[0])) {
+				respond("PONG");
+			} else if ("RUN".equals(command[0]) && command.length == 5) {
+				int status;
+				try {
+					status = BugExMock.run(command[1], command[2], command[3], Long.parseLong(command[4]));
+				} catch (Throwable t) {
+					t.printStackTrace(System.out);
+					status = 1;
+				}
+				respond("DONE " + status);
+			} else if ("QUIT".equals(command[0])) {
+				break;
+			} else {
+				respond("ERROR unknown command: " + command[0]);
+			}
+		}
+	}
+
+	private static void respond(String message) {
+		System.out.println(RESPONSE_PREFIX + message);
+		System.out.flush();
+	}
+}